@@ -0,0 +1,118 @@
+﻿"""
+Бенчмарк KnowledgeBase: задержка одной операции до и после пула соединений.
+
+"До" - соединение aiosqlite открывается и закрывается на каждый вызов
+(как было раньше), "после" - долгоживущие соединения KnowledgeBase.
+
+Запуск:
+    python benchmarks/bench_knowledge_base.py --iterations 500
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import aiosqlite
+
+from knowledge_base import KnowledgeBase
+
+
+async def legacy_save_round(db_path, session_id, round_number, data):
+    async with aiosqlite.connect(db_path) as db:
+        await db.execute(
+            "INSERT INTO research_rounds (session_id, round_number, data, created_at) VALUES (?, ?, ?, ?)",
+            (session_id, round_number, json.dumps(data, ensure_ascii=False), datetime.now().isoformat())
+        )
+        await db.commit()
+
+
+async def legacy_session_exists(db_path, session_id):
+    async with aiosqlite.connect(db_path) as db:
+        cursor = await db.execute("SELECT 1 FROM research_sessions WHERE id = ?", (session_id,))
+        return await cursor.fetchone() is not None
+
+
+async def legacy_get_session_history(db_path, session_id):
+    async with aiosqlite.connect(db_path) as db:
+        db.row_factory = aiosqlite.Row
+        cursor = await db.execute("SELECT * FROM research_sessions WHERE id = ?", (session_id,))
+        session = await cursor.fetchone()
+        cursor = await db.execute(
+            "SELECT * FROM research_rounds WHERE session_id = ? ORDER BY round_number", (session_id,)
+        )
+        rounds = await cursor.fetchall()
+        cursor = await db.execute(
+            "SELECT * FROM expertise_results WHERE session_id = ? ORDER BY round_number", (session_id,)
+        )
+        expertise = await cursor.fetchall()
+        return {"session": session, "rounds": rounds, "expertise": expertise}
+
+
+async def measure(name, func, iterations):
+    latencies = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        await func(i)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        "operation": name,
+        "mean_ms": statistics.mean(latencies),
+        "p50_ms": latencies[len(latencies) // 2],
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1],
+    }
+
+
+def print_table(title, rows):
+    print(f"\n{title}")
+    print(f"{'операция':<22}{'mean, ms':>10}{'p50, ms':>10}{'p95, ms':>10}")
+    for row in rows:
+        print(f"{row['operation']:<22}{row['mean_ms']:>10.3f}{row['p50_ms']:>10.3f}{row['p95_ms']:>10.3f}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=300)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        session_id = "bench-session"
+        # Записи идут в отдельную сессию, чтобы чтение в обоих режимах
+        # работало с одинаковым объёмом данных
+        write_session_id = "bench-writes"
+        payload = {"type": "primary", "content": "x" * 2000}
+
+        async with KnowledgeBase(db_path=db_path) as kb:
+            await kb.save_session(session_id, "Бенчмарк", {})
+            await kb.save_session(write_session_id, "Бенчмарк записи", {})
+            for i in range(10):
+                await kb.save_round(session_id, i, payload)
+
+            before = [
+                await measure("save_round", lambda i: legacy_save_round(db_path, write_session_id, i, payload), args.iterations),
+                await measure("session_exists", lambda i: legacy_session_exists(db_path, session_id), args.iterations),
+                await measure("get_session_history", lambda i: legacy_get_session_history(db_path, session_id), args.iterations),
+            ]
+            after = [
+                await measure("save_round", lambda i: kb.save_round(write_session_id, i, payload), args.iterations),
+                await measure("session_exists", lambda i: kb.session_exists(session_id), args.iterations),
+                await measure("get_session_history", lambda i: kb.get_session_history(session_id), args.iterations),
+            ]
+
+    print_table("До: соединение на каждый вызов", before)
+    print_table("После: пул долгоживущих соединений", after)
+    print("\nУскорение (mean):")
+    for b, a in zip(before, after):
+        print(f"   {b['operation']:<22}x{b['mean_ms'] / a['mean_ms']:.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
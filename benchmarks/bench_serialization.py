@@ -0,0 +1,108 @@
+﻿"""
+Бенчмарк сериализации чекпоинтов SessionContext на длинных сессиях.
+
+Для каждого раунда сессия пишет чекпоинт. Сравниваются:
+    "полный json.dumps" - весь контекст вручную через json.dumps на
+        каждом раунде (так сохранялся бы полный контекст раньше);
+    "полный <кодировка>" - весь контекст через encode_context;
+    "дельта <кодировка>" - DeltaTracker: только изменения раунда.
+Для полного снимка объём и время на раунд растут с номером раунда
+(суммарно - квадратично), для дельты остаются постоянными.
+
+Запуск:
+    python benchmarks/bench_serialization.py --rounds 200
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from research_engine.core.models import (
+    SessionContext, ModelResponse, ExpertiseResult, DiscussionRound
+)
+from research_engine.core.serialization import (
+    DeltaTracker, available_encodings, encode_context
+)
+
+
+def grow(context: SessionContext, round_number: int, response_size: int):
+    """Один раунд: три экспертизы, три ответа обсуждения и оценка судьи"""
+    for expert in ("code", "prompt", "analytics"):
+        context.expertise_results.append(ExpertiseResult(
+            expert_type=expert,
+            findings=[f"Замечание {round_number}.{i}" for i in range(5)],
+            suggestions=[f"Предложение {round_number}.{i}" for i in range(5)],
+            score=7.0,
+            raw_response="ю" * (response_size // 4)
+        ))
+    context.discussion_rounds.append(DiscussionRound(
+        round_number=round_number,
+        responses={model: "ответ " * (response_size // 6) for model in ("gpt-4", "claude", "deepseek")}
+    ))
+    context.current_round = round_number
+    context.quality_score = 5.0 + round_number / 100
+    context.improvement_trend.append(context.quality_score)
+    context.final_synthesis = f"Синтез раунда {round_number}: " + "x" * response_size
+    context.tokens_used += 1500
+
+
+def legacy_dumps(context: SessionContext) -> bytes:
+    return json.dumps(context.model_dump(mode="json"), ensure_ascii=False).encode("utf-8")
+
+
+def run(name, encode, rounds, response_size):
+    context = SessionContext(task="Бенчмарк", initial_prompt="тест")
+    context.primary_response = ModelResponse(model_name="gpt-4", content="y" * response_size)
+    total_s = 0.0
+    total_bytes = 0
+    sizes = []
+    for round_number in range(1, rounds + 1):
+        grow(context, round_number, response_size)
+        start = time.perf_counter()
+        payload = encode(context)
+        total_s += time.perf_counter() - start
+        total_bytes += len(payload)
+        sizes.append(len(payload))
+    return {
+        "name": name,
+        "total_ms": total_s * 1000,
+        "total_mb": total_bytes / 1e6,
+        "first_kb": sizes[0] / 1e3,
+        "last_kb": sizes[-1] / 1e3,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rounds", type=int, default=100)
+    parser.add_argument("--response-size", type=int, default=2000, help="Символов в ответе модели")
+    parser.add_argument("--full-every", type=int, default=None, help="Полный снимок раз в N дельт")
+    args = parser.parse_args()
+
+    results = [run("полный json.dumps", legacy_dumps, args.rounds, args.response_size)]
+    for encoding in available_encodings():
+        results.append(run(
+            f"полный {encoding}",
+            lambda context, encoding=encoding: encode_context(context, encoding),
+            args.rounds,
+            args.response_size
+        ))
+        tracker = DeltaTracker(encoding, full_every=args.full_every)
+        results.append(run(
+            f"дельта {encoding}",
+            lambda context, tracker=tracker: tracker.checkpoint(context)[1],
+            args.rounds,
+            args.response_size
+        ))
+
+    print(f"\nРаундов: {args.rounds}, ответ модели: {args.response_size} символов, полный снимок раз в {args.full_every or '-'} дельт")
+    print(f"{'способ':<22}{'время, ms':>12}{'записано, MB':>15}{'раунд 1, KB':>14}{'последний, KB':>16}")
+    for r in results:
+        print(f"{r['name']:<22}{r['total_ms']:>12.1f}{r['total_mb']:>15.2f}{r['first_kb']:>14.1f}{r['last_kb']:>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+﻿"""
+Бенчмарк времени импорта точек входа (холодный старт).
+
+Каждая точка входа импортируется в отдельном процессе с -X importtime
+repeat раз; берётся медиана суммарного времени импорта модуля. Проверки:
+    бюджет   - медиана не больше budget_ms (или --max-ms);
+    лишнее   - тяжёлые зависимости, которые должны грузиться лениво
+               (bs4/lxml, SQLAlchemy, httpx для API; NumPy для Research
+               Engine), не импортируются вместе с точкой входа.
+При нарушении скрипт завершается с кодом 1 - годится для CI.
+
+Запуск:
+    python benchmarks/bench_startup.py --repeat 5
+    python benchmarks/bench_startup.py --only src.main --top 15
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+SOKRAT_ROOT = os.path.join(ROOT, "sokrat_core")
+
+# Модуль -> (каталог запуска, бюджет в мс, модули, которых не должно быть после импорта)
+TARGETS: Dict[str, Tuple[str, float, List[str]]] = {
+    "src.main": (SOKRAT_ROOT, 700.0, ["bs4", "lxml", "sqlalchemy", "httpx"]),
+    "research_engine.core.orchestrator": (ROOT, 300.0, ["numpy", "aiosqlite"]),
+    "research_engine.core.batch": (ROOT, 300.0, ["numpy", "aiosqlite"]),
+    "knowledge_base": (ROOT, 200.0, ["numpy", "pyarrow"]),
+}
+
+_LINE_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+
+def measure(module: str, cwd: str) -> Tuple[float, Dict[str, Tuple[int, int, int]]]:
+    """
+    Один импорт в новом процессе.
+
+    Returns:
+        (суммарное время импорта модуля в мс, {модуль: (self_us, cumulative_us, глубина)})
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd,
+        capture_output=True,
+        text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Импорт {module} не удался:\n{proc.stderr[-2000:]}")
+    modules: Dict[str, Tuple[int, int, int]] = {}
+    for line in proc.stderr.splitlines():
+        match = _LINE_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules[name] = (int(self_us), int(cumulative_us), len(indent))
+    if module not in modules:
+        raise RuntimeError(f"В выводе -X importtime нет {module}")
+    return modules[module][1] / 1000, modules
+
+
+def top_packages(modules: Dict[str, Tuple[int, int, int]], limit: int) -> List[Tuple[str, float]]:
+    """Самые тяжёлые пакеты верхнего уровня по собственному времени их модулей"""
+    totals: Dict[str, int] = {}
+    for name, (self_us, _, _) in modules.items():
+        package = name.split(".")[0]
+        totals[package] = totals.get(package, 0) + self_us
+    return [(package, us / 1000) for package, us in sorted(totals.items(), key=lambda kv: -kv[1])[:limit]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="Запусков на точку входа")
+    parser.add_argument("--only", action="append", help="Только эта точка входа (можно несколько)")
+    parser.add_argument("--max-ms", type=float, default=None, help="Общий бюджет вместо бюджетов по умолчанию")
+    parser.add_argument("--top", type=int, default=8, help="Показать N самых тяжёлых пакетов")
+    args = parser.parse_args()
+
+    failures = []
+    for module, (cwd, budget_ms, forbidden) in TARGETS.items():
+        if args.only and module not in args.only:
+            continue
+        budget_ms = args.max_ms or budget_ms
+        runs = [measure(module, cwd) for _ in range(args.repeat)]
+        median_ms = statistics.median(ms for ms, _ in runs)
+        modules = runs[-1][1]
+        loaded = [name for name in forbidden if name in modules]
+
+        status = "ok" if median_ms <= budget_ms and not loaded else "FAIL"
+        print(f"\n{module}: медиана {median_ms:.1f} мс (мин {min(ms for ms, _ in runs):.1f}), бюджет {budget_ms:.0f} мс, модулей {len(modules)} - {status}")
+        for package, ms in top_packages(modules, args.top):
+            print(f"    {package:<32}{ms:>9.1f} мс")
+        if median_ms > budget_ms:
+            failures.append(f"{module}: {median_ms:.1f} мс > {budget_ms:.0f} мс")
+        if loaded:
+            failures.append(f"{module}: импортированы {', '.join(loaded)}")
+
+    if failures:
+        print("\nРегрессия времени старта:")
+        for failure in failures:
+            print(f"    {failure}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
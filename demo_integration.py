@@ -3,6 +3,7 @@
 Демонстрация полной системы: Research Engine + Knowledge Base.
 """
 import asyncio
+import logging
 import os
 import sys
 from datetime import datetime
@@ -102,4 +103,5 @@ async def main():
     print("="*60)
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     asyncio.run(main())
@@ -3,31 +3,239 @@
 Асинхронная версия с aiosqlite.
 """
 import aiosqlite
+import base64
 import json
 import os
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 from datetime import datetime
-from typing import List, Dict, Optional, Any, Tuple
+from typing import List, Dict, Optional, Any, Tuple, AsyncIterator, Callable
+
+from . import codec
+from .cache import SessionCache, MISSING
+from .pool import ReaderPool
+from .records import HistoryRecord
+from .writer import SQLiteWriter, get_writer
+
+# Отложенные записи открытых transaction(): путь к БД -> список операций
+_pending_writes: ContextVar[Optional[Dict[str, list]]] = ContextVar("kb_pending_writes", default=None)
+
+# Тексты запросов неизменны: на долгоживущих соединениях sqlite3 берёт
+# уже скомпилированные выражения из своего кэша
+_INSERT_SESSION = """
+INSERT INTO research_sessions (id, task, config, created_at, status)
+VALUES (?, ?, ?, ?, ?)
+"""
+
+_INSERT_ROUND = """
+INSERT INTO research_rounds (session_id, round_number, data, created_at)
+VALUES (?, ?, ?, ?)
+"""
+
+_INSERT_EXPERTISE = """
+INSERT INTO expertise_results 
+(session_id, round_number, expert_type, findings, suggestions, score, created_at, status)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+_DELETE_SESSION = "DELETE FROM research_sessions WHERE id = ?"
+
+# PRAGMA foreign_keys выключен, поэтому ON DELETE CASCADE не срабатывает:
+# дочерние строки удаляются явно в той же транзакции
+_DELETE_ROUNDS = "DELETE FROM research_rounds WHERE session_id = ?"
+
+_DELETE_EXPERTISE = "DELETE FROM expertise_results WHERE session_id = ?"
+
+_INSERT_STATE = """
+INSERT INTO session_state (session_id, kind, encoding, payload, created_at)
+VALUES (?, ?, ?, ?, ?)
+"""
+
+# Последний полный снимок и дельты после него
+_SELECT_STATE = """
+SELECT kind, encoding, payload FROM session_state
+WHERE session_id = ? AND id >= (
+    SELECT COALESCE(MAX(id), 0) FROM session_state WHERE session_id = ? AND kind = 'full'
+)
+ORDER BY id
+"""
+
+_DELETE_STATE = "DELETE FROM session_state WHERE session_id = ?"
+
+_UPDATE_SESSION_STATUS = "UPDATE research_sessions SET status = ? WHERE id = ?"
+
+_SELECT_SESSION = "SELECT * FROM research_sessions WHERE id = ?"
+
+_SELECT_ROUNDS = "SELECT * FROM research_rounds WHERE session_id = ? ORDER BY round_number"
+
+_SELECT_EXPERTISE = "SELECT * FROM expertise_results WHERE session_id = ? ORDER BY round_number"
+
+_SESSION_EXISTS = "SELECT 1 FROM research_sessions WHERE id = ?"
+
+_SELECT_ALL_SESSIONS = """
+SELECT id, task, created_at, status 
+FROM research_sessions 
+ORDER BY created_at DESC, id DESC 
+LIMIT ?
+"""
 
 class KnowledgeBase:
     """
     Асинхронная база знаний с SQLite хранилищем.
     """
     
-    def __init__(self, db_path: str = "data/sokrat.db"):
+    def __init__(
+        self,
+        db_path: str = "data/sokrat.db",
+        pool_size: int = 4,
+        cache_size: int = 0,
+        cache_ttl: Optional[float] = 30.0,
+        similarity: bool = False
+    ):
         """
         Инициализация БД.
         
         Args:
             db_path: путь к файлу SQLite
+            pool_size: число соединений для чтения
+            cache_size: сколько сессий держать в кэше чтений (0 - без кэша)
+            cache_ttl: время жизни записи кэша в секундах (None - без ограничения)
+            similarity: вести индекс похожести сессий (find_similar_sessions)
         """
         self.db_path = db_path
+        self.cache = SessionCache(cache_size, cache_ttl) if cache_size > 0 else None
+        self.similarity = None
+        if similarity:
+            # Локальный импорт: NumPy нужен только индексу похожести
+            from .similarity import SimilarityIndex
+            self.similarity = SimilarityIndex()
+        self._similarity_loaded = False
+        self._pool = ReaderPool(db_path, size=pool_size)
+        self._tx_key = os.path.abspath(db_path)
+        self._schema_ready = False
         
         # Создаём директорию для БД если нужно
         os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
     
+    async def open(self):
+        """
+        Подготовить БД к работе: схема (один раз), писатель и пул
+        соединений для чтения. Вызывается автоматически при первом
+        обращении, но явный open()/close() (или async with) позволяет
+        управлять временем жизни соединений.
+        """
+        if not self._schema_ready:
+            await self._init_db()
+        await self._writer().start()
+        await self._pool.open()
+        if self.similarity is not None and not self._similarity_loaded:
+            await self._load_similarity()
+    
+    async def _ensure_open(self):
+        if not self._pool.is_open:
+            await self.open()
+    
+    async def __aenter__(self) -> "KnowledgeBase":
+        await self.open()
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+    
+    def _writer(self) -> SQLiteWriter:
+        """
+        Единственный писатель для файла БД. Все записи (в том числе из
+        разных экземпляров KnowledgeBase с тем же путём) идут через него
+        и объединяются в групповые коммиты.
+        """
+        return get_writer(self.db_path)
+    
+    async def close(self):
+        """Дописать очередь записи и закрыть все соединения."""
+        await self._writer().stop()
+        await self._pool.close()
+    
+    def cache_stats(self) -> Optional[Dict[str, Any]]:
+        """Статистика кэша чтений (None, если кэш выключен)."""
+        return self.cache.stats() if self.cache else None
+    
+    def _invalidate(self, session_ids):
+        if self.cache:
+            for session_id in session_ids:
+                self.cache.invalidate(session_id)
+    
+    async def _write(
+        self,
+        sql: str,
+        params,
+        many: bool = False,
+        session_id: Optional[str] = None,
+        on_commit: Optional[Callable[[], None]] = None
+    ):
+        """
+        Выполнить запись через писателя. Внутри transaction() запись
+        откладывается и фиксируется вместе с остальными одним коммитом.
+        После коммита кэш по затронутой сессии сбрасывается и
+        вызывается on_commit (обновление индекса похожести).
+        """
+        async def op(db):
+            if many:
+                await db.executemany(sql, params)
+            else:
+                await db.execute(sql, params)
+        
+        pending = _pending_writes.get()
+        if pending is not None and self._tx_key in pending:
+            pending[self._tx_key].append((op, session_id, on_commit))
+            return
+        
+        await self._ensure_open()
+        await self._writer().submit(op)
+        self._invalidate([session_id])
+        if on_commit is not None:
+            on_commit()
+    
+    @asynccontextmanager
+    async def transaction(self):
+        """
+        Сгруппировать несколько записей в один атомарный коммит.
+        
+        Записи внутри блока откладываются и выполняются одной транзакцией
+        при выходе из него; при исключении они отбрасываются. Чтение
+        внутри блока отложенных записей не видит. Вложенный блок
+        присоединяется к внешнему.
+        
+            async with kb.transaction():
+                await kb.save_round(...)
+                await kb.save_expertise_many(...)
+        """
+        pending = _pending_writes.get()
+        if pending is not None and self._tx_key in pending:
+            yield self
+            return
+        
+        ops = []
+        token = _pending_writes.set({**(pending or {}), self._tx_key: ops})
+        try:
+            yield self
+        finally:
+            _pending_writes.reset(token)
+        
+        if ops:
+            async def run_all(db):
+                for op, _, _ in ops:
+                    await op(db)
+            
+            await self._ensure_open()
+            await self._writer().submit(run_all)
+            self._invalidate({session_id for _, session_id, _ in ops})
+            for _, _, on_commit in ops:
+                if on_commit is not None:
+                    on_commit()
+    
     async def _init_db(self):
         """Создание всех необходимых таблиц (асинхронно)."""
-        async with aiosqlite.connect(self.db_path) as db:
+        async def create_schema(db):
             # Таблица для исследовательских сессий
             await db.execute("""
             CREATE TABLE IF NOT EXISTS research_sessions (
@@ -51,10 +259,21 @@ async def _init_db(self):
             )
             """)
             
-            # Индекс для быстрого поиска по сессии
+            # Индекс для листинга сессий (keyset-пагинация по created_at)
+            await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_sessions_created 
+            ON research_sessions(created_at, id)
+            """)
+            await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_sessions_status_created 
+            ON research_sessions(status, created_at, id)
+            """)
+            
+            # Индекс для быстрого поиска по сессии (сразу в порядке раундов)
+            await db.execute("DROP INDEX IF EXISTS idx_rounds_session")
             await db.execute("""
-            CREATE INDEX IF NOT EXISTS idx_rounds_session 
-            ON research_rounds(session_id)
+            CREATE INDEX IF NOT EXISTS idx_rounds_session_round 
+            ON research_rounds(session_id, round_number)
             """)
             
             # Таблица для экспертиз
@@ -73,51 +292,109 @@ async def _init_db(self):
             """)
             
             # Индекс для быстрого поиска экспертиз
+            await db.execute("DROP INDEX IF EXISTS idx_expertise_session")
             await db.execute("""
-            CREATE INDEX IF NOT EXISTS idx_expertise_session 
-            ON expertise_results(session_id)
+            CREATE INDEX IF NOT EXISTS idx_expertise_session_round 
+            ON expertise_results(session_id, round_number)
             """)
             
-            await db.commit()
+            # Вычисляемые колонки по JSON-полям (JSON1) для аналитики в SQL.
+            # VIRTUAL-колонки добавляются в конец таблицы и в существующую БД
+            await _add_columns(db, "research_rounds", {
+                "round_type": "TEXT GENERATED ALWAYS AS (json_extract(data, '$.type')) VIRTUAL",
+                "quality_score": "REAL GENERATED ALWAYS AS (json_extract(data, '$.quality_score')) VIRTUAL",
+            })
+            await _add_columns(db, "expertise_results", {
+                "findings_count": "INTEGER GENERATED ALWAYS AS (json_array_length(findings)) VIRTUAL",
+            })
+            # Статус экспертизы: ok, error, timeout, cancelled
+            await _add_columns(db, "expertise_results", {
+                "status": "TEXT NOT NULL DEFAULT 'ok'",
+            })
+            await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_rounds_type_score 
+            ON research_rounds(round_type, quality_score)
+            """)
+            await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_expertise_type_score 
+            ON expertise_results(expert_type, score)
+            """)
+            
+            # Снимки контекста сессии: полный ('full') и изменения после
+            # предыдущего снимка ('delta') в кодировке encoding
+            await db.execute("""
+            CREATE TABLE IF NOT EXISTS session_state (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                encoding TEXT NOT NULL,
+                payload BLOB NOT NULL,
+                created_at TIMESTAMP NOT NULL,
+                FOREIGN KEY (session_id) REFERENCES research_sessions(id) ON DELETE CASCADE
+            )
+            """)
+            await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_state_session_kind 
+            ON session_state(session_id, kind, id)
+            """)
+        
+        await self._writer().submit(create_schema)
+        self._schema_ready = True
     
     async def save_session(self, session_id: str, task: str, config: dict):
         """
         Сохранить сессию (асинхронно).
         """
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
-                """
-                INSERT INTO research_sessions (id, task, config, created_at, status)
-                VALUES (?, ?, ?, ?, ?)
-                """,
-                (
-                    session_id,
-                    task,
-                    json.dumps(config, ensure_ascii=False),
-                    datetime.now().isoformat(),
-                    'active'
-                )
-            )
-            await db.commit()
+        await self._write(
+            _INSERT_SESSION,
+            (
+                session_id,
+                task,
+                codec.dumps(config),
+                datetime.now().isoformat(),
+                'active'
+            ),
+            session_id=session_id,
+            on_commit=self._index_session(session_id, task, config)
+        )
     
     async def save_round(self, session_id: str, round_number: int, data: dict):
         """
         Сохранить раунд исследования (асинхронно).
         """
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
-                """
-                INSERT INTO research_rounds (session_id, round_number, data, created_at)
-                VALUES (?, ?, ?, ?)
-                """,
-                (
-                    session_id,
-                    round_number,
-                    json.dumps(data, ensure_ascii=False),
-                    datetime.now().isoformat()
-                )
+        await self._write(
+            _INSERT_ROUND,
+            (
+                session_id,
+                round_number,
+                codec.dumps(data),
+                datetime.now().isoformat()
+            ),
+            session_id=session_id,
+            on_commit=self._index_round(session_id, data)
+        )
+    
+    async def save_rounds_many(self, session_id: str, rounds: List[Tuple[int, dict]]):
+        """
+        Сохранить несколько раундов одной командой (executemany).
+        
+        Args:
+            rounds: список пар (round_number, data)
+        """
+        now = datetime.now().isoformat()
+        await self._write(
+            _INSERT_ROUND,
+            [
+                (session_id, round_number, codec.dumps(data), now)
+                for round_number, data in rounds
+            ],
+            many=True,
+            session_id=session_id,
+            on_commit=self._index_round(
+                session_id,
+                next((data for _, data in reversed(rounds) if data.get("type") == "final"), {})
             )
-            await db.commit()
+        )
     
     async def save_expertise(
         self,
@@ -126,94 +403,445 @@ async def save_expertise(
         expert_type: str,
         findings: list,
         suggestions: list,
-        score: float
+        score: float,
+        status: str = "ok"
     ):
         """
         Сохранить результат экспертизы (асинхронно).
+        
+        Args:
+            status: 'ok' или причина неуспеха эксперта ('error', 'timeout', 'cancelled')
         """
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
-                """
-                INSERT INTO expertise_results 
-                (session_id, round_number, expert_type, findings, suggestions, score, created_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-                """,
+        await self._write(
+            _INSERT_EXPERTISE,
+            (
+                session_id,
+                round_number,
+                expert_type,
+                codec.dumps(findings),
+                codec.dumps(suggestions),
+                score,
+                datetime.now().isoformat(),
+                status
+            ),
+            session_id=session_id
+        )
+    
+    async def save_expertise_many(self, session_id: str, round_number: int, items: List[Dict[str, Any]]):
+        """
+        Сохранить результаты нескольких экспертов одной командой (executemany).
+        
+        Args:
+            items: словари с ключами expert_type, findings, suggestions, score
+                и необязательным status (по умолчанию 'ok')
+        """
+        now = datetime.now().isoformat()
+        await self._write(
+            _INSERT_EXPERTISE,
+            [
                 (
                     session_id,
                     round_number,
-                    expert_type,
-                    json.dumps(findings, ensure_ascii=False),
-                    json.dumps(suggestions, ensure_ascii=False),
-                    score,
-                    datetime.now().isoformat()
+                    item["expert_type"],
+                    codec.dumps(item["findings"]),
+                    codec.dumps(item["suggestions"]),
+                    item["score"],
+                    now,
+                    item.get("status", "ok")
                 )
-            )
-            await db.commit()
+                for item in items
+            ],
+            many=True,
+            session_id=session_id
+        )
+    
+    async def save_state(self, session_id: str, kind: str, encoding: str, payload: bytes):
+        """
+        Сохранить снимок контекста сессии.
+        
+        Args:
+            kind: 'full' - полный снимок, 'delta' - изменения после предыдущего
+            encoding: кодировка payload ('json', 'orjson', 'msgpack')
+        """
+        await self._write(
+            _INSERT_STATE,
+            (session_id, kind, encoding, payload, datetime.now().isoformat()),
+            session_id=session_id
+        )
+    
+    async def load_state(self, session_id: str) -> List[Tuple[str, str, bytes]]:
+        """
+        Снимки для восстановления контекста: последний полный и дельты
+        после него, по порядку записи.
+        
+        Returns:
+            Список (kind, encoding, payload); пустой, если снимков нет
+        """
+        rows = await self._fetch_all(_SELECT_STATE, (session_id, session_id))
+        return [(row["kind"], row["encoding"], row["payload"]) for row in rows]
+    
+    async def update_session_status(self, session_id: str, status: str):
+        """
+        Обновить статус сессии: 'active', 'completed' или 'failed'.
+        """
+        await self._write(_UPDATE_SESSION_STATUS, (status, session_id), session_id=session_id)
     
     async def get_session_history(self, session_id: str) -> Dict[str, Any]:
         """
         Получить полную историю сессии (асинхронно).
+        При включённом кэше повторные чтения не обращаются к диску.
         """
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            
+        if self.cache:
+            cached = self.cache.get(session_id, "history")
+            if cached is not MISSING:
+                return _copy_history(cached)
+            version = self.cache.version(session_id)
+        
+        await self._ensure_open()
+        async with self._pool.acquire() as db:
             # Получаем сессию
-            cursor = await db.execute(
-                "SELECT * FROM research_sessions WHERE id = ?",
-                (session_id,)
-            )
-            session = await cursor.fetchone()
+            async with db.execute(_SELECT_SESSION, (session_id,)) as cursor:
+                session = await cursor.fetchone()
             
             # Получаем раунды
-            cursor = await db.execute(
-                "SELECT * FROM research_rounds WHERE session_id = ? ORDER BY round_number",
-                (session_id,)
-            )
-            rounds = await cursor.fetchall()
+            async with db.execute(_SELECT_ROUNDS, (session_id,)) as cursor:
+                rounds = await cursor.fetchall()
             
             # Получаем экспертизы
-            cursor = await db.execute(
-                "SELECT * FROM expertise_results WHERE session_id = ? ORDER BY round_number",
-                (session_id,)
-            )
-            expertise = await cursor.fetchall()
-            
-            return {
-                "session": session,
-                "rounds": rounds,
-                "expertise": expertise
-            }
+            async with db.execute(_SELECT_EXPERTISE, (session_id,)) as cursor:
+                expertise = await cursor.fetchall()
+        
+        history = {
+            "session": session,
+            "rounds": rounds,
+            "expertise": expertise
+        }
+        if self.cache:
+            self.cache.put(session_id, "history", history, version)
+            self.cache.put(session_id, "exists", session is not None, version)
+        return _copy_history(history)
     
     async def session_exists(self, session_id: str) -> bool:
         """Проверить существование сессии (асинхронно)."""
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute(
-                "SELECT 1 FROM research_sessions WHERE id = ?",
-                (session_id,)
-            )
-            result = await cursor.fetchone()
-            return result is not None
+        if self.cache:
+            cached = self.cache.get(session_id, "exists")
+            if cached is not MISSING:
+                return cached
+            version = self.cache.version(session_id)
+        
+        await self._ensure_open()
+        async with self._pool.acquire() as db:
+            async with db.execute(_SESSION_EXISTS, (session_id,)) as cursor:
+                result = await cursor.fetchone()
+        
+        exists = result is not None
+        if self.cache:
+            self.cache.put(session_id, "exists", exists, version)
+        return exists
     
     async def delete_session(self, session_id: str):
         """Удалить сессию и все связанные данные (асинхронно)."""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
-                "DELETE FROM research_sessions WHERE id = ?",
-                (session_id,)
+        async with self.transaction():
+            for sql in (_DELETE_STATE, _DELETE_EXPERTISE, _DELETE_ROUNDS):
+                await self._write(sql, (session_id,), session_id=session_id)
+            await self._write(
+                _DELETE_SESSION,
+                (session_id,),
+                session_id=session_id,
+                on_commit=self._unindex_session(session_id)
             )
-            await db.commit()
     
     async def get_all_sessions(self, limit: int = 100) -> List[Tuple]:
         """Получить список всех сессий (асинхронно)."""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute(
+        await self._ensure_open()
+        async with self._pool.acquire() as db:
+            async with db.execute(_SELECT_ALL_SESSIONS, (limit,)) as cursor:
+                return await cursor.fetchall()
+    
+    async def list_sessions(
+        self,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        status: Optional[str] = None,
+        created_from: Optional[datetime] = None,
+        created_to: Optional[datetime] = None
+    ) -> Tuple[List[aiosqlite.Row], Optional[str]]:
+        """
+        Страница списка сессий (новые первыми) с keyset-пагинацией.
+        
+        Страница выбирается по индексу (status, created_at, id) без OFFSET,
+        поэтому время не зависит от размера таблицы и номера страницы.
+        
+        Args:
+            limit: размер страницы
+            cursor: курсор из предыдущего вызова (None - первая страница)
+            status: фильтр по статусу
+            created_from, created_to: диапазон дат создания [from, to)
+            
+        Returns:
+            (строки, курсор следующей страницы или None)
+        """
+        conditions = []
+        params: List[Any] = []
+        if status is not None:
+            conditions.append("status = ?")
+            params.append(status)
+        if created_from is not None:
+            conditions.append("created_at >= ?")
+            params.append(created_from.isoformat())
+        if created_to is not None:
+            conditions.append("created_at < ?")
+            params.append(created_to.isoformat())
+        if cursor is not None:
+            last_created_at, last_id = _decode_cursor(cursor)
+            conditions.append("(created_at, id) < (?, ?)")
+            params.extend([last_created_at, last_id])
+        
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        sql = f"""
+        SELECT id, task, created_at, status 
+        FROM research_sessions 
+        {where} 
+        ORDER BY created_at DESC, id DESC 
+        LIMIT ?
+        """
+        params.append(limit)
+        
+        await self._ensure_open()
+        async with self._pool.acquire() as db:
+            async with db.execute(sql, params) as cur:
+                rows = await cur.fetchall()
+        
+        next_cursor = None
+        if len(rows) == limit:
+            last = rows[-1]
+            next_cursor = _encode_cursor(last["created_at"], last["id"])
+        return rows, next_cursor
+    
+    async def iter_session_history(self, session_id: str) -> AsyncIterator[HistoryRecord]:
+        """
+        Потоково отдать историю сессии: сессию, затем раунды и экспертизы.
+        
+        Строки читаются порциями, JSON разбирается только при обращении
+        к полям записи (record.data, record.findings ...). Соединение
+        занято до конца обхода, поэтому при досрочном выходе итератор
+        стоит закрывать (contextlib.aclosing).
+        """
+        await self._ensure_open()
+        async with self._pool.acquire() as db:
+            async with db.execute(_SELECT_SESSION, (session_id,)) as cursor:
+                session = await cursor.fetchone()
+            if session is None:
+                return
+            yield HistoryRecord("session", session)
+            
+            async with db.execute(_SELECT_ROUNDS, (session_id,)) as cursor:
+                async for row in cursor:
+                    yield HistoryRecord("round", row)
+            
+            async with db.execute(_SELECT_EXPERTISE, (session_id,)) as cursor:
+                async for row in cursor:
+                    yield HistoryRecord("expertise", row)
+
+    
+    # --- Индекс похожести ---
+    
+    def _index_session(self, session_id: str, task: str, config: dict):
+        if self.similarity is None:
+            return None
+        return lambda: self.similarity.add_session(session_id, task, config.get("initial_prompt") or "")
+    
+    def _index_round(self, session_id: str, data: dict):
+        if self.similarity is None or data.get("type") != "final":
+            return None
+        return lambda: self.similarity.set_result(session_id, data.get("synthesis"), data.get("quality_score"))
+    
+    def _unindex_session(self, session_id: str):
+        if self.similarity is None:
+            return None
+        return lambda: self.similarity.remove(session_id)
+    
+    async def _load_similarity(self, batch_size: int = 1000):
+        """Построить индекс похожести по сессиям, уже записанным в БД."""
+        self._similarity_loaded = True
+        last_id = ""
+        while True:
+            rows = await self._fetch_all(
                 """
-                SELECT id, task, created_at, status 
-                FROM research_sessions 
-                ORDER BY created_at DESC 
+                SELECT s.id, s.task, s.config,
+                       (SELECT r.data FROM research_rounds r
+                        WHERE r.session_id = s.id AND r.round_type = 'final'
+                        ORDER BY r.round_number DESC, r.id DESC LIMIT 1) AS final
+                FROM research_sessions s
+                WHERE s.id > ?
+                ORDER BY s.id
                 LIMIT ?
                 """,
-                (limit,)
+                (last_id, batch_size)
             )
-            return await cursor.fetchall()
+            for row in rows:
+                config = codec.loads(row["config"])
+                self.similarity.add_session(row["id"], row["task"], config.get("initial_prompt") or "")
+                if row["final"] is not None:
+                    final = codec.loads(row["final"])
+                    self.similarity.set_result(row["id"], final.get("synthesis"), final.get("quality_score"))
+            if len(rows) < batch_size:
+                break
+            last_id = rows[-1]["id"]
+    
+    async def find_similar_sessions(
+        self,
+        text: str,
+        limit: int = 5,
+        min_similarity: float = 0.0,
+        min_quality: Optional[float] = None,
+        field: str = "task"
+    ) -> List[Dict[str, Any]]:
+        """
+        Прошлые сессии, похожие на текст (по убыванию близости):
+        field='task' - по задаче и промпту, 'synthesis' - по итоговому
+        синтезу. Требует KnowledgeBase(similarity=True).
+        """
+        if self.similarity is None:
+            raise RuntimeError("Индекс похожести выключен: KnowledgeBase(similarity=True)")
+        await self._ensure_open()
+        return self.similarity.search(text, limit, min_similarity, min_quality, field)
+    
+    # --- Аналитика (агрегаты считаются в SQL по индексированным колонкам) ---
+    
+    async def _fetch_all(self, sql: str, params=()) -> List[aiosqlite.Row]:
+        await self._ensure_open()
+        async with self._pool.acquire() as db:
+            async with db.execute(sql, params) as cursor:
+                return await cursor.fetchall()
+    
+    async def expert_score_stats(
+        self,
+        created_from: Optional[datetime] = None,
+        created_to: Optional[datetime] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Статистика оценок по типам экспертов: число успешных экспертиз,
+        средняя, минимальная и максимальная оценка, среднее число находок
+        (по успешным) и число неуспешных (таймаут, ошибка, отмена).
+        """
+        conditions, params = _date_range("created_at", created_from, created_to)
+        rows = await self._fetch_all(
+            f"""
+            SELECT expert_type,
+                   SUM(status = 'ok') AS count,
+                   AVG(CASE WHEN status = 'ok' THEN score END) AS avg_score,
+                   MIN(CASE WHEN status = 'ok' THEN score END) AS min_score,
+                   MAX(CASE WHEN status = 'ok' THEN score END) AS max_score,
+                   AVG(CASE WHEN status = 'ok' THEN findings_count END) AS avg_findings,
+                   SUM(status != 'ok') AS failed
+            FROM expertise_results
+            {conditions}
+            GROUP BY expert_type
+            ORDER BY expert_type
+            """,
+            params
+        )
+        return [dict(row) for row in rows]
+    
+    async def expert_score_by_round(self) -> List[Dict[str, Any]]:
+        """Средняя оценка каждого типа эксперта по номерам раундов (тренд)."""
+        rows = await self._fetch_all(
+            """
+            SELECT expert_type, round_number,
+                   COUNT(*) AS count,
+                   AVG(score) AS avg_score
+            FROM expertise_results
+            WHERE status = 'ok'
+            GROUP BY expert_type, round_number
+            ORDER BY expert_type, round_number
+            """
+        )
+        return [dict(row) for row in rows]
+    
+    async def score_trend(self, session_id: str) -> List[Tuple[int, float]]:
+        """Оценки качества сессии по раундам: [(round_number, quality_score)]."""
+        rows = await self._fetch_all(
+            """
+            SELECT round_number, quality_score
+            FROM research_rounds
+            WHERE session_id = ? AND quality_score IS NOT NULL
+            ORDER BY round_number
+            """,
+            (session_id,)
+        )
+        return [(row["round_number"], row["quality_score"]) for row in rows]
+    
+    async def low_quality_sessions(self, threshold: float, limit: int = 100) -> List[Dict[str, Any]]:
+        """
+        Сессии, итоговая оценка (раунд type='final') которых ниже порога,
+        от худших к лучшим.
+        """
+        rows = await self._fetch_all(
+            """
+            SELECT s.id, s.task, s.created_at, s.status, r.quality_score
+            FROM research_rounds r
+            JOIN research_sessions s ON s.id = r.session_id
+            WHERE r.round_type = 'final' AND r.quality_score < ?
+            ORDER BY r.quality_score
+            LIMIT ?
+            """,
+            (threshold, limit)
+        )
+        return [dict(row) for row in rows]
+    
+    async def quality_summary(self) -> Dict[str, Any]:
+        """Сводка по итоговым оценкам всех завершённых сессий."""
+        rows = await self._fetch_all(
+            """
+            SELECT COUNT(*) AS sessions,
+                   AVG(quality_score) AS avg_quality,
+                   MIN(quality_score) AS min_quality,
+                   MAX(quality_score) AS max_quality
+            FROM research_rounds
+            WHERE round_type = 'final'
+            """
+        )
+        return dict(rows[0])
+
+
+async def _add_columns(db, table: str, columns: Dict[str, str]):
+    """Добавить в таблицу отсутствующие колонки (миграция существующей БД)."""
+    async with db.execute(f"PRAGMA table_xinfo({table})") as cursor:
+        existing = {row[1] for row in await cursor.fetchall()}
+    for name, definition in columns.items():
+        if name not in existing:
+            await db.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+
+
+def _date_range(column: str, created_from: Optional[datetime], created_to: Optional[datetime]):
+    conditions = []
+    params = []
+    if created_from is not None:
+        conditions.append(f"{column} >= ?")
+        params.append(created_from.isoformat())
+    if created_to is not None:
+        conditions.append(f"{column} < ?")
+        params.append(created_to.isoformat())
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return where, params
+
+
+def _copy_history(history: Dict[str, Any]) -> Dict[str, Any]:
+    # Строки неизменяемы, копируем только контейнеры, чтобы вызывающий
+    # не мог испортить закэшированное значение
+    return {
+        "session": history["session"],
+        "rounds": list(history["rounds"]),
+        "expertise": list(history["expertise"])
+    }
+
+
+def _encode_cursor(created_at: str, session_id: str) -> str:
+    raw = json.dumps([created_at, session_id], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def _decode_cursor(cursor: str) -> Tuple[str, str]:
+    created_at, session_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    return created_at, session_id
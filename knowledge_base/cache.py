@@ -0,0 +1,89 @@
+﻿"""
+Ограниченный in-process кэш чтений KnowledgeBase по сессиям (LRU + TTL).
+
+Ключ - session_id, внутри хранятся результаты разных запросов по сессии
+(история, факт существования). Запись по сессии сбрасывает всю её
+запись в кэше. Счётчик версий защищает от гонки, когда чтение началось
+до записи, а закончилось после сброса: такой результат в кэш не попадёт.
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+MISSING = object()
+
+
+class SessionCache:
+    """LRU-кэш с ограничением по числу сессий и времени жизни записи."""
+
+    def __init__(self, maxsize: int = 256, ttl: Optional[float] = 30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Dict[str, Tuple[float, Any]]]" = OrderedDict()
+        # Версии сессий, по которым были записи. Таблица ограничена:
+        # для вытесненных сессий версией считается _floor, который не
+        # меньше любой вытесненной версии - проверка остаётся корректной
+        self._versions: "OrderedDict[str, int]" = OrderedDict()
+        self._clock = 0
+        self._floor = 0
+        self._max_versions = max(1024, maxsize * 4)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def version(self, session_id: str) -> int:
+        return self._versions.get(session_id, self._floor)
+
+    def get(self, session_id: str, key: str) -> Any:
+        """Значение из кэша или MISSING."""
+        entry = self._entries.get(session_id)
+        if entry is not None and key in entry:
+            stored_at, value = entry[key]
+            if self.ttl is None or time.monotonic() - stored_at < self.ttl:
+                self._entries.move_to_end(session_id)
+                self.hits += 1
+                return value
+            del entry[key]
+        self.misses += 1
+        return MISSING
+
+    def put(self, session_id: str, key: str, value: Any, version: int):
+        """Сохранить результат чтения, начатого при версии `version`."""
+        if self.maxsize <= 0 or self.version(session_id) != version:
+            return
+        entry = self._entries.get(session_id)
+        if entry is None:
+            entry = self._entries[session_id] = {}
+        entry[key] = (time.monotonic(), value)
+        self._entries.move_to_end(session_id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, session_id: str):
+        """Сбросить всё закэшированное по сессии."""
+        self._clock += 1
+        self._versions[session_id] = self._clock
+        self._versions.move_to_end(session_id)
+        while len(self._versions) > self._max_versions:
+            _, dropped = self._versions.popitem(last=False)
+            self._floor = max(self._floor, dropped)
+        if self._entries.pop(session_id, None) is not None:
+            self.invalidations += 1
+
+    def clear(self):
+        for session_id in list(self._entries):
+            self.invalidate(session_id)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
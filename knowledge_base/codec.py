@@ -0,0 +1,56 @@
+﻿"""
+Кодирование JSON-полей базы знаний.
+
+Колонки config, data, findings и suggestions остаются текстом JSON (по
+ним строятся вычисляемые колонки JSON1), но кодируются через orjson,
+если он установлен: он в несколько раз быстрее json и сразу пишет UTF-8
+без экранирования, как json.dumps(..., ensure_ascii=False).
+
+Результат не зависит от того, установлен ли orjson: нестроковые ключи
+приводятся к строкам (OPT_NON_STR_KEYS), то, чего orjson не умеет
+(целые больше 64 бит), кодируется через json. NaN и бесконечности в
+обоих случаях пишутся как null - JSON1 не принимает их в колонках.
+"""
+import json
+import math
+import re
+from typing import Any
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Целое из 20+ цифр orjson.loads читает как float - такое читает json
+_LONG_INT_RE = re.compile(r"\d{20}")
+
+
+def _finite(value: Any) -> Any:
+    """Копия значения, где NaN и бесконечности заменены на None (как у orjson)"""
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {key: _finite(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_finite(item) for item in value]
+    return value
+
+
+def dumps(value: Any) -> str:
+    if orjson is not None:
+        try:
+            return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+        except TypeError:
+            # Целые больше 64 бит и т.п. - json их умеет
+            pass
+    return json.dumps(_finite(value), ensure_ascii=False)
+
+
+def loads(text) -> Any:
+    if orjson is not None and not (isinstance(text, str) and _LONG_INT_RE.search(text)):
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            # NaN и Infinity, записанные json.dumps до замены на null
+            pass
+    return json.loads(text)
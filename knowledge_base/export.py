@@ -0,0 +1,398 @@
+﻿"""
+Потоковый экспорт и импорт сессий KnowledgeBase.
+
+Экспорт - каталог с файлом на таблицу (sessions, rounds, expertise и
+state - снимки контекста сессий) и manifest.json. Формат: Parquet (если
+установлен pyarrow), иначе JSONL со сжатием zstd (если установлен
+zstandard), иначе JSONL.gz. JSON-поля переносятся строками как есть, без
+разбора; двоичные снимки в JSONL - в base64.
+
+Сессии читаются страницами (keyset-пагинация), строки раундов и
+экспертиз пишутся в том же порядке пачками, поэтому память ограничена
+размером пачки независимо от размера БД. Импорт читает файлы таблиц
+синхронно по пачкам сессий и записывает каждую пачку одной транзакцией;
+уже существующие в БД сессии (и их раунды/экспертизы) пропускаются,
+поэтому повторный импорт того же архива безопасен.
+
+Запуск:
+    python -m knowledge_base.export export data/export --db data/sokrat.db --status completed
+    python -m knowledge_base.export import data/export --db data/other.db
+"""
+import argparse
+import asyncio
+import base64
+import gzip
+import json
+import os
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from . import KnowledgeBase
+
+# Колонки таблиц без вычисляемых (они пересчитываются при вставке)
+COLUMNS = {
+    "sessions": ["id", "task", "config", "created_at", "status"],
+    "rounds": ["session_id", "round_number", "data", "created_at"],
+    "expertise": ["session_id", "round_number", "expert_type", "findings", "suggestions", "score", "created_at", "status"],
+    "state": ["session_id", "kind", "encoding", "payload", "created_at"],
+}
+
+# Двоичные колонки: в JSONL хранятся строкой base64
+BINARY_COLUMNS = {"payload"}
+
+# Значения для колонок, которых нет в экспортах старых версий
+DEFAULTS = {"status": "ok"}
+
+TABLES = {
+    "sessions": "research_sessions",
+    "rounds": "research_rounds",
+    "expertise": "expertise_results",
+    "state": "session_state",
+}
+
+# Порядок строк дочерних таблиц: по сессиям, внутри - в порядке записи
+ORDER = {
+    "rounds": "session_id, round_number, id",
+    "expertise": "session_id, round_number, id",
+    "state": "session_id, id",
+}
+
+FORMATS = ("parquet", "jsonl.zst", "jsonl.gz")
+
+MANIFEST = "manifest.json"
+
+
+def available_formats() -> List[str]:
+    formats = []
+    if pq is not None:
+        formats.append("parquet")
+    if zstandard is not None:
+        formats.append("jsonl.zst")
+    formats.append("jsonl.gz")
+    return formats
+
+
+def default_format() -> str:
+    return available_formats()[0]
+
+
+# --- Файлы одной таблицы ---
+
+def _parquet_schema(table: str):
+    types = {
+        "round_number": pa.int64(),
+        "score": pa.float64(),
+        "payload": pa.binary(),
+    }
+    return pa.schema([(name, types.get(name, pa.string())) for name in COLUMNS[table]])
+
+
+class _TableWriter:
+    """Запись строк таблицы пачками в файл выбранного формата."""
+
+    def __init__(self, path: str, table: str, fmt: str):
+        self.table = table
+        self.fmt = fmt
+        self.rows = 0
+        if fmt == "parquet":
+            self._schema = _parquet_schema(table)
+            self._file = pq.ParquetWriter(path, self._schema, compression="zstd")
+        elif fmt == "jsonl.zst":
+            self._file = zstandard.open(path, "wt", encoding="utf-8")
+        else:
+            self._file = gzip.open(path, "wt", encoding="utf-8")
+
+    def write(self, rows: List[Dict[str, Any]]):
+        if not rows:
+            return
+        if self.fmt == "parquet":
+            self._file.write_table(pa.Table.from_pylist(rows, schema=self._schema))
+        else:
+            self._file.write("".join(json.dumps(_to_json(row), ensure_ascii=False) + "\n" for row in rows))
+        self.rows += len(rows)
+
+    def close(self):
+        self._file.close()
+
+
+def _to_json(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        key: base64.b64encode(value).decode("ascii") if key in BINARY_COLUMNS and value is not None else value
+        for key, value in row.items()
+    }
+
+
+def _from_json(row: Dict[str, Any]) -> Dict[str, Any]:
+    for key in BINARY_COLUMNS & row.keys():
+        if row[key] is not None:
+            row[key] = base64.b64decode(row[key])
+    return row
+
+
+def _iter_rows(path: str, fmt: str, batch_size: int) -> Iterator[Dict[str, Any]]:
+    if not os.path.exists(path):
+        # Таблицы, которой нет в экспортах старых версий (state)
+        return
+    if fmt == "parquet":
+        parquet_file = pq.ParquetFile(path)
+        for batch in parquet_file.iter_batches(batch_size=batch_size):
+            yield from batch.to_pylist()
+        return
+    opener = zstandard.open if fmt == "jsonl.zst" else gzip.open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield _from_json(json.loads(line))
+
+
+class _RowStream:
+    """Поток строк с возможностью заглянуть на одну строку вперёд."""
+
+    def __init__(self, rows: Iterator[Dict[str, Any]]):
+        self._rows = rows
+        self._next: Optional[Dict[str, Any]] = None
+
+    def take(self, n: int) -> List[Dict[str, Any]]:
+        return self.take_while(lambda row: True, n)
+
+    def take_while(self, predicate: Callable[[Dict[str, Any]], bool], limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        result = []
+        while limit is None or len(result) < limit:
+            if self._next is None:
+                self._next = next(self._rows, None)
+                if self._next is None:
+                    break
+            if not predicate(self._next):
+                break
+            result.append(self._next)
+            self._next = None
+        return result
+
+
+def _file_name(table: str, fmt: str) -> str:
+    return f"{table}.{fmt}"
+
+
+# --- Экспорт ---
+
+async def _fetch_rows(kb: KnowledgeBase, table: str, session_ids: List[str]) -> List[Dict[str, Any]]:
+    placeholders = ",".join("?" * len(session_ids))
+    columns = ", ".join(COLUMNS[table])
+    if table == "sessions":
+        # Порядок сессий в пачке совпадает с порядком их раундов/экспертиз
+        sql = f"SELECT {columns} FROM {TABLES[table]} WHERE id IN ({placeholders}) ORDER BY id"
+    else:
+        sql = (
+            f"SELECT {columns} FROM {TABLES[table]} WHERE session_id IN ({placeholders}) "
+            f"ORDER BY {ORDER[table]}"
+        )
+    rows = await kb._fetch_all(sql, session_ids)
+    return [dict(row) for row in rows]
+
+
+async def export_sessions(
+    kb: KnowledgeBase,
+    out_dir: str,
+    fmt: Optional[str] = None,
+    status: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    batch_size: int = 500
+) -> Dict[str, int]:
+    """
+    Экспортировать сессии с раундами, экспертизами и снимками контекста в каталог.
+
+    Args:
+        kb: база знаний-источник
+        out_dir: каталог экспорта (создаётся)
+        fmt: 'parquet', 'jsonl.zst' или 'jsonl.gz' (None - лучший доступный)
+        status: фильтр по статусу сессии
+        created_from, created_to: диапазон дат создания сессий [from, to)
+        batch_size: сессий в пачке
+
+    Returns:
+        Число строк по таблицам
+    """
+    fmt = fmt or default_format()
+    if fmt not in available_formats():
+        raise ValueError(f"Формат {fmt} недоступен, доступны: {', '.join(available_formats())}")
+    os.makedirs(out_dir, exist_ok=True)
+
+    writers = {
+        table: _TableWriter(os.path.join(out_dir, _file_name(table, fmt)), table, fmt)
+        for table in COLUMNS
+    }
+    try:
+        cursor = None
+        while True:
+            page, cursor = await kb.list_sessions(
+                limit=batch_size,
+                cursor=cursor,
+                status=status,
+                created_from=created_from,
+                created_to=created_to
+            )
+            if not page:
+                break
+            session_ids = [row["id"] for row in page]
+            for table, writer in writers.items():
+                rows = await _fetch_rows(kb, table, session_ids)
+                await asyncio.to_thread(writer.write, rows)
+            if cursor is None:
+                break
+    finally:
+        for writer in writers.values():
+            await asyncio.to_thread(writer.close)
+
+    counts = {table: writer.rows for table, writer in writers.items()}
+    manifest = {
+        "format": fmt,
+        "exported_at": datetime.now().isoformat(),
+        "filters": {
+            "status": status,
+            "created_from": created_from.isoformat() if created_from else None,
+            "created_to": created_to.isoformat() if created_to else None,
+        },
+        "counts": counts,
+    }
+    with open(os.path.join(out_dir, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return counts
+
+
+# --- Импорт ---
+
+def _insert_sql(table: str) -> str:
+    columns = COLUMNS[table]
+    return (
+        f"INSERT INTO {TABLES[table]} ({', '.join(columns)}) "
+        f"VALUES ({', '.join('?' * len(columns))})"
+    )
+
+
+async def import_sessions(kb: KnowledgeBase, in_dir: str, batch_size: int = 500) -> Dict[str, int]:
+    """
+    Импортировать каталог экспорта в базу знаний.
+
+    Каждая пачка сессий вместе с их раундами, экспертизами и снимками
+    записывается одной транзакцией. Сессии, которые уже есть в БД,
+    пропускаются целиком.
+
+    Returns:
+        Число вставленных строк по таблицам и пропущенных сессий
+    """
+    with open(os.path.join(in_dir, MANIFEST), encoding="utf-8") as f:
+        fmt = json.load(f)["format"]
+    if fmt not in available_formats():
+        raise ValueError(f"Для импорта формата {fmt} не установлены зависимости")
+
+    await kb._ensure_open()
+    streams = {
+        table: _RowStream(_iter_rows(os.path.join(in_dir, _file_name(table, fmt)), fmt, batch_size))
+        for table in COLUMNS
+    }
+    counts = {table: 0 for table in COLUMNS}
+    counts["skipped_sessions"] = 0
+
+    while True:
+        sessions = await asyncio.to_thread(streams["sessions"].take, batch_size)
+        if not sessions:
+            break
+        batch_ids = {row["id"] for row in sessions}
+        children = {}
+        for table in ORDER:
+            children[table] = await asyncio.to_thread(
+                streams[table].take_while, lambda row: row["session_id"] in batch_ids
+            )
+
+        inserted = await kb._writer().submit(_import_batch_op(sessions, children))
+        for table, n in inserted.items():
+            counts[table] += n
+        counts["skipped_sessions"] += len(sessions) - inserted["sessions"]
+        kb._invalidate(batch_ids)
+    return counts
+
+
+def _import_batch_op(sessions: List[Dict[str, Any]], children: Dict[str, List[Dict[str, Any]]]):
+    async def op(db):
+        ids = [row["id"] for row in sessions]
+        placeholders = ",".join("?" * len(ids))
+        async with db.execute(f"SELECT id FROM research_sessions WHERE id IN ({placeholders})", ids) as cursor:
+            existing = {row[0] for row in await cursor.fetchall()}
+
+        inserted = {}
+        new_sessions = [row for row in sessions if row["id"] not in existing]
+        await db.executemany(
+            _insert_sql("sessions"),
+            [_values("sessions", row) for row in new_sessions]
+        )
+        inserted["sessions"] = len(new_sessions)
+        for table, rows in children.items():
+            rows = [row for row in rows if row["session_id"] not in existing]
+            await db.executemany(_insert_sql(table), [_values(table, row) for row in rows])
+            inserted[table] = len(rows)
+        return inserted
+    return op
+
+
+def _values(table: str, row: Dict[str, Any]) -> tuple:
+    return tuple(row.get(c, DEFAULTS.get(c)) for c in COLUMNS[table])
+
+
+def _parse_date(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+async def _main(args):
+    async with KnowledgeBase(db_path=args.db) as kb:
+        if args.command == "export":
+            counts = await export_sessions(
+                kb,
+                args.path,
+                fmt=args.format,
+                status=args.status,
+                created_from=_parse_date(args.date_from),
+                created_to=_parse_date(args.date_to),
+                batch_size=args.batch_size
+            )
+        else:
+            counts = await import_sessions(kb, args.path, batch_size=args.batch_size)
+    for name, value in counts.items():
+        print(f"{name}: {value}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Экспорт и импорт сессий KnowledgeBase")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Экспорт сессий в каталог")
+    export_parser.add_argument("path", help="Каталог экспорта")
+    export_parser.add_argument("--format", choices=FORMATS, default=None)
+    export_parser.add_argument("--status", default=None)
+    export_parser.add_argument("--from", dest="date_from", default=None, help="Дата создания от (ISO)")
+    export_parser.add_argument("--to", dest="date_to", default=None, help="Дата создания до (ISO, не включая)")
+
+    import_parser = subparsers.add_parser("import", help="Импорт каталога экспорта")
+    import_parser.add_argument("path", help="Каталог экспорта")
+
+    for sub in (export_parser, import_parser):
+        sub.add_argument("--db", default="data/sokrat.db")
+        sub.add_argument("--batch-size", type=int, default=500)
+
+    asyncio.run(_main(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
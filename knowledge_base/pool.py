@@ -0,0 +1,85 @@
+﻿"""
+Пул долгоживущих соединений aiosqlite для чтения.
+
+Соединения открываются один раз и переиспользуются, поэтому не тратится
+время на запуск потока aiosqlite и открытие файла на каждый вызов, а
+скомпилированные запросы остаются в кэше sqlite3 (cached_statements).
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+import aiosqlite
+
+
+class ReaderPool:
+    """
+    Пул соединений только для чтения.
+
+    Пул привязан к event loop, в котором открыт. Соединения закрываются
+    в close() или, если его не вызвали, при остановке event loop
+    (через служебную задачу), иначе потоки aiosqlite не дали бы
+    процессу завершиться.
+    """
+
+    def __init__(self, db_path: str, size: int = 4, cached_statements: int = 128):
+        self.db_path = db_path
+        self.size = size
+        self.cached_statements = cached_statements
+        self._connections: List[aiosqlite.Connection] = []
+        self._idle: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._closing: Optional[asyncio.Event] = None
+        self._keeper: Optional[asyncio.Task] = None
+
+    @property
+    def is_open(self) -> bool:
+        return (
+            self._keeper is not None
+            and not self._keeper.done()
+            and self._loop is asyncio.get_running_loop()
+        )
+
+    async def open(self):
+        if self.is_open:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._idle = asyncio.Queue()
+        self._connections = []
+        for _ in range(self.size):
+            db = await aiosqlite.connect(
+                self.db_path,
+                cached_statements=self.cached_statements
+            )
+            db.row_factory = aiosqlite.Row
+            await db.execute("PRAGMA query_only = ON")
+            self._connections.append(db)
+            self._idle.put_nowait(db)
+        self._closing = asyncio.Event()
+        self._keeper = asyncio.create_task(self._keep())
+
+    async def _keep(self):
+        try:
+            await self._closing.wait()
+        finally:
+            for db in self._connections:
+                await db.close()
+            self._connections = []
+
+    async def close(self):
+        if not self.is_open:
+            return
+        self._closing.set()
+        await self._keeper
+        self._keeper = None
+
+    @asynccontextmanager
+    async def acquire(self):
+        """Взять соединение из пула на время блока."""
+        if not self.is_open:
+            await self.open()
+        db = await self._idle.get()
+        try:
+            yield db
+        finally:
+            self._idle.put_nowait(db)
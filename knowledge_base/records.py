@@ -0,0 +1,54 @@
+﻿"""
+Записи истории сессии для потокового чтения.
+
+JSON-поля строки декодируются только при первом обращении, поэтому
+при обходе большой истории не тратится время на разбор ненужных данных.
+"""
+from functools import cached_property
+from typing import Any, Optional
+
+import aiosqlite
+
+from . import codec
+
+
+class HistoryRecord:
+    """
+    Одна строка истории: сессия, раунд или экспертиза.
+
+    Attributes:
+        kind: 'session', 'round' или 'expertise'
+        row: исходная строка (aiosqlite.Row), доступна по имени и индексу
+    """
+
+    def __init__(self, kind: str, row: aiosqlite.Row):
+        self.kind = kind
+        self.row = row
+
+    def __getitem__(self, key):
+        return self.row[key]
+
+    def __repr__(self) -> str:
+        return f"HistoryRecord(kind={self.kind!r}, id={self.row['id']!r})"
+
+    @property
+    def round_number(self) -> Optional[int]:
+        return None if self.kind == "session" else self.row["round_number"]
+
+    @cached_property
+    def data(self) -> Any:
+        """Данные раунда (research_rounds.data)."""
+        return codec.loads(self.row["data"])
+
+    @cached_property
+    def config(self) -> Any:
+        """Конфигурация сессии (research_sessions.config)."""
+        return codec.loads(self.row["config"])
+
+    @cached_property
+    def findings(self) -> Any:
+        return codec.loads(self.row["findings"])
+
+    @cached_property
+    def suggestions(self) -> Any:
+        return codec.loads(self.row["suggestions"])
@@ -0,0 +1,194 @@
+﻿"""
+Локальный индекс похожести прошлых сессий (hashing vectorizer + TF-IDF).
+
+У сессии два индексируемых поля: 'task' (задача и промпт) и 'synthesis'
+(итоговый синтез) - поиск идёт по одному из них, чтобы длинный синтез
+не размывал близость коротких формулировок задач. Текст разбивается на
+слова и пары слов, которые хешируются в пространство фиксированной
+размерности - словарь хранить не нужно, документы добавляются по одному.
+IDF пересчитывается из счётчиков документной частоты при каждом поиске,
+косинусная близость считается NumPy сразу по всем документам. Сеть и
+внешние сервисы не используются.
+"""
+import re
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+FIELDS = ("task", "synthesis")
+
+
+def _tokens(text: str) -> List[str]:
+    words = _TOKEN_RE.findall(text.lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class _Document:
+    __slots__ = ("task", "prompt", "synthesis", "quality_score", "vectors")
+
+    def __init__(self, task: str, prompt: str):
+        self.task = task
+        self.prompt = prompt
+        self.synthesis: Optional[str] = None
+        self.quality_score: Optional[float] = None
+        # Поле -> (индексы, веса) разреженного вектора
+        self.vectors: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+    def text(self, field: str) -> str:
+        if field == "task":
+            return f"{self.task}\n{self.prompt}"
+        return self.synthesis or ""
+
+
+class SimilarityIndex:
+    """
+    Инкрементальный индекс похожести сессий.
+
+    Вектор поля - частоты хешированных токенов (sublinear tf), при
+    поиске умножаются на текущий IDF поля. Упакованные массивы всех
+    документов перестраиваются лениво, только после изменений.
+    """
+
+    def __init__(self, n_features: int = 2 ** 18):
+        self.n_features = n_features
+        self._docs: Dict[str, _Document] = {}
+        self._df = {field: np.zeros(n_features, dtype=np.int32) for field in FIELDS}
+        self._packed: Dict[str, Tuple[List[str], np.ndarray, np.ndarray, np.ndarray]] = {}
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._docs
+
+    def _hash(self, text: str) -> Dict[int, int]:
+        counts: Dict[int, int] = {}
+        for token in _tokens(text):
+            index = zlib.crc32(token.encode("utf-8")) % self.n_features
+            counts[index] = counts.get(index, 0) + 1
+        return counts
+
+    def _vectorize(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        counts = self._hash(text)
+        indices = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        values = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+        return indices, (1.0 + np.log(values)).astype(np.float32)
+
+    def _unindex(self, doc: _Document):
+        for field, (indices, _) in doc.vectors.items():
+            self._df[field][indices] -= 1
+
+    def _reindex(self, session_id: str, doc: _Document):
+        old = self._docs.get(session_id)
+        if old is not None:
+            self._unindex(old)
+        for field in FIELDS:
+            doc.vectors[field] = self._vectorize(doc.text(field))
+            self._df[field][doc.vectors[field][0]] += 1
+        self._docs[session_id] = doc
+        self._packed = {}
+
+    def add_session(self, session_id: str, task: str, prompt: str = ""):
+        """Добавить (или обновить) задачу и промпт сессии."""
+        doc = _Document(task, prompt or "")
+        old = self._docs.get(session_id)
+        if old is not None:
+            doc.synthesis, doc.quality_score = old.synthesis, old.quality_score
+        self._reindex(session_id, doc)
+
+    def set_result(self, session_id: str, synthesis: Optional[str], quality_score: Optional[float]):
+        """Записать итоговый синтез и оценку сессии."""
+        doc = self._docs.get(session_id)
+        if doc is None:
+            return
+        updated = _Document(doc.task, doc.prompt)
+        updated.synthesis = synthesis
+        updated.quality_score = quality_score
+        self._reindex(session_id, updated)
+
+    def remove(self, session_id: str):
+        doc = self._docs.pop(session_id, None)
+        if doc is not None:
+            self._unindex(doc)
+            self._packed = {}
+
+    def _pack(self, field: str):
+        if field not in self._packed:
+            ids = [sid for sid, doc in self._docs.items() if len(doc.vectors[field][0])]
+            vectors = [self._docs[sid].vectors[field] for sid in ids]
+            if vectors:
+                lengths = np.array([len(indices) for indices, _ in vectors], dtype=np.int64)
+                offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+                indices = np.concatenate([indices for indices, _ in vectors])
+                weights = np.concatenate([weights for _, weights in vectors])
+            else:
+                offsets = indices = np.empty(0, dtype=np.int64)
+                weights = np.empty(0, dtype=np.float32)
+            self._packed[field] = (ids, offsets, indices, weights)
+        return self._packed[field]
+
+    def search(
+        self,
+        text: str,
+        limit: int = 5,
+        min_similarity: float = 0.0,
+        min_quality: Optional[float] = None,
+        field: str = "task"
+    ) -> List[Dict[str, Any]]:
+        """
+        Найти сессии, похожие на текст.
+
+        Args:
+            text: текст запроса
+            limit: сколько результатов вернуть
+            min_similarity: порог косинусной близости (совпадения с
+                нулевой близостью не возвращаются никогда)
+            min_quality: только сессии с итоговой оценкой не ниже
+            field: 'task' - по задаче и промпту, 'synthesis' - по синтезу
+
+        Returns:
+            Список словарей session_id, similarity, task, synthesis,
+            quality_score - от самых похожих
+        """
+        if field not in FIELDS:
+            raise ValueError(f"Неизвестное поле: {field}")
+        ids, offsets, indices, weights = self._pack(field)
+        if not ids:
+            return []
+
+        n_docs = len(self._docs)
+        idf = (np.log((1.0 + n_docs) / (1.0 + self._df[field])) + 1.0).astype(np.float32)
+
+        query = np.zeros(self.n_features, dtype=np.float32)
+        for index, value in self._hash(text).items():
+            query[index] = (1.0 + np.log(value)) * idf[index]
+        query_norm = np.linalg.norm(query)
+        if query_norm == 0:
+            return []
+
+        doc_weights = weights * idf[indices]
+        norms = np.sqrt(np.add.reduceat(doc_weights * doc_weights, offsets))
+        dots = np.add.reduceat(doc_weights * query[indices], offsets)
+        similarity = dots / (norms * query_norm)
+
+        results = []
+        for i in np.argsort(-similarity):
+            score = float(similarity[i])
+            if score <= 0 or score < min_similarity:
+                break
+            doc = self._docs[ids[i]]
+            if min_quality is not None and (doc.quality_score is None or doc.quality_score < min_quality):
+                continue
+            results.append({
+                "session_id": ids[i],
+                "similarity": score,
+                "task": doc.task,
+                "synthesis": doc.synthesis,
+                "quality_score": doc.quality_score,
+            })
+            if len(results) >= limit:
+                break
+        return results
@@ -0,0 +1,236 @@
+﻿"""
+Единственный писатель для файла SQLite (single-writer actor).
+
+Владеет одним соединением и принимает операции записи через
+asyncio.Queue. Операции, накопившиеся в очереди, выполняются одной
+транзакцией (group commit); каждый вызывающий ждёт свой результат.
+
+GroupCommitWriter - общая реализация очереди и групповых коммитов,
+не зависящая от драйвера. SQLiteWriter - писатель Базы Знаний на
+aiosqlite; писатель Sokrat Core (src.db.writer) - на SQLAlchemy.
+"""
+import asyncio
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+WriteOp = Callable[[Any], Awaitable[Any]]
+
+
+class GroupCommitWriter:
+    """
+    Очередь операций записи и групповые коммиты.
+
+    Операция - корутина-функция, принимающая то, что подкласс передаёт
+    в _apply (соединение или сессию). Если пачка падает, транзакция
+    откатывается и операции повторяются по одной, чтобы ошибка одного
+    вызывающего не затрагивала остальных.
+
+    Подкласс задаёт работу с драйвером:
+        _connect()         - открыть соединение писателя;
+        _close(conn)       - закрыть его;
+        _apply(conn, ops)  - выполнить ops одной транзакцией и вернуть
+                             их результаты; при ошибке - откатить
+                             и пробросить исключение;
+        _committed(count)  - после каждого коммита (метрики).
+    """
+
+    def __init__(self, max_batch: int = 64):
+        self.max_batch = max_batch
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.batches = 0
+        self.operations = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    @property
+    def running(self) -> bool:
+        return (
+            self._task is not None
+            and not self._task.done()
+            and self._loop is asyncio.get_running_loop()
+        )
+
+    async def start(self):
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Записать всё из очереди и закрыть соединение."""
+        if not self.running:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def submit(self, op: WriteOp) -> Any:
+        """Поставить операцию в очередь и дождаться коммита."""
+        if not self.running:
+            await self.start()
+        future = self._loop.create_future()
+        await self._queue.put((op, future))
+        return await future
+
+    async def _connect(self) -> Any:
+        raise NotImplementedError
+
+    async def _close(self, conn: Any):
+        raise NotImplementedError
+
+    async def _apply(self, conn: Any, ops: List[WriteOp]) -> List[Any]:
+        raise NotImplementedError
+
+    def _committed(self, count: int):
+        pass
+
+    async def _run(self):
+        error: BaseException = RuntimeError("Писатель остановлен")
+        try:
+            # Соединение закрывается в finally, в том числе когда задачу
+            # отменяют при остановке event loop (иначе поток aiosqlite
+            # не даст интерпретатору завершиться)
+            conn = await self._connect()
+            try:
+                stopping = False
+                # После стоп-сигнала дописываем и то, что поставили за ним
+                while not (stopping and self._queue.empty()):
+                    item = await self._queue.get()
+                    batch: List[Tuple[WriteOp, asyncio.Future]] = []
+                    if item is None:
+                        stopping = True
+                    else:
+                        batch.append(item)
+                    # Забираем всё, что успело накопиться
+                    while len(batch) < self.max_batch and not self._queue.empty():
+                        item = self._queue.get_nowait()
+                        if item is None:
+                            stopping = True
+                            continue
+                        batch.append(item)
+                    if batch:
+                        try:
+                            await self._commit_batch(conn, batch)
+                        except BaseException:
+                            # Откат не удался или задачу отменили посреди пачки
+                            for _, fut in batch:
+                                self._settle(fut, error=RuntimeError("Запись прервана: писатель упал"))
+                            raise
+            finally:
+                await self._close(conn)
+        except Exception as e:
+            # Вызывающие получают ошибку через свои future
+            error = e
+            logger.error("Писатель %s упал: %s", self, e)
+        finally:
+            # Без этого ждущие submit() повиснут навсегда. Шаг без await:
+            # после него новые операции уже не попадут в эту очередь
+            self._fail_pending(error)
+
+    def _fail_pending(self, error: BaseException):
+        """Завершить ошибкой операции, оставшиеся в очереди остановившегося писателя"""
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not None:
+                self._settle(item[1], error=error)
+
+    async def _commit_batch(self, conn, batch):
+        pending = [(op, fut) for op, fut in batch if not fut.cancelled()]
+        if not pending:
+            return
+        try:
+            results = await self._apply(conn, [op for op, _ in pending])
+        except Exception as e:
+            if len(pending) == 1:
+                self._settle(pending[0][1], error=e)
+                return
+            logger.warning("Групповая запись не удалась (%s), повтор по одной", e)
+            for item in pending:
+                await self._commit_batch(conn, [item])
+            return
+
+        self.batches += 1
+        self.operations += len(pending)
+        self._committed(len(pending))
+        for (_, fut), result in zip(pending, results):
+            self._settle(fut, result=result)
+
+    @staticmethod
+    def _settle(fut: asyncio.Future, result: Any = None, error: Exception = None):
+        if fut.done():
+            return
+        if error is not None:
+            fut.set_exception(error)
+        else:
+            fut.set_result(result)
+
+
+class SQLiteWriter(GroupCommitWriter):
+    """Писатель Базы Знаний: операции получают соединение aiosqlite."""
+
+    def __init__(self, db_path: str, max_batch: int = 64):
+        super().__init__(max_batch)
+        self.db_path = db_path
+
+    def __repr__(self) -> str:
+        return f"SQLiteWriter({self.db_path!r})"
+
+    async def execute(self, sql: str, params: tuple = ()) -> int:
+        """Выполнить один запрос записи. Возвращает rowcount."""
+        async def op(db):
+            cursor = await db.execute(sql, params)
+            return cursor.rowcount
+        return await self.submit(op)
+
+    async def _connect(self) -> aiosqlite.Connection:
+        db = await aiosqlite.connect(self.db_path)
+        try:
+            # WAL: читатели не блокируются писателем и наоборот
+            await db.execute("PRAGMA journal_mode=WAL")
+            await db.execute("PRAGMA synchronous=NORMAL")
+        except BaseException:
+            await db.close()
+            raise
+        return db
+
+    async def _close(self, db: aiosqlite.Connection):
+        await db.close()
+
+    async def _apply(self, db: aiosqlite.Connection, ops: List[WriteOp]) -> List[Any]:
+        try:
+            results = [await op(db) for op in ops]
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+        return results
+
+
+_writers: Dict[Tuple[str, int], SQLiteWriter] = {}
+
+
+def get_writer(db_path: str) -> SQLiteWriter:
+    """
+    Писатель для файла БД: один на файл в рамках event loop,
+    общий для всех KnowledgeBase с этим путём.
+    """
+    loop = asyncio.get_running_loop()
+    key = (os.path.abspath(db_path), id(loop))
+    writer = _writers.get(key)
+    if writer is None or (writer._loop is not None and writer._loop.is_closed()):
+        # Писатели закрытых циклов больше не нужны
+        for stale_key in [k for k, w in _writers.items() if w._loop is not None and w._loop.is_closed()]:
+            del _writers[stale_key]
+        writer = SQLiteWriter(db_path)
+        _writers[key] = writer
+    return writer
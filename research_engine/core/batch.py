@@ -0,0 +1,319 @@
+﻿"""
+Пакетный запуск исследований.
+
+Задачи читаются из JSONL (одна строка - поля SessionContext плюс
+необязательный "id") потоково и выполняются пулом воркеров поверх
+одного оркестратора, то есть одной базы знаний с её пулом соединений и
+одного LLM-клиента. Результат каждой задачи сразу дописывается строкой
+в выходной JSONL; при повторном запуске с тем же выходным файлом
+успешно выполненные задачи пропускаются, упавшие - выполняются снова.
+
+С --llm этапы вызывают модели через общий LLMClient Sokrat Core (модуль
+src.core.llm; ключ OPENROUTER_API_KEY и настройки пула - из его config),
+без флага - тестовые заглушки оркестратора. Каталог sokrat_core должен
+быть в пути импорта (PYTHONPATH), как при запуске самого Sokrat Core.
+
+Запуск:
+    python -m research_engine.core.batch tasks.jsonl --out results.jsonl --concurrency 8
+    PYTHONPATH=sokrat_core python -m research_engine.core.batch tasks.jsonl --llm
+"""
+import argparse
+import asyncio
+import json
+import logging
+import importlib
+import os
+import time
+from typing import Any, Dict, Iterator, Optional, Set, Tuple
+
+from pydantic import BaseModel, ValidationError
+
+from .models import SessionContext
+from .orchestrator import ResearchOrchestrator
+
+logger = logging.getLogger(__name__)
+
+
+class BatchReport(BaseModel):
+    """Итог пакетного запуска"""
+    total: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    skipped: int = 0
+    retries: int = 0
+    elapsed_s: float = 0.0
+
+    @property
+    def done(self) -> int:
+        return self.succeeded + self.failed
+
+    @property
+    def throughput(self) -> float:
+        """Задач в секунду"""
+        return self.done / self.elapsed_s if self.elapsed_s else 0.0
+
+
+def read_tasks(path: str) -> Iterator[Tuple[str, Optional[Dict[str, Any]], Optional[str]]]:
+    """
+    Задачи из JSONL: тройки (id, поля, ошибка). Без "id" идентификатор -
+    номер строки. Строка, которая не разбирается как JSON-объект, не
+    прерывает чтение: для неё поля - None, а ошибка - описание с номером строки.
+    """
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield str(line_no), None, f"Строка {line_no}: некорректный JSON: {e}"
+                continue
+            if not isinstance(item, dict):
+                yield str(line_no), None, f"Строка {line_no}: ожидается JSON-объект, получен {type(item).__name__}"
+                continue
+            yield str(item.pop("id", line_no)), item, None
+
+
+def completed_ids(output_path: str) -> Set[str]:
+    """Идентификаторы задач, успешно выполненных по выходному файлу"""
+    done: Set[str] = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Последняя строка могла оборваться при падении процесса
+                continue
+            if record.get("status") == "ok":
+                done.add(record["id"])
+            else:
+                done.discard(record["id"])
+    return done
+
+
+class BatchRunner:
+    """
+    Пул воркеров над одним оркестратором.
+
+    Очередь задач ограничена, поэтому файл любого размера читается
+    постепенно и в памяти одновременно не больше ~2 * concurrency задач.
+    """
+
+    def __init__(
+        self,
+        orchestrator: ResearchOrchestrator,
+        concurrency: int = 8,
+        retries: int = 1,
+        retry_delay: float = 1.0,
+        progress_interval: float = 10.0
+    ):
+        """
+        Args:
+            orchestrator: общий оркестратор (его БЗ и LLM-клиент)
+            concurrency: сколько сессий выполняется одновременно
+            retries: повторов упавшей задачи (с новой сессией)
+            retry_delay: пауза перед повтором, удваивается с каждой попыткой
+            progress_interval: как часто писать прогресс в лог, секунды
+        """
+        self.orchestrator = orchestrator
+        self.concurrency = concurrency
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.progress_interval = progress_interval
+        self.report = BatchReport()
+
+    async def run(self, tasks_path: str, output_path: str, resume: bool = True) -> BatchReport:
+        """
+        Выполнить задачи из JSONL, дописывая результаты в output_path.
+
+        Args:
+            resume: пропустить задачи, уже успешно выполненные по output_path
+        """
+        skip = completed_ids(output_path) if resume else set()
+        self.report = BatchReport(total=sum(1 for _ in read_tasks(tasks_path)))
+        started = time.monotonic()
+
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        out = open(output_path, "a" if resume else "w", encoding="utf-8")
+        progress = asyncio.create_task(self._progress(started))
+        workers = [asyncio.create_task(self._worker(queue, out)) for _ in range(self.concurrency)]
+        try:
+            for task_id, fields, error in read_tasks(tasks_path):
+                if task_id in skip:
+                    self.report.skipped += 1
+                    continue
+                if error is not None:
+                    logger.warning("Задача %s: %s", task_id, error)
+                    self._write_record(out, _failed(task_id, error, attempts=0))
+                    continue
+                await queue.put((task_id, fields))
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            progress.cancel()
+            out.close()
+
+        self.report.elapsed_s = time.monotonic() - started
+        self._log_progress()
+        return self.report
+
+    async def _worker(self, queue: asyncio.Queue, out):
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            task_id, fields = item
+            self._write_record(out, await self._run_one(task_id, fields))
+
+    def _write_record(self, out, record: Dict[str, Any]):
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        out.flush()
+        if record["status"] == "ok":
+            self.report.succeeded += 1
+        else:
+            self.report.failed += 1
+
+    async def _run_one(self, task_id: str, fields: Dict[str, Any]) -> Dict[str, Any]:
+        started = time.monotonic()
+        try:
+            SessionContext(**fields)
+        except ValidationError as e:
+            # Ошибка в самой задаче: повтор даст тот же результат
+            logger.warning("Задача %s: некорректные поля: %s", task_id, e)
+            return _failed(task_id, str(e), attempts=1, elapsed_s=time.monotonic() - started)
+
+        error: Optional[str] = None
+        context: Optional[SessionContext] = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.report.retries += 1
+                await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1))
+            try:
+                # Новая сессия на каждую попытку
+                context = SessionContext(**fields)
+                context = await self.orchestrator.run(context)
+                return {
+                    "id": task_id,
+                    "status": "ok",
+                    "session_id": context.session_id,
+                    "quality_score": context.quality_score,
+                    "rounds": context.current_round,
+                    "stop_reason": context.stop_reason,
+                    "reused_from": context.reused_from,
+                    "final_synthesis": context.final_synthesis,
+                    "attempts": attempt + 1,
+                    "elapsed_s": round(time.monotonic() - started, 3),
+                }
+            except Exception as e:
+                error = str(e)
+                logger.warning("Задача %s, попытка %s/%s: %s", task_id, attempt + 1, self.retries + 1, error)
+        return _failed(
+            task_id,
+            error,
+            attempts=self.retries + 1,
+            session_id=context.session_id if context else None,
+            elapsed_s=time.monotonic() - started
+        )
+
+    async def _progress(self, started: float):
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            self.report.elapsed_s = time.monotonic() - started
+            self._log_progress()
+
+    def _log_progress(self):
+        r = self.report
+        logger.info(
+            " Прогресс: %d/%d (успешно %d, ошибок %d, пропущено %d), %.2f задач/с",
+            r.done + r.skipped, r.total, r.succeeded, r.failed, r.skipped, r.throughput
+        )
+
+
+def _failed(
+    task_id: str,
+    error: Optional[str],
+    attempts: int,
+    session_id: Optional[str] = None,
+    elapsed_s: float = 0.0
+) -> Dict[str, Any]:
+    """Запись о неуспешной задаче для выходного JSONL"""
+    return {
+        "id": task_id,
+        "status": "failed",
+        "session_id": session_id,
+        "error": error,
+        "attempts": attempts,
+        "elapsed_s": round(elapsed_s, 3),
+    }
+
+
+LLM_MODULE = "src.core.llm"
+
+
+def _llm_module():
+    """Модуль общего клиента LLM Sokrat Core"""
+    try:
+        return importlib.import_module(LLM_MODULE)
+    except ImportError as e:
+        raise SystemExit(f"--llm: не удалось импортировать {LLM_MODULE} ({e}); добавьте sokrat_core в PYTHONPATH")
+
+
+async def _main(args):
+    from knowledge_base import KnowledgeBase
+
+    # Один клиент на весь запуск: общий пул соединений и лимит запросов
+    llm = _llm_module() if args.llm else None
+    llm_client = llm.get_llm_client() if llm else None
+    async with KnowledgeBase(db_path=args.db, pool_size=args.pool_size) as kb:
+        orchestrator = ResearchOrchestrator(llm_client=llm_client, kb_client=kb, round_timeout=args.round_timeout)
+        if args.resume_active:
+            # Сессии, прерванные прошлым запуском, - до новых задач
+            resumed = await orchestrator.resume_active_sessions(concurrency=args.concurrency)
+            print(f"Возобновлено прерванных сессий: {len(resumed)}")
+        runner = BatchRunner(
+            orchestrator,
+            concurrency=args.concurrency,
+            retries=args.retries,
+            progress_interval=args.progress_interval
+        )
+        try:
+            report = await runner.run(args.tasks, args.out, resume=not args.no_resume)
+        finally:
+            # Дописать фоновые чекпоинты до закрытия БЗ
+            await orchestrator.close()
+            if llm:
+                await llm.close_llm_client()
+
+    print(
+        f"Готово: {report.succeeded} успешно, {report.failed} с ошибкой, "
+        f"{report.skipped} пропущено за {report.elapsed_s:.1f} с ({report.throughput:.2f} задач/с)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пакетный запуск исследований из JSONL")
+    parser.add_argument("tasks", help="JSONL с задачами (поля SessionContext и необязательный id)")
+    parser.add_argument("--out", default="results.jsonl", help="JSONL с результатами")
+    parser.add_argument("--db", default="data/sokrat.db")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--retries", type=int, default=1)
+    parser.add_argument("--pool-size", type=int, default=4)
+    parser.add_argument("--round-timeout", type=float, default=None)
+    parser.add_argument("--llm", action="store_true", help="Вызывать модели через LLMClient из sokrat_core (иначе заглушки)")
+    parser.add_argument("--progress-interval", type=float, default=10.0)
+    parser.add_argument("--no-resume", action="store_true", help="Перезаписать выходной файл и выполнить всё заново")
+    parser.add_argument("--resume-active", action="store_true", help="Сначала возобновить прерванные сессии (status='active')")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    main()
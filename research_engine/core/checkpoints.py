@@ -0,0 +1,142 @@
+﻿"""
+Фоновая запись чекпоинтов (write-behind).
+
+Записи в базу знаний ставятся в ограниченную очередь и выполняются
+фоновыми воркерами, пока оркестратор продолжает работу с моделями.
+Очередь разбита на шарды по session_id: записи одной сессии выполняются
+строго по порядку, записи разных сессий - параллельно (писатель БЗ
+объединяет их в групповые коммиты).
+
+Уровни надёжности (durability):
+    'sync'  - запись выполняется сразу, этап ждёт её завершения;
+    'stage' - запись уходит в фон, но перед записью следующего этапа
+              сессии предыдущие записи должны завершиться: при сбое
+              теряется не больше одного этапа;
+    'async' - запись уходит в фон, ожидание только в конце сессии.
+В любом режиме сессия дожидается своих записей при завершении, а
+close() дописывает очередь при остановке.
+"""
+import asyncio
+import contextvars
+import logging
+import time
+import zlib
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+DURABILITY_LEVELS = ("sync", "stage", "async")
+
+WriteFunc = Callable[[], Awaitable[Any]]
+
+
+class CheckpointQueue:
+    """
+    Ограниченная очередь фоновых записей с метриками отставания.
+
+    Когда очередь заполнена, submit() ждёт свободного места - так
+    запись не отстаёт от вычислений неограниченно.
+    """
+
+    def __init__(self, maxsize: int = 1000, workers: int = 4):
+        self.maxsize = maxsize
+        self.workers = workers
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queues: List[asyncio.Queue] = []
+        self._tasks: List[asyncio.Task] = []
+        # Незавершённые записи по сессиям: для flush() и метрики отставания
+        self._pending: Dict[str, Set[asyncio.Future]] = {}
+        self._enqueued_at: Dict[asyncio.Future, float] = {}
+        self.written = 0
+        self.failed = 0
+        self.max_lag_s = 0.0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks) and self._loop is asyncio.get_running_loop()
+
+    def _start(self):
+        self._loop = asyncio.get_running_loop()
+        shard_size = max(1, self.maxsize // self.workers)
+        self._queues = [asyncio.Queue(maxsize=shard_size) for _ in range(self.workers)]
+        # Воркеры стартуют в пустом контексте, чтобы не унаследовать
+        # ContextVar вызывающего (например, открытую транзакцию БЗ)
+        self._tasks = [
+            contextvars.Context().run(asyncio.create_task, self._worker(queue))
+            for queue in self._queues
+        ]
+        self._pending = {}
+        self._enqueued_at = {}
+
+    @property
+    def depth(self) -> int:
+        """Записей в очереди и в работе"""
+        return len(self._enqueued_at)
+
+    @property
+    def lag_s(self) -> float:
+        """Возраст самой старой незавершённой записи, секунды"""
+        if not self._enqueued_at:
+            return 0.0
+        return time.monotonic() - min(self._enqueued_at.values())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "depth": self.depth,
+            "lag_s": self.lag_s,
+            "max_lag_s": self.max_lag_s,
+            "written": self.written,
+            "failed": self.failed,
+        }
+
+    async def submit(self, session_id: str, write: WriteFunc) -> asyncio.Future:
+        """Поставить запись в очередь. Возвращает future её завершения."""
+        if not self.running:
+            self._start()
+        future = self._loop.create_future()
+        self._pending.setdefault(session_id, set()).add(future)
+        self._enqueued_at[future] = time.monotonic()
+        shard = self._queues[zlib.crc32(session_id.encode("utf-8")) % len(self._queues)]
+        await shard.put((session_id, write, future))
+        return future
+
+    async def flush(self, session_id: Optional[str] = None):
+        """Дождаться записей сессии (или всех), поставленных к этому моменту."""
+        if not self.running:
+            return
+        if session_id is None:
+            futures = [f for pending in self._pending.values() for f in pending]
+        else:
+            futures = list(self._pending.get(session_id, ()))
+        if futures:
+            await asyncio.wait(futures)
+
+    async def close(self):
+        """Дописать очередь и остановить воркеров."""
+        if not self.running:
+            return
+        await self.flush()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            session_id, write, future = await queue.get()
+            try:
+                await write()
+                self.written += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error("Ошибка фоновой записи чекпоинта сессии %s: %s", session_id, e)
+            finally:
+                lag = time.monotonic() - self._enqueued_at.pop(future, time.monotonic())
+                self.max_lag_s = max(self.max_lag_s, lag)
+                pending = self._pending.get(session_id)
+                if pending is not None:
+                    pending.discard(future)
+                    if not pending:
+                        del self._pending[session_id]
+                if not future.done():
+                    future.set_result(None)
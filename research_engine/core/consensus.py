@@ -0,0 +1,86 @@
+﻿"""
+Локальное определение консенсуса в круге обсуждения (без вызова LLM).
+
+Ответ модели разбивается на шинглы - последовательности из shingle_size
+слов, - которые хешируются crc32 в массив NumPy. Близость двух ответов -
+коэффициент Жаккара множеств шинглов. Консенсус достигнут, если все пары
+ответов не менее похожи, чем threshold; лучший ответ - медоид, то есть
+ответ с наибольшей средней близостью к остальным.
+
+NumPy импортируется при первом сравнении, а не при импорте модуля:
+оркестратор создаёт детектор всегда, а сессии без обсуждения его не вызывают.
+"""
+import re
+import zlib
+from typing import TYPE_CHECKING, Dict, Optional
+
+from pydantic import BaseModel
+
+if TYPE_CHECKING:
+    import numpy as np
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+class Consensus(BaseModel):
+    """Итог сравнения ответов круга"""
+    reached: bool = False
+    agreement: float = 0.0  # минимальная попарная близость
+    best_model: Optional[str] = None
+    best_response: Optional[str] = None
+
+
+def shingles(text: str, size: int = 3) -> "np.ndarray":
+    """Отсортированные уникальные хеши шинглов текста"""
+    import numpy as np
+    words = _TOKEN_RE.findall(text.lower())
+    # Короткий ответ - один шингл из всех слов
+    size = min(size, len(words)) or 1
+    hashes = [
+        zlib.crc32(" ".join(words[i:i + size]).encode("utf-8"))
+        for i in range(len(words) - size + 1)
+    ]
+    return np.unique(np.array(hashes, dtype=np.uint32))
+
+
+def jaccard(a: "np.ndarray", b: "np.ndarray") -> float:
+    import numpy as np
+    if not len(a) and not len(b):
+        return 1.0
+    common = len(np.intersect1d(a, b, assume_unique=True))
+    return common / (len(a) + len(b) - common)
+
+
+class ConsensusDetector:
+    """Сравнение ответов моделей по шинглам"""
+
+    def __init__(self, threshold: float = 0.8, shingle_size: int = 3):
+        """
+        Args:
+            threshold: минимальная близость каждой пары ответов (0..1)
+            shingle_size: слов в шингле
+        """
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+
+    def check(self, responses: Dict[str, str]) -> Consensus:
+        """Консенсус и лучший ответ круга. Меньше двух ответов - не консенсус."""
+        if not responses:
+            return Consensus()
+        import numpy as np
+        models = list(responses)
+        sets = [shingles(responses[model], self.shingle_size) for model in models]
+        n = len(models)
+        similarity = np.eye(n)
+        for i in range(n):
+            for j in range(i + 1, n):
+                similarity[i, j] = similarity[j, i] = jaccard(sets[i], sets[j])
+
+        agreement = float(similarity[np.triu_indices(n, 1)].min()) if n > 1 else 0.0
+        best = int(similarity.sum(axis=1).argmax())
+        return Consensus(
+            reached=n > 1 and agreement >= self.threshold,
+            agreement=agreement,
+            best_model=models[best],
+            best_response=responses[models[best]]
+        )
@@ -0,0 +1,211 @@
+﻿"""
+Реестр экспертов Research Engine.
+
+Эксперт - корутина-функция content -> ExpertiseResult, зарегистрированная
+по имени со своим таймаутом, числом повторов и приоритетом. Раунд
+экспертизы запускает всех экспертов реестра: одновременно работающих
+ограничивает общий для реестра лимитер, эксперты стартуют в порядке
+приоритета, а не успевшие к дедлайну раунда отменяются. Неуспешные и
+отменённые эксперты не роняют раунд - их результат помечается статусом.
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional
+
+from pydantic import BaseModel
+
+from .models import ExpertiseResult
+from .tracing import NOOP_TRACER
+
+logger = logging.getLogger(__name__)
+
+ExpertFunc = Callable[[str], Awaitable[ExpertiseResult]]
+
+
+class ExpertSpec(BaseModel):
+    """Параметры запуска эксперта"""
+    name: str
+    func: ExpertFunc
+    timeout: Optional[float] = 60.0  # на одну попытку, None - без ограничения
+    retries: int = 0  # повторов после ошибки или таймаута
+    retry_delay: float = 0.5
+    priority: int = 0  # больше - раньше получает слот лимитера
+
+
+class ExpertRegistry:
+    """
+    Реестр экспертов с лимитом одновременных запусков.
+
+        registry = ExpertRegistry(max_concurrency=4)
+
+        @registry.register("security", timeout=20, retries=1)
+        async def security_expert(content): ...
+    """
+
+    def __init__(self, max_concurrency: Optional[int] = None):
+        """
+        Args:
+            max_concurrency: сколько экспертов может работать одновременно
+                (во всех раундах, идущих через этот реестр); None - без лимита
+        """
+        self.max_concurrency = max_concurrency
+        self._experts: Dict[str, ExpertSpec] = {}
+        self._limiter: Optional[asyncio.Semaphore] = None
+        self._limiter_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def register(
+        self,
+        name: str,
+        func: Optional[ExpertFunc] = None,
+        *,
+        timeout: Optional[float] = 60.0,
+        retries: int = 0,
+        retry_delay: float = 0.5,
+        priority: int = 0
+    ):
+        """
+        Зарегистрировать эксперта (повторная регистрация заменяет его).
+        Без func возвращает декоратор.
+        """
+        def add(f: ExpertFunc) -> ExpertFunc:
+            self._experts[name] = ExpertSpec(
+                name=name,
+                func=f,
+                timeout=timeout,
+                retries=retries,
+                retry_delay=retry_delay,
+                priority=priority
+            )
+            return f
+
+        if func is None:
+            return add
+        return add(func)
+
+    def unregister(self, name: str):
+        self._experts.pop(name, None)
+
+    def get(self, name: str) -> Optional[ExpertSpec]:
+        return self._experts.get(name)
+
+    def __getitem__(self, name: str) -> ExpertFunc:
+        return self._experts[name].func
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._experts
+
+    def __len__(self) -> int:
+        return len(self._experts)
+
+    def __iter__(self) -> Iterator[ExpertSpec]:
+        """Эксперты по убыванию приоритета (при равном - по порядку регистрации)"""
+        return iter(sorted(self._experts.values(), key=lambda spec: -spec.priority))
+
+    def names(self) -> List[str]:
+        return [spec.name for spec in self]
+
+    def _get_limiter(self) -> Optional[asyncio.Semaphore]:
+        if not self.max_concurrency:
+            return None
+        loop = asyncio.get_running_loop()
+        if self._limiter is None or self._limiter_loop is not loop:
+            self._limiter = asyncio.Semaphore(self.max_concurrency)
+            self._limiter_loop = loop
+        return self._limiter
+
+    async def run(self, content: str, round_timeout: Optional[float] = None, tracer=None) -> List[ExpertiseResult]:
+        """
+        Запустить всех экспертов по содержимому.
+
+        Args:
+            content: что оценивать
+            round_timeout: дедлайн раунда в секундах; эксперты, не
+                успевшие к нему, отменяются и получают статус 'cancelled'
+            tracer: трассировщик (спан 'expert' на каждого эксперта)
+
+        Returns:
+            Результаты в порядке реестра, по одному на эксперта
+        """
+        specs = list(self)
+        deadline = time.monotonic() + round_timeout if round_timeout is not None else None
+        limiter = self._get_limiter()
+        tracer = tracer or NOOP_TRACER
+        tasks = [
+            asyncio.create_task(
+                self._run_expert(spec, content, deadline, limiter, tracer),
+                name=f"expert:{spec.name}"
+            )
+            for spec in specs
+        ]
+        try:
+            if tasks:
+                _, pending = await asyncio.wait(tasks, timeout=round_timeout)
+                for task in pending:
+                    task.cancel()
+                if pending:
+                    await asyncio.wait(pending)
+        finally:
+            # Отмена самого раунда отменяет всех его экспертов
+            for task in tasks:
+                task.cancel()
+
+        results = []
+        for spec, task in zip(specs, tasks):
+            if task.cancelled():
+                logger.warning("Эксперт %s не успел к дедлайну раунда", spec.name)
+                results.append(_status_result(spec.name, "cancelled", "Не успел к дедлайну раунда"))
+            else:
+                results.append(task.result())
+        return results
+
+    async def _run_expert(
+        self,
+        spec: ExpertSpec,
+        content: str,
+        deadline: Optional[float],
+        limiter: Optional[asyncio.Semaphore],
+        tracer
+    ) -> ExpertiseResult:
+        with tracer.span("expert", expert=spec.name) as span:
+            if limiter is None:
+                result = await self._attempts(spec, content, deadline)
+            else:
+                async with limiter:
+                    result = await self._attempts(spec, content, deadline)
+            span.set(score=result.score, findings=len(result.findings))
+            if result.status != "ok":
+                span.fail(result.findings[0] if result.findings else result.status, result.status)
+            return result
+
+    async def _attempts(self, spec: ExpertSpec, content: str, deadline: Optional[float]) -> ExpertiseResult:
+        status, error = "error", None
+        for attempt in range(spec.retries + 1):
+            if attempt:
+                await asyncio.sleep(spec.retry_delay)
+            timeout = spec.timeout
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                timeout = remaining if timeout is None else min(timeout, remaining)
+            try:
+                result = await asyncio.wait_for(spec.func(content), timeout)
+                if attempt:
+                    logger.info("Эксперт %s: успех с попытки %s", spec.name, attempt + 1)
+                return result
+            except asyncio.TimeoutError:
+                # Без ограничения TimeoutError мог бросить сам эксперт
+                status, error = "timeout", f"Таймаут {timeout:.1f} с" if timeout is not None else "Таймаут"
+            except Exception as e:
+                status, error = "error", str(e)
+            logger.warning("Эксперт %s, попытка %s/%s: %s", spec.name, attempt + 1, spec.retries + 1, error)
+        return _status_result(spec.name, status, error)
+
+
+def _status_result(name: str, status: str, error: str) -> ExpertiseResult:
+    return ExpertiseResult(
+        expert_type=name,
+        findings=[f"Ошибка: {error}"],
+        suggestions=["Повторить попытку"],
+        score=0,
+        status=status
+    )
@@ -13,6 +13,7 @@ class ExpertiseResult(BaseModel):
     suggestions: List[str] = Field(default_factory=list)
     score: float = Field(ge=0, le=10, default=5.0)
     raw_response: str = ""
+    status: str = "ok"  # 'ok', 'error', 'timeout', 'cancelled'
     timestamp: datetime = Field(default_factory=datetime.now)
 
 class ModelResponse(BaseModel):
@@ -29,6 +30,7 @@ class DiscussionRound(BaseModel):
     responses: Dict[str, str] = Field(default_factory=dict)
     consensus_reached: bool = False
     best_response: Optional[str] = None
+    agreement: Optional[float] = None  # минимальная попарная близость ответов
 
 class SessionContext(BaseModel):
     """Полный контекст исследовательской сессии"""
@@ -46,11 +48,17 @@ class SessionContext(BaseModel):
     # Управление
     current_round: int = 0
     max_rounds: int = 3
+    plateau_delta: float = 0.1  # минимальный прирост оценки за раунд
+    token_budget: Optional[int] = None
+    time_budget_s: Optional[float] = None
+    stop_reason: Optional[str] = None  # judge, consensus, max_rounds, plateau, token_budget, time_budget
     is_finished: bool = False
     final_synthesis: Optional[str] = None
+    reused_from: Optional[str] = None  # сессия, чей результат использован повторно
     
     # Метрики
     quality_score: float = 0.0
+    tokens_used: int = 0
     improvement_trend: List[float] = Field(default_factory=list)
 
 class JudgeDecision(BaseModel):
@@ -2,38 +2,140 @@
 Оркестратор Research Engine - управляет исследовательским процессом.
 """
 import asyncio
+import contextlib
+import contextvars
 import json
-from typing import List, Dict, Any
+import re
+import time
+from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime
 import logging
 
+from .checkpoints import DURABILITY_LEVELS, CheckpointQueue
+from .consensus import ConsensusDetector
+from .experts import ExpertRegistry
 from .models import (
     SessionContext, ExpertiseResult, ModelResponse,
     DiscussionRound, JudgeDecision
 )
+from .serialization import APPEND_FIELDS, DeltaTracker, encode_context, replay
+from .tracing import NOOP_TRACER
 
-# Настройка логирования
-logging.basicConfig(level=logging.INFO)
+# Обработчики настраивает приложение (или точка входа CLI, см. batch.py),
+# а не импорт библиотеки
 logger = logging.getLogger(__name__)
 
+# Сессия, в которой выполняется текущий этап: токены вызовов моделей
+# (в том числе из задач экспертов) начисляются в её контекст
+_current_session: contextvars.ContextVar[Optional[SessionContext]] = contextvars.ContextVar(
+    "research_session", default=None
+)
+
+EXPERT_PROMPTS = {
+    "code": "Ты эксперт по коду. Найди ошибки, граничные случаи и проблемы производительности.",
+    "prompt": "Ты эксперт по промпт-инженерии. Найди неточности и недостающие требования в постановке.",
+    "analytics": "Ты эксперт-аналитик. Оцени полноту, обоснованность и сравнение с альтернативами.",
+}
+
+EXPERT_FORMAT = (
+    'Ответь только JSON: {"findings": ["..."], "suggestions": ["..."], "score": <0-10>}'
+)
+
+JUDGE_FORMAT = (
+    'Ответь только JSON: {"should_stop": true/false, "reason": "...", '
+    '"improved_response": "...", "score": <0-10>, "needs_more_rounds": true/false}'
+)
+
 class ResearchOrchestrator:
     """
     Оркестратор, управляющий исследовательским процессом.
     """
     
-    def __init__(self, llm_client=None, kb_client=None):
+    REUSE_MODES = ("return", "seed")
+    
+    def __init__(
+        self,
+        llm_client=None,
+        kb_client=None,
+        reuse_mode: Optional[str] = None,
+        reuse_threshold: float = 0.85,
+        reuse_min_quality: float = 8.0,
+        experts: Optional[ExpertRegistry] = None,
+        round_timeout: Optional[float] = None,
+        durability: str = "stage",
+        checkpoint_queue_size: int = 1000,
+        primary_model: str = "openai/gpt-4",
+        expert_model: str = "deepseek/deepseek-chat",
+        judge_model: str = "openai/gpt-4",
+        discussion_models: Optional[List[str]] = None,
+        state_encoding: Optional[str] = None,
+        state_full_every: Optional[int] = None,
+        consensus_threshold: Optional[float] = 0.8,
+        tracer=None
+    ):
         """
         Args:
-            llm_client: Клиент для вызова моделей (из sokrat_core)
+            llm_client: клиент моделей с методом
+                chat(model, messages, temperature=..., max_tokens=...),
+                возвращающим объект с content, total_tokens и latency_ms
+                (общий LLMClient из sokrat_core: get_llm_client()).
+                None - этапы возвращают тестовые заглушки
             kb_client: Клиент для базы знаний
+            reuse_mode: повторное использование похожих прошлых сессий
+                (нужен kb_client с find_similar_sessions):
+                'return' - вернуть прошлый синтез без вызовов моделей,
+                'seed' - добавить его в rag_context и провести исследование,
+                None - не использовать
+            reuse_threshold: минимальная косинусная близость задачи
+            reuse_min_quality: минимальная итоговая оценка прошлой сессии
+            experts: реестр экспертов (None - встроенные code, prompt, analytics)
+            round_timeout: дедлайн раунда экспертизы в секундах
+            durability: запись чекпоинтов в БЗ - 'sync' (сразу, этап ждёт),
+                'stage' (в фоне, но не больше одного незаписанного этапа
+                на сессию) или 'async' (в фоне, ожидание в конце сессии)
+            checkpoint_queue_size: размер очереди фоновой записи
+            primary_model: модель первичного ответа
+            expert_model: модель встроенных экспертов
+            judge_model: модель-судья
+            discussion_models: участники обсуждения (опрашиваются параллельно)
+            state_encoding: кодировка снимков контекста в БЗ ('json',
+                'orjson', 'msgpack'; None - самая компактная из доступных).
+                Снимки пишутся, если kb_client умеет save_state
+            state_full_every: через сколько дельта-снимков писать полный
+                (None - полный только первый снимок сессии)
+            consensus_threshold: близость ответов обсуждения (Жаккар по
+                шинглам), при которой раунды останавливаются, а судья не
+                вызывается, если оценка уже есть (None - не проверять)
+            tracer: трассировщик со span(name, **attributes) - спаны
+                сессии, этапов, экспертов и записей в БЗ (None - без трассировки)
         """
+        if durability not in DURABILITY_LEVELS:
+            raise ValueError(f"Неизвестный durability: {durability}")
+        if reuse_mode is not None and reuse_mode not in self.REUSE_MODES:
+            raise ValueError(f"Неизвестный reuse_mode: {reuse_mode}")
         self.llm = llm_client
         self.kb = kb_client
-        self.experts = {
-            'code': self._expert_code,
-            'prompt': self._expert_prompt,
-            'analytics': self._expert_analytics
-        }
+        self.reuse_mode = reuse_mode
+        self.reuse_threshold = reuse_threshold
+        self.reuse_min_quality = reuse_min_quality
+        self.round_timeout = round_timeout
+        self.durability = durability
+        self.checkpoints = CheckpointQueue(maxsize=checkpoint_queue_size)
+        self.state = DeltaTracker(state_encoding, full_every=state_full_every)
+        self.tracer = tracer or NOOP_TRACER
+        self.consensus = ConsensusDetector(consensus_threshold) if consensus_threshold is not None else None
+        self.primary_model = primary_model
+        self.expert_model = expert_model
+        self.judge_model = judge_model
+        self.discussion_models = discussion_models or [
+            "openai/gpt-4", "deepseek/deepseek-chat", "qwen/qwen-2.5-72b-instruct"
+        ]
+        if experts is None:
+            experts = ExpertRegistry()
+            experts.register('code', self._expert_code)
+            experts.register('prompt', self._expert_prompt)
+            experts.register('analytics', self._expert_analytics)
+        self.experts = experts
     
     async def run(self, context: SessionContext) -> SessionContext:
         """
@@ -45,109 +147,441 @@ async def run(self, context: SessionContext) -> SessionContext:
         Returns:
             SessionContext: Обновлённый контекст с результатами
         """
-        logger.info(f" Запуск сессии {context.session_id}")
-        logger.info(f"Задача: {context.task[:100]}...")
+        logger.info(" Запуск сессии %s", context.session_id)
+        logger.info("Задача: %s...", context.task[:100])
+        
+        with self.tracer.span("research.session", session_id=context.session_id) as span:
+            context = await self._run(context)
+            span.set(
+                rounds=context.current_round,
+                tokens=context.tokens_used,
+                quality_score=context.quality_score,
+                stop_reason=context.stop_reason or ""
+            )
+            return context
+    
+    async def _run(self, context: SessionContext) -> SessionContext:
+        # Похожая прошлая сессия с хорошей оценкой (ищем до сохранения новой)
+        prior = await self._find_reusable(context)
         
         # Сохраняем начало в БЗ
         if self.kb:
             await self._save_checkpoint(context, "session_started")
         
+        if prior and self.reuse_mode == "return":
+            return await self._finish_from_prior(context, prior)
+        if prior:
+            self._seed_from_prior(context, prior)
+        
+        return await self._execute(context)
+    
+    async def _execute(
+        self,
+        context: SessionContext,
+        saved_expertise: Optional[Dict[int, List[ExpertiseResult]]] = None
+    ) -> SessionContext:
+        """
+        Выполнить этапы, которых ещё нет в контексте: первичный ответ и
+        раунды до условия остановки. Для новой сессии - все этапы, для
+        восстановленной из БЗ - начиная с первого незавершённого.
+        
+        Args:
+            saved_expertise: экспертизы незавершённого раунда, уже
+                сохранённые в БЗ (номер раунда -> результаты)
+        """
+        saved_expertise = saved_expertise or {}
+        started = time.monotonic()
         try:
-            # Шаг 1: Первичный ответ (TODO: заменить на реальный вызов)
-            context.primary_response = await self._get_primary_response(context)
-            await self._save_checkpoint(context, "primary_response")
-            
-            # Шаг 2: Экспертизы
-            logger.info(" Запуск экспертиз...")
-            expertise = await self._run_expertise_round(context.primary_response.content)
-            context.expertise_results.extend(expertise)
+            return await self._execute_stages(context, saved_expertise, started)
+        finally:
+            # Сессия завершается только после записи всех своих чекпоинтов
+            await self.checkpoints.flush(context.session_id)
+            self.state.forget(context.session_id)
+    
+    async def _execute_stages(
+        self,
+        context: SessionContext,
+        saved_expertise: Dict[int, List[ExpertiseResult]],
+        started: float
+    ) -> SessionContext:
+        session_token = _current_session.set(context)
+        try:
+            # Шаг 1: Первичный ответ
+            if context.primary_response is None:
+                with self.tracer.span("research.primary") as span:
+                    context.primary_response = await self._get_primary_response(context)
+                    span.set(tokens=context.primary_response.tokens_used)
+                await self._save_checkpoint(context, "primary_response")
+            content = context.final_synthesis or context.primary_response.content
             
-            # Сохраняем экспертизы в БЗ
-            if self.kb:
-                for exp in expertise:
-                    await self.kb.save_expertise(
-                        context.session_id,
-                        context.current_round,
-                        exp.expert_type,
-                        exp.findings,
-                        exp.suggestions,
-                        exp.score
+            # Раунды экспертиза -> обсуждение -> судья, пока качество растёт
+            while context.stop_reason is None:
+                round_number = context.current_round + 1
+                
+                # Шаг 2: Экспертизы (после сбоя - уже сохранённые)
+                expertise = saved_expertise.pop(round_number, None)
+                if expertise is None:
+                    logger.info(" Раунд %s: запуск экспертиз...", round_number)
+                    with self.tracer.span("research.expertise", round=round_number):
+                        expertise = await self._run_expertise_round(content)
+                    context.expertise_results.extend(expertise)
+                    
+                    # Сохраняем экспертизы в БЗ (все эксперты этапа - один коммит)
+                    await self._save_expertise(context, expertise, round_number)
+                
+                # Шаг 3: Обсуждение
+                logger.info(" Круг обсуждения...")
+                with self.tracer.span("research.discussion", round=round_number) as span:
+                    discussion = await self._run_discussion_round(context)
+                    self._check_consensus(discussion)
+                    span.set(
+                        responses=len(discussion.responses),
+                        consensus=discussion.consensus_reached,
+                        agreement=discussion.agreement or 0.0
                     )
-            
-            # Шаг 3: Обсуждение
-            logger.info(" Круг обсуждения...")
-            discussion = await self._run_discussion_round(context)
-            context.discussion_rounds.append(discussion)
-            
-            # Шаг 4: Судья
-            logger.info(" Судья оценивает...")
-            judge = await self._run_judge(context)
-            
-            # Обновляем метрики
-            context.quality_score = judge.score
-            context.improvement_trend.append(judge.score)
+                context.discussion_rounds.append(discussion)
+                
+                # Шаг 4: Судья (при консенсусе и известной оценке не нужен)
+                if discussion.consensus_reached and context.improvement_trend:
+                    logger.info(" Консенсус моделей (%.2f), судья пропущен", discussion.agreement)
+                    judge = JudgeDecision(
+                        should_stop=True,
+                        reason=f"Консенсус моделей (близость {discussion.agreement:.2f})",
+                        improved_response=discussion.best_response,
+                        score=context.quality_score,
+                        needs_more_rounds=False
+                    )
+                else:
+                    logger.info(" Судья оценивает...")
+                    with self.tracer.span("research.judge", round=round_number) as span:
+                        judge = await self._run_judge(context)
+                        span.set(score=judge.score, should_stop=judge.should_stop)
+                
+                # Обновляем метрики
+                context.quality_score = judge.score
+                context.improvement_trend.append(judge.score)
+                context.final_synthesis = judge.improved_response
+                context.current_round = round_number
+                
+                # Раунд сохраняется вместе с оценкой судьи
+                await self._save_checkpoint(context, "discussion", judge=judge)
+                
+                context.stop_reason = self._stop_reason(context, judge, started)
+                content = judge.improved_response
             
             # Финальный синтез
             context.is_finished = True
-            context.final_synthesis = judge.improved_response
             
             # Сохраняем результат
             await self._save_checkpoint(context, "completed")
-            logger.info(f" Сессия {context.session_id} завершена, оценка: {context.quality_score}/10")
+            logger.info(
+                " Сессия %s завершена после %s раунд(ов) (%s), оценка: %s/10",
+                context.session_id, context.current_round, context.stop_reason, context.quality_score
+            )
             
             return context
             
         except Exception as e:
-            logger.error(f" Ошибка: {e}")
+            logger.error(" Ошибка: %s", e)
             await self._save_checkpoint(context, "failed", error=str(e))
             raise
+        finally:
+            _current_session.reset(session_token)
     
-    async def _get_primary_response(self, context: SessionContext) -> ModelResponse:
+    async def restore_context(
+        self,
+        session_id: str
+    ) -> Optional[Tuple[SessionContext, Dict[int, List[ExpertiseResult]]]]:
         """
-        Получить первичный ответ от модели.
-        TODO: Заменить на реальный вызов из sokrat_core
+        Восстановить контекст сессии из чекпоинтов БЗ.
+        
+        Основа - снимок контекста (полный и дельты, load_state): в нём весь
+        контекст, включая токены, тренд оценки и бюджеты. Строки раундов
+        и экспертиз дают экспертизы незавершённого раунда, итог и
+        запасной путь, если снимка нет или он отстаёт от строк.
+        
+        Returns:
+            (SessionContext, экспертизы незавершённого раунда) или None,
+            если сессии нет или клиент БЗ не умеет читать историю
         """
-        # Здесь будет вызов dispatch_to_models из sokrat_core
-        return ModelResponse(
-            model_name="gpt-4",
-            content=f"[Тестовый ответ] Задача: {context.task}. Используем быструю сортировку с оптимизацией памяти.",
-            tokens_used=150,
-            latency_ms=1200
+        if not self.kb or not hasattr(self.kb, "iter_session_history"):
+            return None
+        
+        context = None
+        last_judge = None
+        final = None
+        expertise_by_round: Dict[int, List[ExpertiseResult]] = {}
+        async for record in self.kb.iter_session_history(session_id):
+            if record.kind == "session":
+                config = record.config
+                context = SessionContext(
+                    session_id=session_id,
+                    task=record["task"],
+                    **{key: value for key, value in config.items() if key in SessionContext.model_fields}
+                )
+            elif record.kind == "round":
+                data = record.data
+                if data.get("type") == "primary":
+                    context.primary_response = ModelResponse(
+                        model_name=data.get("model", ""),
+                        content=data.get("content", ""),
+                        tokens_used=data.get("tokens", 0)
+                    )
+                    context.tokens_used += context.primary_response.tokens_used
+                elif data.get("type") == "discussion":
+                    context.discussion_rounds.append(DiscussionRound(
+                        round_number=record.round_number,
+                        responses=data.get("responses", {}),
+                        consensus_reached=data.get("consensus_reached", False),
+                        best_response=data.get("best_response"),
+                        agreement=data.get("agreement")
+                    ))
+                    if data.get("quality_score") is not None:
+                        context.quality_score = data["quality_score"]
+                        context.improvement_trend.append(data["quality_score"])
+                    context.final_synthesis = data.get("synthesis") or context.final_synthesis
+                    context.current_round = record.round_number
+                    last_judge = JudgeDecision(
+                        should_stop=data.get("should_stop", False),
+                        reason=data.get("judge_reason") or "",
+                        improved_response=data.get("synthesis") or "",
+                        score=data.get("quality_score") or 0.0,
+                        needs_more_rounds=data.get("needs_more_rounds", True)
+                    )
+                elif data.get("type") == "final":
+                    final = data
+            else:
+                expertise_by_round.setdefault(record.round_number, []).append(ExpertiseResult(
+                    expert_type=record["expert_type"],
+                    findings=record.findings,
+                    suggestions=record.suggestions,
+                    score=record["score"],
+                    status=record["status"]
+                ))
+        
+        if context is None:
+            return None
+        
+        completed_expertise = [
+            exp
+            for round_number in sorted(expertise_by_round) if round_number <= context.current_round
+            for exp in expertise_by_round.pop(round_number)
+        ]
+        snapshot = await self._load_snapshot(session_id)
+        if (
+            snapshot is not None
+            and snapshot.current_round == context.current_round
+            and (snapshot.primary_response is None) == (context.primary_response is None)
+        ):
+            context = snapshot
+        else:
+            context.expertise_results.extend(completed_expertise)
+        
+        if final is not None:
+            context.is_finished = True
+            context.final_synthesis = final.get("synthesis")
+            context.quality_score = final.get("quality_score") or context.quality_score
+            context.stop_reason = final.get("stop_reason")
+            context.reused_from = final.get("reused_from")
+        elif last_judge is not None:
+            # Раунд завершён, но решение об остановке не успели записать
+            context.stop_reason = self._stop_reason(context, last_judge, time.monotonic())
+        return context, expertise_by_round
+    
+    async def _load_snapshot(self, session_id: str) -> Optional[SessionContext]:
+        try:
+            return await self.load_state(session_id)
+        except Exception as e:
+            # Например, снимок в кодировке, недоступной в этом окружении
+            logger.warning("Снимок сессии %s не прочитан, восстановление по раундам: %s", session_id, e)
+            return None
+    
+    async def resume(self, session_id: str) -> Optional[SessionContext]:
+        """
+        Продолжить сессию с последнего сохранённого этапа или раунда.
+        
+        Уже выполненные этапы (первичный ответ, завершённые раунды,
+        экспертизы незавершённого раунда) повторно не вызываются.
+        Бюджет времени отсчитывается заново.
+        
+        Returns:
+            Контекст завершённой сессии или None, если её нет в БЗ
+        """
+        restored = await self.restore_context(session_id)
+        if restored is None:
+            return None
+        context, saved_expertise = restored
+        if context.is_finished:
+            await self._set_status(context.session_id, "completed")
+            return context
+        
+        logger.info(
+            " Возобновление сессии %s после раунда %s%s",
+            session_id, context.current_round, " (первичный ответ есть)" if context.primary_response else ""
         )
+        with self.tracer.span("research.resume", session_id=session_id, from_round=context.current_round):
+            await self._set_status(context.session_id, "active")
+            context.expertise_results.extend(
+                exp for round_number in sorted(saved_expertise) for exp in saved_expertise[round_number]
+            )
+            return await self._execute(context, saved_expertise)
     
-    async def _run_expertise_round(self, content: str) -> List[ExpertiseResult]:
+    async def resume_active_sessions(self, concurrency: int = 4, page_size: int = 100) -> List[SessionContext]:
         """
-        Запустить все контуры экспертизы параллельно.
+        Возобновить все сессии в статусе 'active' - прерванные сбоем или
+        перезапуском. Вызывать при старте, до приёма новых задач.
+        
+        Returns:
+            Контексты возобновлённых сессий (упавшие повторно пропускаются)
         """
-        tasks = [
-            self.experts['code'](content),
-            self.experts['prompt'](content),
-            self.experts['analytics'](content)
-        ]
+        if not self.kb or not hasattr(self.kb, "list_sessions"):
+            return []
         
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        semaphore = asyncio.Semaphore(concurrency)
         
-        # Фильтруем ошибки
-        expertise_results = []
-        for result in results:
-            if isinstance(result, Exception):
-                logger.error(f"Ошибка в экспертизе: {result}")
-                expertise_results.append(
-                    ExpertiseResult(
-                        expert_type="error",
-                        findings=[f"Ошибка: {result}"],
-                        suggestions=["Повторить попытку"],
-                        score=0
-                    )
-                )
-            else:
-                expertise_results.append(result)
+        async def resume_one(session_id):
+            async with semaphore:
+                try:
+                    return await self.resume(session_id)
+                except Exception as e:
+                    logger.error("Не удалось возобновить сессию %s: %s", session_id, e)
+                    return None
         
-        return expertise_results
+        resumed = []
+        cursor = None
+        while True:
+            page, cursor = await self.kb.list_sessions(limit=page_size, cursor=cursor, status="active")
+            results = await asyncio.gather(*(resume_one(row["id"]) for row in page))
+            resumed.extend(r for r in results if r is not None)
+            if cursor is None:
+                break
+        if resumed:
+            logger.info(" Возобновлено сессий: %d", len(resumed))
+        return resumed
+    
+    async def _set_status(self, session_id: str, status: str):
+        if self.kb and hasattr(self.kb, "update_session_status"):
+            await self.kb.update_session_status(session_id, status)
+    
+    @staticmethod
+    def _stop_reason(context: SessionContext, judge: JudgeDecision, started: float) -> Optional[str]:
+        """
+        Причина остановки после раунда или None, если нужен следующий.
+        
+        Порядок: консенсус моделей в обсуждении, решение судьи, лимит
+        раундов, плато оценки (прирост к лучшей из прошлых оценок меньше
+        plateau_delta), бюджеты токенов и времени.
+        """
+        if context.discussion_rounds and context.discussion_rounds[-1].consensus_reached:
+            return "consensus"
+        if judge.should_stop and not judge.needs_more_rounds:
+            return "judge"
+        if context.current_round >= context.max_rounds:
+            return "max_rounds"
+        trend = context.improvement_trend
+        if len(trend) >= 2 and trend[-1] - max(trend[:-1]) < context.plateau_delta:
+            return "plateau"
+        if context.token_budget is not None and context.tokens_used >= context.token_budget:
+            return "token_budget"
+        if context.time_budget_s is not None and time.monotonic() - started >= context.time_budget_s:
+            return "time_budget"
+        return None
+    
+    async def _find_reusable(self, context: SessionContext) -> Optional[Dict[str, Any]]:
+        """Самая похожая прошлая сессия выше порогов или None"""
+        if not self.reuse_mode or not self.kb or not hasattr(self.kb, "find_similar_sessions"):
+            return None
+        try:
+            matches = await self.kb.find_similar_sessions(
+                f"{context.task}\n{context.initial_prompt}",
+                limit=1,
+                min_similarity=self.reuse_threshold,
+                min_quality=self.reuse_min_quality
+            )
+        except Exception as e:
+            logger.error("Ошибка поиска похожих сессий: %s", e)
+            return None
+        if not matches or not matches[0]["synthesis"]:
+            return None
+        prior = matches[0]
+        logger.info(
+            " Похожая сессия %s (близость %.2f, оценка %s)",
+            prior['session_id'], prior['similarity'], prior['quality_score']
+        )
+        return prior
+    
+    async def _finish_from_prior(self, context: SessionContext, prior: Dict[str, Any]) -> SessionContext:
+        """Завершить сессию результатом похожей прошлой сессии"""
+        context.reused_from = prior["session_id"]
+        context.final_synthesis = prior["synthesis"]
+        context.quality_score = prior["quality_score"]
+        context.improvement_trend.append(prior["quality_score"])
+        context.is_finished = True
+        await self._save_checkpoint(context, "completed")
+        await self.checkpoints.flush(context.session_id)
+        self.state.forget(context.session_id)
+        logger.info(" Сессия %s завершена повторным использованием %s", context.session_id, context.reused_from)
+        return context
+    
+    def _seed_from_prior(self, context: SessionContext, prior: Dict[str, Any]):
+        """Добавить прошлый синтез в контекст как отправную точку"""
+        context.reused_from = prior["session_id"]
+        seed = f"Результат похожего исследования (оценка {prior['quality_score']}/10):\n{prior['synthesis']}"
+        context.rag_context = f"{context.rag_context}\n\n{seed}" if context.rag_context else seed
+    
+    async def _get_primary_response(self, context: SessionContext) -> ModelResponse:
+        """Получить первичный ответ от модели"""
+        if not self.llm:
+            self._count_tokens(150)
+            return ModelResponse(
+                model_name="gpt-4",
+                content=f"[Тестовый ответ] Задача: {context.task}. Используем быструю сортировку с оптимизацией памяти.",
+                tokens_used=150,
+                latency_ms=1200
+            )
+        
+        system = "Ты исследователь. Дай полный и точный ответ на задачу."
+        if context.negative_constraints:
+            system += f"\nОграничения (чего делать нельзя): {context.negative_constraints}"
+        user = f"Задача: {context.task}\n\n{context.initial_prompt}"
+        if context.rag_context:
+            user += f"\n\nКонтекст:\n{context.rag_context}"
+        return await self._chat(self.primary_model, system, user, temperature=0.3)
+    
+    async def _run_expertise_round(self, content: str) -> List[ExpertiseResult]:
+        """
+        Запустить все контуры экспертизы параллельно (через реестр:
+        таймауты, повторы и лимит одновременных запусков - в нём).
+        """
+        return await self.experts.run(content, round_timeout=self.round_timeout, tracer=self.tracer)
+    
+    async def _run_expert(self, expert_type: str, content: str) -> ExpertiseResult:
+        """Экспертиза моделью: ответ в JSON, разбирается нестрого"""
+        response = await self._chat(
+            self.expert_model,
+            f"{EXPERT_PROMPTS[expert_type]}\n{EXPERT_FORMAT}",
+            content
+        )
+        data = _parse_json(response.content)
+        if data is None:
+            # Модель ответила текстом: сохраняем его как единственное замечание
+            return ExpertiseResult(
+                expert_type=expert_type,
+                findings=[response.content.strip()],
+                raw_response=response.content
+            )
+        return ExpertiseResult(
+            expert_type=expert_type,
+            findings=_as_str_list(data.get("findings")),
+            suggestions=_as_str_list(data.get("suggestions")),
+            score=_as_score(data.get("score"), 5.0),
+            raw_response=response.content
+        )
     
     async def _expert_code(self, content: str) -> ExpertiseResult:
         """Эксперт по коду"""
-        # TODO: Заменить на реальный вызов модели
+        if self.llm:
+            return await self._run_expert("code", content)
         return ExpertiseResult(
             expert_type="code",
             findings=[
@@ -165,6 +599,8 @@ async def _expert_code(self, content: str) -> ExpertiseResult:
     
     async def _expert_prompt(self, content: str) -> ExpertiseResult:
         """Эксперт по промпт-инженерии"""
+        if self.llm:
+            return await self._run_expert("prompt", content)
         return ExpertiseResult(
             expert_type="prompt",
             findings=[
@@ -180,6 +616,8 @@ async def _expert_prompt(self, content: str) -> ExpertiseResult:
     
     async def _expert_analytics(self, content: str) -> ExpertiseResult:
         """Эксперт по аналитике"""
+        if self.llm:
+            return await self._run_expert("analytics", content)
         return ExpertiseResult(
             expert_type="analytics",
             findings=[
@@ -195,10 +633,26 @@ async def _expert_analytics(self, content: str) -> ExpertiseResult:
     
     async def _run_discussion_round(self, context: SessionContext) -> DiscussionRound:
         """
-        Запустить круг обсуждения между моделями.
-        TODO: Заменить на реальные вызовы моделей
+        Запустить круг обсуждения: модели параллельно дорабатывают текущий
+        ответ по замечаниям экспертов раунда. Упавшие модели пропускаются.
         """
-        # Здесь будут реальные вызовы моделей
+        if self.llm:
+            user = self._discussion_prompt(context)
+            system = "Ты участник экспертного обсуждения. Предложи улучшенный ответ с учётом замечаний."
+            results = await asyncio.gather(
+                *(self._chat(model, system, user, temperature=0.5) for model in self.discussion_models),
+                return_exceptions=True
+            )
+            responses = {}
+            for model, result in zip(self.discussion_models, results):
+                if isinstance(result, Exception):
+                    logger.warning("Модель %s не ответила в обсуждении: %s", model, result)
+                else:
+                    responses[model] = result.content
+            if not responses:
+                raise RuntimeError("Ни одна модель не ответила в круге обсуждения")
+            return DiscussionRound(round_number=context.current_round + 1, responses=responses)
+        
         return DiscussionRound(
             round_number=context.current_round + 1,
             responses={
@@ -209,11 +663,39 @@ async def _run_discussion_round(self, context: SessionContext) -> DiscussionRoun
             consensus_reached=False
         )
     
+    def _check_consensus(self, discussion: DiscussionRound):
+        """Отметить консенсус и лучший ответ круга (локально, без модели)"""
+        if self.consensus is None or not discussion.responses:
+            return
+        consensus = self.consensus.check(discussion.responses)
+        discussion.consensus_reached = consensus.reached
+        discussion.agreement = consensus.agreement
+        discussion.best_response = consensus.best_response
+    
     async def _run_judge(self, context: SessionContext) -> JudgeDecision:
-        """
-        Судья оценивает прогресс.
-        TODO: Заменить на реальный вызов модели-судьи
-        """
+        """Судья оценивает прогресс и сводит ответы обсуждения в один"""
+        if self.llm:
+            discussion = context.discussion_rounds[-1]
+            answers = "\n\n".join(f"[{model}]\n{text}" for model, text in discussion.responses.items())
+            response = await self._chat(
+                self.judge_model,
+                f"Ты судья исследования. Сведи ответы в лучший и оцени его.\n{JUDGE_FORMAT}",
+                f"Задача: {context.task}\n\nТекущий ответ:\n{self._current_content(context)}\n\n"
+                f"Ответы участников:\n{answers}"
+            )
+            data = _parse_json(response.content) or {}
+            improved = data.get("improved_response")
+            if not isinstance(improved, str) or not improved.strip():
+                # Без синтеза судьи берём первый ответ обсуждения
+                improved = next(iter(discussion.responses.values()))
+            return JudgeDecision(
+                should_stop=bool(data.get("should_stop", False)),
+                reason=str(data.get("reason") or response.content[:500]),
+                improved_response=improved,
+                score=_as_score(data.get("score"), context.quality_score),
+                needs_more_rounds=bool(data.get("needs_more_rounds", True))
+            )
+        
         return JudgeDecision(
             should_stop=True,
             reason="Достигнуто хорошее качество, все эксперты довольны",
@@ -231,11 +713,175 @@ def quicksort(arr):
             needs_more_rounds=False
         )
     
-    async def _save_checkpoint(self, context: SessionContext, stage: str, error: str = None):
+    async def _chat(self, model: str, system: str, user: str, temperature: float = 0.1) -> ModelResponse:
+        """Вызов модели через llm_client с учётом токенов в текущей сессии"""
+        response = await self.llm.chat(
+            model,
+            [{"role": "system", "content": system}, {"role": "user", "content": user}],
+            temperature=temperature
+        )
+        tokens = getattr(response, "total_tokens", 0) or 0
+        self._count_tokens(tokens)
+        return ModelResponse(
+            model_name=model,
+            content=response.content,
+            tokens_used=tokens,
+            latency_ms=getattr(response, "latency_ms", 0) or 0
+        )
+    
+    @staticmethod
+    def _count_tokens(tokens: int):
+        context = _current_session.get()
+        if context is not None:
+            context.tokens_used += tokens
+    
+    @staticmethod
+    def _current_content(context: SessionContext) -> str:
+        if context.final_synthesis:
+            return context.final_synthesis
+        return context.primary_response.content if context.primary_response else ""
+    
+    def _discussion_prompt(self, context: SessionContext) -> str:
+        # Экспертизы последнего раунда - последние len(experts) результатов
+        latest = context.expertise_results[-len(self.experts):] if len(self.experts) else []
+        remarks = "\n".join(
+            f"[{exp.expert_type}, {exp.score}/10] " + "; ".join(exp.findings + exp.suggestions)
+            for exp in latest if exp.status == "ok"
+        )
+        return (
+            f"Задача: {context.task}\n\nТекущий ответ:\n{self._current_content(context)}\n\n"
+            f"Замечания экспертов:\n{remarks or 'нет'}"
+        )
+    
+    def _kb_transaction(self):
+        """Транзакция БЗ, если клиент её поддерживает: одна запись на этап"""
+        if self.kb and hasattr(self.kb, "transaction"):
+            return self.kb.transaction()
+        return contextlib.nullcontext()
+    
+    async def close(self):
+        """Дописать очередь фоновой записи чекпоинтов (при остановке)."""
+        await self.checkpoints.close()
+    
+    def checkpoint_stats(self) -> Dict[str, Any]:
+        """Метрики фоновой записи: глубина очереди, отставание (lag_s) и счётчики."""
+        return self.checkpoints.stats()
+    
+    async def _persist(self, session_id: str, write, stage: str = ""):
+        """
+        Выполнить запись в БЗ согласно уровню durability. Спан 'kb.write'
+        фоновой записи не вложен в этап: она выполняется вне его контекста.
+        """
+        async def traced_write():
+            with self.tracer.span("kb.write", session_id=session_id, stage=stage, durability=self.durability):
+                await write()
+        
+        if self.durability == "sync":
+            await traced_write()
+            return
+        if self.durability == "stage":
+            # Записи предыдущего этапа сессии должны завершиться
+            await self.checkpoints.flush(session_id)
+        await self.checkpoints.submit(session_id, traced_write)
+    
+    async def _save_expertise(self, context: SessionContext, expertise: List[ExpertiseResult], round_number: int):
+        """Сохранить результаты экспертизы раунда одной транзакцией"""
+        if not self.kb:
+            return
+        
+        expertise = list(expertise)
+        await self._persist(
+            context.session_id,
+            lambda: self._write_expertise(context.session_id, expertise, round_number),
+            stage="expertise"
+        )
+    
+    async def _write_expertise(self, session_id: str, expertise: List[ExpertiseResult], round_number: int):
+        async with self._kb_transaction():
+            if hasattr(self.kb, "save_expertise_many"):
+                await self.kb.save_expertise_many(
+                    session_id,
+                    round_number,
+                    [
+                        {
+                            "expert_type": exp.expert_type,
+                            "findings": exp.findings,
+                            "suggestions": exp.suggestions,
+                            "score": exp.score,
+                            "status": exp.status
+                        }
+                        for exp in expertise
+                    ]
+                )
+            else:
+                for exp in expertise:
+                    # status передаётся только для неуспешных экспертиз,
+                    # чтобы подходили клиенты без этого параметра
+                    extra = {} if exp.status == "ok" else {"status": exp.status}
+                    await self.kb.save_expertise(
+                        session_id,
+                        round_number,
+                        exp.expert_type,
+                        exp.findings,
+                        exp.suggestions,
+                        exp.score,
+                        **extra
+                    )
+    
+    async def _save_checkpoint(
+        self,
+        context: SessionContext,
+        stage: str,
+        error: str = None,
+        judge: Optional[JudgeDecision] = None
+    ):
         """Сохранить чекпоинт в базу знаний"""
         if not self.kb:
             return
         
+        # Снимок контекста: к моменту фоновой записи сессия уйдёт дальше.
+        # Дельта кодируется сразу - она тоже фиксирует текущее состояние
+        snapshot = context.model_copy(update={name: list(getattr(context, name)) for name in APPEND_FIELDS})
+        state = None
+        if hasattr(self.kb, "save_state"):
+            state = self.state.checkpoint(context)
+            generation = self.state.generation(context.session_id)
+        
+        async def write():
+            try:
+                async with self._kb_transaction():
+                    await self._write_checkpoint(snapshot, stage, error, judge)
+                    if state is not None:
+                        kind, payload = state
+                        if kind == "delta" and self.state.generation(context.session_id) != generation:
+                            # Предыдущий снимок не записался - пишем полный
+                            kind, payload = "full", encode_context(snapshot, self.state.encoding)
+                        await self.kb.save_state(context.session_id, kind, self.state.encoding, payload)
+            except Exception as e:
+                # Ошибка коммита транзакции возникает уже вне _write_checkpoint;
+                # как и там, сбой записи не должен прерывать сессию
+                logger.error("Ошибка сохранения чекпоинта сессии %s (%s): %s", context.session_id, stage, e)
+                if state is not None:
+                    self.state.reset(context.session_id)
+        
+        await self._persist(context.session_id, write, stage=stage)
+    
+    async def load_state(self, session_id: str) -> Optional[SessionContext]:
+        """
+        Контекст сессии на момент последнего чекпоинта из снимков БЗ
+        (полный снимок и дельты после него). None, если снимков нет.
+        """
+        if not self.kb or not hasattr(self.kb, "load_state"):
+            return None
+        return replay(await self.kb.load_state(session_id))
+    
+    async def _write_checkpoint(
+        self,
+        context: SessionContext,
+        stage: str,
+        error: Optional[str],
+        judge: Optional[JudgeDecision]
+    ):
         try:
             if stage == "session_started":
                 await self.kb.save_session(
@@ -245,7 +891,10 @@ async def _save_checkpoint(self, context: SessionContext, stage: str, error: str
                         "initial_prompt": context.initial_prompt,
                         "rag_context": context.rag_context,
                         "negative_constraints": context.negative_constraints,
-                        "max_rounds": context.max_rounds
+                        "max_rounds": context.max_rounds,
+                        "plateau_delta": context.plateau_delta,
+                        "token_budget": context.token_budget,
+                        "time_budget_s": context.time_budget_s
                     }
                 )
             elif stage == "primary_response" and context.primary_response:
@@ -259,15 +908,82 @@ async def _save_checkpoint(self, context: SessionContext, stage: str, error: str
                         "tokens": context.primary_response.tokens_used
                     }
                 )
-            elif stage == "completed":
+            elif stage == "discussion" and context.discussion_rounds:
+                discussion = context.discussion_rounds[-1]
                 await self.kb.save_round(
                     context.session_id,
-                    context.current_round,
+                    discussion.round_number,
                     {
-                        "type": "final",
-                        "synthesis": context.final_synthesis,
-                        "quality_score": context.quality_score
+                        "type": "discussion",
+                        "responses": discussion.responses,
+                        "consensus_reached": discussion.consensus_reached,
+                        "best_response": discussion.best_response,
+                        "agreement": discussion.agreement,
+                        "quality_score": judge.score if judge else None,
+                        "judge_reason": judge.reason if judge else None,
+                        "should_stop": judge.should_stop if judge else None,
+                        "needs_more_rounds": judge.needs_more_rounds if judge else None,
+                        "synthesis": judge.improved_response if judge else None
                     }
                 )
+            elif stage == "completed":
+                # Итог и статус сессии - одним коммитом
+                async with self._kb_transaction():
+                    await self.kb.save_round(
+                        context.session_id,
+                        context.current_round + 1,
+                        {
+                            "type": "final",
+                            "synthesis": context.final_synthesis,
+                            "quality_score": context.quality_score,
+                            "rounds": context.current_round,
+                            "stop_reason": context.stop_reason,
+                            "tokens_used": context.tokens_used,
+                            "reused_from": context.reused_from
+                        }
+                    )
+                    await self._set_status(context.session_id, "completed")
+            elif stage == "failed":
+                async with self._kb_transaction():
+                    await self.kb.save_round(
+                        context.session_id,
+                        context.current_round + 1,
+                        {
+                            "type": "error",
+                            "error": error,
+                            "rounds": context.current_round
+                        }
+                    )
+                    await self._set_status(context.session_id, "failed")
         except Exception as e:
-            logger.error(f"Ошибка сохранения чекпоинта: {e}")
+            logger.error("Ошибка сохранения чекпоинта: %s", e)
+
+
+_JSON_OBJECT = re.compile(r"\{.*\}", re.DOTALL)
+
+
+def _parse_json(text: str) -> Optional[Dict[str, Any]]:
+    """JSON-объект из ответа модели (в том числе внутри ```json ... ``` и текста)"""
+    match = _JSON_OBJECT.search(text or "")
+    if not match:
+        return None
+    try:
+        data = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _as_str_list(value) -> List[str]:
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [value]
+    return [str(item) for item in value] if isinstance(value, list) else [str(value)]
+
+
+def _as_score(value, default: float) -> float:
+    try:
+        return min(10.0, max(0.0, float(value)))
+    except (TypeError, ValueError):
+        return default
@@ -0,0 +1,196 @@
+﻿"""
+Сериализация контекста сессии для чекпоинтов.
+
+Кодировки:
+    'json'    - pydantic v2 (model_dump_json / model_validate_json, pydantic_core);
+    'orjson'  - JSON через orjson (если установлен);
+    'msgpack' - MessagePack через ormsgpack (если установлен), компактнее JSON.
+
+Дельта-чекпоинты: DeltaTracker помнит, что уже записано по сессии, и
+кодирует только изменения - новые элементы списков (expertise_results,
+discussion_rounds, improvement_trend) и изменившиеся скалярные поля.
+Объём записи и время сериализации на раунд не растут с числом раундов.
+Полный снимок пишется первым; с full_every - ещё и раз в full_every
+дельт, чтобы укоротить цепочку дельт при восстановлении (ценой
+периодической записи всего контекста). Если снимок не записался,
+reset() начинает цепочку заново: следующий снимок - полный.
+"""
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import pydantic_core
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ormsgpack
+except ImportError:
+    ormsgpack = None
+
+from .models import SessionContext
+
+ENCODINGS = ("json", "orjson", "msgpack")
+
+# Поля-списки контекста, которые только растут: в дельту идут новые элементы
+APPEND_FIELDS = ("expertise_results", "discussion_rounds", "improvement_trend")
+
+
+def available_encodings() -> List[str]:
+    encodings = ["json"]
+    if orjson is not None:
+        encodings.append("orjson")
+    if ormsgpack is not None:
+        encodings.append("msgpack")
+    return encodings
+
+
+def default_encoding() -> str:
+    """Самая компактная из доступных кодировок"""
+    return available_encodings()[-1]
+
+
+def _check(encoding: str):
+    if encoding not in available_encodings():
+        raise ValueError(f"Кодировка {encoding} недоступна, доступны: {', '.join(available_encodings())}")
+
+
+def encode(value: Any, encoding: str = "json") -> bytes:
+    """Закодировать JSON-совместимое значение"""
+    if encoding == "msgpack":
+        return ormsgpack.packb(value)
+    if encoding == "orjson":
+        return orjson.dumps(value)
+    return pydantic_core.to_json(value)
+
+
+def decode(data: bytes, encoding: str = "json") -> Any:
+    if encoding == "msgpack":
+        return ormsgpack.unpackb(data)
+    if encoding == "orjson":
+        return orjson.loads(data)
+    return pydantic_core.from_json(data)
+
+
+def encode_context(context: SessionContext, encoding: str = "json") -> bytes:
+    """Полный снимок контекста"""
+    _check(encoding)
+    if encoding == "json":
+        return context.model_dump_json().encode("utf-8")
+    return encode(context.model_dump(mode="json"), encoding)
+
+
+def decode_context(data: bytes, encoding: str = "json") -> SessionContext:
+    _check(encoding)
+    if encoding == "json":
+        return SessionContext.model_validate_json(data)
+    return SessionContext.model_validate(decode(data, encoding))
+
+
+def _dump_items(items: List[Any]) -> List[Any]:
+    return [item.model_dump(mode="json") if isinstance(item, BaseModel) else item for item in items]
+
+
+class _Written:
+    """Что уже записано по сессии"""
+
+    def __init__(self, scalars: Dict[str, Any], lengths: Dict[str, int]):
+        self.scalars = scalars
+        self.lengths = lengths
+        self.deltas = 0
+
+
+class DeltaTracker:
+    """
+    Построение дельта-чекпоинтов контекста по сессиям.
+
+        kind, payload = tracker.checkpoint(context)
+        await kb.save_state(context.session_id, kind, tracker.encoding, payload)
+    """
+
+    def __init__(self, encoding: Optional[str] = None, full_every: Optional[int] = None):
+        """
+        Args:
+            encoding: кодировка снимков (None - default_encoding())
+            full_every: через сколько дельт писать полный снимок
+                (None - только первый снимок сессии полный)
+        """
+        self.encoding = encoding or default_encoding()
+        _check(self.encoding)
+        self.full_every = full_every
+        self._written: Dict[str, _Written] = {}
+        # Сбросы цепочки по сессиям (reset) - см. generation()
+        self._resets: Dict[str, int] = {}
+
+    def checkpoint(self, context: SessionContext) -> Tuple[str, bytes]:
+        """
+        Снимок контекста: ('full', полный) для первой записи сессии,
+        после сокращения списков и раз в full_every дельт, иначе
+        ('delta', изменения после предыдущего снимка).
+        """
+        scalars = context.model_dump(mode="json", exclude=set(APPEND_FIELDS))
+        lengths = {name: len(getattr(context, name)) for name in APPEND_FIELDS}
+        written = self._written.get(context.session_id)
+
+        if (
+            written is None
+            or (self.full_every is not None and written.deltas >= self.full_every)
+            or any(lengths[name] < written.lengths[name] for name in APPEND_FIELDS)
+        ):
+            self._written[context.session_id] = _Written(scalars, lengths)
+            return "full", encode_context(context, self.encoding)
+
+        delta: Dict[str, Any] = {
+            "set": {key: value for key, value in scalars.items() if written.scalars.get(key) != value},
+            "append": {
+                name: _dump_items(getattr(context, name)[written.lengths[name]:])
+                for name in APPEND_FIELDS
+                if lengths[name] > written.lengths[name]
+            },
+        }
+        written.scalars = scalars
+        written.lengths = lengths
+        written.deltas += 1
+        return "delta", encode(delta, self.encoding)
+
+    def forget(self, session_id: str):
+        """Сбросить состояние сессии (после завершения): следующий снимок - полный"""
+        self._written.pop(session_id, None)
+        self._resets.pop(session_id, None)
+
+    def reset(self, session_id: str):
+        """
+        Снимок сессии не записался: цепочка дельт прервана. Следующий
+        снимок - полный, а дельты, построенные до сбоя (generation()
+        изменился), записывать нельзя - их не к чему применить.
+        """
+        self._written.pop(session_id, None)
+        self._resets[session_id] = self.generation(session_id) + 1
+
+    def generation(self, session_id: str) -> int:
+        """Номер цепочки снимков сессии: растёт при каждом reset()"""
+        return self._resets.get(session_id, 0)
+
+
+def apply_delta(state: Dict[str, Any], delta: Dict[str, Any]) -> Dict[str, Any]:
+    """Применить дельту к словарю контекста (model_dump(mode='json'))"""
+    state.update(delta.get("set", {}))
+    for name, items in delta.get("append", {}).items():
+        state.setdefault(name, []).extend(items)
+    return state
+
+
+def replay(records: Iterable[Tuple[str, str, bytes]]) -> Optional[SessionContext]:
+    """
+    Восстановить контекст из снимков (kind, encoding, payload): полного
+    и следующих за ним дельт. None, если полного снимка нет.
+    """
+    state: Optional[Dict[str, Any]] = None
+    for kind, encoding, payload in records:
+        if kind == "full":
+            state = decode(payload, encoding)
+        elif state is not None:
+            apply_delta(state, decode(payload, encoding))
+    return SessionContext.model_validate(state) if state is not None else None
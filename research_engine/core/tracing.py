@@ -0,0 +1,32 @@
+﻿"""
+Интерфейс трассировки Research Engine.
+
+Оркестратор принимает любой tracer с методом span(name, **attributes) -
+контекстным менеджером, отдающим спан с методами set(**attributes) и
+fail(error, status). Подходит трассировщик sokrat_core
+(src.utils.tracing.get_tracer()); по умолчанию - NoopTracer.
+"""
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+
+class NoopSpan:
+    def set(self, **attributes: Any) -> "NoopSpan":
+        return self
+
+    def fail(self, error: str, status: str = "error"):
+        pass
+
+
+class NoopTracer:
+    """Трассировщик, который ничего не записывает"""
+
+    enabled = False
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[NoopSpan]:
+        yield NOOP_SPAN
+
+
+NOOP_SPAN = NoopSpan()
+NOOP_TRACER = NoopTracer()
@@ -1,11 +1,21 @@
 ﻿from setuptools import setup, find_packages
 
+# knowledge_base и research_engine - устанавливаемые пакеты; Sokrat Core
+# (sokrat_core/src) импортирует из knowledge_base общий GroupCommitWriter:
+#     pip install -e .
 setup(
 name="sokrat",
 version="0.1.0",
-packages=find_packages(where="src"),
-package_dir={"": "src"},
-install_requires=[],
+packages=find_packages(include=["knowledge_base", "knowledge_base.*", "research_engine", "research_engine.*"]),
+install_requires=[
+    "aiosqlite",
+    "numpy",
+    "pydantic>=2",
+],
+extras_require={
+    "fast": ["orjson", "ormsgpack"],
+    "export": ["pyarrow", "zstandard"],
+},
 author="[Твоё имя]",
 description="[Краткое описание]",
 license="MIT",
@@ -5,8 +5,8 @@
 # Добавляем корневую папку в путь
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
-from src.db.database import init_db, engine
-from src.utils.logging_config import get_logger
+from src.db.database import init_db, get_engine, dispose_engine
+from src.utils.logging_config import configure_logging, get_logger
 from sqlalchemy import inspect
 
 logger = get_logger(__name__)
@@ -18,17 +18,20 @@ async def main():
 
     # Проверяем созданные таблицы
     try:
-        async with engine.connect() as conn:
+        async with get_engine().connect() as conn:
             # Получаем таблицы через асинхронный run_sync
             tables = await conn.run_sync(
                 lambda sync_conn: inspect(sync_conn).get_table_names()
             )
             if tables:
-                logger.info(f" Созданы таблицы: {', '.join(tables)}")
+                logger.info(" Созданы таблицы: %s", ', '.join(tables))
             else:
                 logger.warning(" Таблицы не найдены")
     except Exception as e:
-        logger.error(f" Ошибка при проверке таблиц: {e}")
+        logger.error(" Ошибка при проверке таблиц: %s", e)
+    finally:
+        await dispose_engine()
 
 if __name__ == "__main__":
+    configure_logging()
     asyncio.run(main())
@@ -0,0 +1,305 @@
+﻿"""
+Нагрузочный тест POST /analyze.
+
+Два режима подачи нагрузки:
+    замкнутый (--concurrency N)      - N клиентов шлют запросы друг за другом;
+    открытый  (--rate R)             - запросы приходят пуассоновским потоком
+                                       R в секунду независимо от ответов
+                                       (--concurrency - предел одновременных).
+В открытом режиме задержка считается от запланированного момента
+отправки, поэтому очередь на стороне клиента не прячет перегрузку.
+
+Запросы берутся по кругу из корпуса (--corpus): текстовый файл (строка -
+запрос) или JSONL ({"query": ..., "local_first": ...}). Первые --warmup
+секунд (при --requests - первые --warmup запросов) не учитываются. Отчёт: p50/p90/p99 задержки, пропускная
+способность, доля ошибок и время этапов из заголовка Server-Timing;
+--out сохраняет его в JSON для сравнения прогонов.
+
+--in-process поднимает приложение в этом же процессе (ASGI, без сети до
+API) на временной БД и без ключей API, то есть поиск и модели отвечают
+встроенными заглушками - так меряется сам конвейер без внешних сервисов.
+
+Примеры:
+    python scripts/load_test.py --concurrency 8 --duration 60 --out run.json
+    python scripts/load_test.py --rate 5 --concurrency 50 --duration 120 --corpus queries.txt
+    python scripts/load_test.py --in-process --concurrency 4 --requests 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+# Добавляем корневую папку в путь
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+DEFAULT_QUERIES = [
+    "волновая электростанция эффективность",
+    "литий-железо-фосфатные аккумуляторы срок службы",
+    "КПД солнечных панелей в северных широтах",
+    "стоимость водородного электролизёра",
+]
+
+
+def load_corpus(path: Optional[str]) -> List[Dict[str, Any]]:
+    if not path:
+        return [{"query": query} for query in DEFAULT_QUERIES]
+    items = []
+    with open(path, encoding="utf-8-sig") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            items.append(json.loads(line) if line.startswith("{") else {"query": line})
+    if not items:
+        raise SystemExit(f"Корпус {path} пуст")
+    return items
+
+
+def parse_server_timing(header: Optional[str]) -> Dict[str, float]:
+    """'search;dur=12.5, fetch;dur=40' -> {'search': 12.5, 'fetch': 40.0}"""
+    timings: Dict[str, float] = {}
+    if not header:
+        return timings
+    for part in header.split(","):
+        name, *params = [p.strip() for p in part.split(";")]
+        for param in params:
+            key, _, value = param.partition("=")
+            if key == "dur":
+                try:
+                    timings[name] = float(value)
+                except ValueError:
+                    pass
+    return timings
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Перцентиль с линейной интерполяцией; values отсортирован"""
+    if not values:
+        return None
+    position = (len(values) - 1) * q
+    low = int(position)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    values = sorted(values)
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values) if values else None,
+        "p50": percentile(values, 0.50),
+        "p90": percentile(values, 0.90),
+        "p99": percentile(values, 0.99),
+        "max": values[-1] if values else None,
+    }
+
+
+class LoadTest:
+    """Генератор нагрузки и сбор результатов запросов"""
+
+    def __init__(self, client: httpx.AsyncClient, corpus: List[Dict[str, Any]], args: argparse.Namespace):
+        self.client = client
+        self.corpus = corpus
+        self.args = args
+        self.results: List[Dict[str, Any]] = []
+        self._next = 0
+        self._random = random.Random(args.seed)
+
+    def _take(self) -> int:
+        """Номер следующего запроса"""
+        index = self._next
+        self._next += 1
+        return index
+
+    def _is_warmup(self, index: int, scheduled: float, measure_from: float) -> bool:
+        # При --requests прогрев - первые warmup запросов, иначе - первые warmup секунд
+        if self.args.requests is not None:
+            return index < int(self.args.warmup)
+        return scheduled < measure_from
+
+    def _done(self, started: float) -> bool:
+        if self.args.requests is not None:
+            return self._next >= self.args.requests + int(self.args.warmup)
+        return time.monotonic() - started >= self.args.warmup + self.args.duration
+
+    async def _request(self, index: int, scheduled: float, warmup: bool):
+        payload = self.corpus[index % len(self.corpus)]
+        result: Dict[str, Any] = {"scheduled": scheduled, "warmup": warmup, "status": None, "error": None, "stages": {}}
+        try:
+            response = await self.client.post("/analyze", json=payload, timeout=self.args.timeout)
+            result["status"] = response.status_code
+            result["stages"] = parse_server_timing(response.headers.get("server-timing"))
+            if response.status_code >= 400:
+                result["error"] = f"HTTP {response.status_code}"
+        except Exception as e:
+            result["error"] = type(e).__name__
+        result["end"] = time.monotonic()
+        result["latency_ms"] = (result["end"] - scheduled) * 1000
+        self.results.append(result)
+
+    async def run_closed(self) -> float:
+        """Замкнутый цикл: concurrency клиентов без пауз. Возвращает начало измерения."""
+        started = time.monotonic()
+        measure_from = started + (0 if self.args.requests is not None else self.args.warmup)
+
+        async def client_loop():
+            while not self._done(started):
+                index = self._take()
+                now = time.monotonic()
+                await self._request(index, now, self._is_warmup(index, now, measure_from))
+
+        await asyncio.gather(*(client_loop() for _ in range(self.args.concurrency)))
+        return measure_from
+
+    async def run_open(self) -> float:
+        """Открытый цикл: пуассоновский поток rate запросов в секунду"""
+        started = time.monotonic()
+        measure_from = started + (0 if self.args.requests is not None else self.args.warmup)
+        limit = asyncio.Semaphore(self.args.concurrency)
+        tasks = []
+        scheduled = started
+
+        async def bounded(index: int, at: float):
+            async with limit:
+                await self._request(index, at, self._is_warmup(index, at, measure_from))
+
+        while not self._done(started):
+            scheduled += self._random.expovariate(self.args.rate)
+            delay = scheduled - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(bounded(self._take(), scheduled)))
+        await asyncio.gather(*tasks)
+        return measure_from
+
+    def report(self, measure_from: float) -> Dict[str, Any]:
+        measured = [r for r in self.results if not r["warmup"]]
+        ok = [r for r in measured if r["error"] is None]
+        errors: Dict[str, int] = {}
+        for r in measured:
+            if r["error"] is not None:
+                errors[r["error"]] = errors.get(r["error"], 0) + 1
+        window_s = (max(r["end"] for r in measured) - min(min(r["scheduled"] for r in measured), measure_from)) if measured else 0.0
+
+        stages: Dict[str, List[float]] = {}
+        for r in ok:
+            for stage, ms in r["stages"].items():
+                stages.setdefault(stage, []).append(ms)
+
+        return {
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "config": {
+                "target": "in-process" if self.args.in_process else self.args.url,
+                "mode": "open" if self.args.rate else "closed",
+                "rate": self.args.rate,
+                "concurrency": self.args.concurrency,
+                "duration_s": self.args.duration,
+                "requests": self.args.requests,
+                "warmup": self.args.warmup,
+                "corpus": self.args.corpus,
+                "corpus_size": len(self.corpus),
+            },
+            "requests": len(measured),
+            "warmup_requests": len(self.results) - len(measured),
+            "errors": sum(errors.values()),
+            "error_rate": sum(errors.values()) / len(measured) if measured else 0.0,
+            "error_types": errors,
+            "throughput_rps": len(ok) / window_s if window_s > 0 else 0.0,
+            "latency_ms": summarize([r["latency_ms"] for r in ok]),
+            "stages_ms": {stage: summarize(values) for stage, values in sorted(stages.items())},
+        }
+
+
+def print_report(report: Dict[str, Any]):
+    config = report["config"]
+    mode = "открытый" if config["mode"] == "open" else "замкнутый"
+    print(f"\n {config['target']}: {mode} цикл, concurrency {config['concurrency']}"
+          + (f", rate {config['rate']}/с" if config["rate"] else ""))
+    print(f" Запросов: {report['requests']} (прогрев {report['warmup_requests']}), "
+          f"ошибок: {report['errors']} ({report['error_rate']:.1%}), "
+          f"пропускная способность: {report['throughput_rps']:.2f} запр/с")
+    if report["error_types"]:
+        print(f" Ошибки: {report['error_types']}")
+
+    def row(name: str, s: Dict[str, Optional[float]]):
+        cells = "".join(f"{s[key]:>10.1f}" if s[key] is not None else f"{'-':>10}" for key in ("p50", "p90", "p99", "max"))
+        print(f"  {name:<22}{s['count']:>7}{cells}")
+
+    print(f"\n  {'этап, мс':<22}{'n':>7}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}")
+    row("запрос (клиент)", report["latency_ms"])
+    for stage, s in report["stages_ms"].items():
+        row(stage, s)
+
+
+@asynccontextmanager
+async def in_process_client():
+    """Приложение в этом процессе на временной БД, upstream - встроенные заглушки"""
+    workdir = tempfile.mkdtemp(prefix="sokrat-load-")
+    os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{workdir}/sokrat.db")
+    os.environ["OPENROUTER_API_KEY"] = ""
+    os.environ["TAVILY_API_KEY"] = ""
+    os.environ.setdefault("LOG_FILE", "")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    from src.db.database import init_db
+    from src.main import create_app
+
+    await init_db()
+    app = create_app()
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://sokrat") as client:
+            yield client
+
+
+async def main(args: argparse.Namespace):
+    corpus = load_corpus(args.corpus)
+    if args.in_process:
+        client_cm = in_process_client()
+    else:
+        client_cm = httpx.AsyncClient(
+            base_url=args.url,
+            limits=httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        )
+    async with client_cm as client:
+        test = LoadTest(client, corpus, args)
+        measure_from = await (test.run_open() if args.rate else test.run_closed())
+
+    report = test.report(measure_from)
+    print_report(report)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n Отчёт сохранён: {args.out}")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000", help="Адрес API")
+    parser.add_argument("--in-process", action="store_true", help="Приложение в этом процессе, upstream - заглушки")
+    parser.add_argument("--concurrency", type=int, default=4, help="Клиентов (замкнутый цикл) или предел одновременных (открытый)")
+    parser.add_argument("--rate", type=float, default=None, help="Запросов в секунду - открытый цикл")
+    parser.add_argument("--duration", type=float, default=30.0, help="Секунд измерения")
+    parser.add_argument("--requests", type=int, default=None, help="Число запросов вместо --duration")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Прогрев: секунды (или запросы при --requests)")
+    parser.add_argument("--corpus", default=None, help="Файл запросов: текст построчно или JSONL")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Таймаут запроса, с")
+    parser.add_argument("--seed", type=int, default=None, help="Зерно генератора интервалов открытого цикла")
+    parser.add_argument("--out", default=None, help="Сохранить отчёт в JSON")
+    args = parser.parse_args()
+    if args.rate is not None and args.rate <= 0:
+        parser.error("--rate должен быть больше 0")
+    return args
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,22 @@
+﻿import asyncio
+import sys
+import os
+
+# Добавляем корневую папку в путь
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.db.fts import rebuild_index
+from src.db.writer import get_writer
+from src.utils.logging_config import configure_logging, get_logger
+
+logger = get_logger(__name__)
+
+async def main():
+    logger.info(" Перестроение полнотекстового индекса документов...")
+    total = await rebuild_index()
+    await get_writer().stop()
+    logger.info(" Готово, документов в индексе: %s", total)
+
+if __name__ == "__main__":
+    configure_logging()
+    asyncio.run(main())
@@ -0,0 +1,61 @@
+﻿"""
+Архивация и восстановление исторических данных.
+
+Примеры:
+    python scripts/retention.py archive --days 30
+    python scripts/retention.py archive --enable-incremental-vacuum
+    python scripts/retention.py restore --from 2025-01-01 --to 2025-01-31
+"""
+import argparse
+import asyncio
+import sys
+import os
+from datetime import date
+
+# Добавляем корневую папку в путь
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from src.db.retention import archive_old_data, restore_archive, enable_incremental_vacuum
+from src.db.writer import get_writer
+from src.utils.logging_config import configure_logging, get_logger
+
+logger = get_logger(__name__)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Архивация старых данных Sokrat")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    archive = sub.add_parser("archive", help="Выгрузить старые данные в архив и удалить из БД")
+    archive.add_argument("--days", type=int, default=None, help="Возраст данных в днях")
+    archive.add_argument("--batch-size", type=int, default=None, help="Запросов в одной пачке")
+    archive.add_argument("--archive-dir", default=None, help="Папка архива")
+    archive.add_argument(
+        "--enable-incremental-vacuum", action="store_true",
+        help="Перевести БД в auto_vacuum=INCREMENTAL (один полный VACUUM)"
+    )
+
+    restore = sub.add_parser("restore", help="Вернуть данные из архива в БД")
+    restore.add_argument("--from", dest="date_from", type=date.fromisoformat, default=None)
+    restore.add_argument("--to", dest="date_to", type=date.fromisoformat, default=None)
+    restore.add_argument("--batch-size", type=int, default=None, help="Строк в одной вставке")
+    restore.add_argument("--archive-dir", default=None, help="Папка архива")
+
+    return parser.parse_args()
+
+async def main():
+    args = parse_args()
+
+    if args.command == "archive":
+        if args.enable_incremental_vacuum:
+            await enable_incremental_vacuum()
+        stats = await archive_old_data(args.days, args.batch_size, args.archive_dir)
+    else:
+        stats = await restore_archive(args.date_from, args.date_to, args.batch_size, args.archive_dir)
+    await get_writer().stop()
+
+    for table, count in stats.items():
+        logger.info("   %s: %s", table, count)
+
+if __name__ == "__main__":
+    configure_logging()
+    asyncio.run(main())
@@ -35,7 +35,7 @@ def test_query(query):
                 print(f"   {flag}")
                 
     except requests.exceptions.ConnectionError:
-        print(" Сервер не запущен! Запусти: uvicorn src.main:app --reload")
+        print(" Сервер не запущен! Запусти: uvicorn src.main:create_app --factory --reload")
     except Exception as e:
         print(f" Ошибка: {e}")
 
@@ -1,8 +1,10 @@
 ﻿from pydantic import BaseModel
-from typing import List, Dict, Optional
+from typing import Any, List, Dict, Optional
+from datetime import datetime
 
 class AnalysisRequest(BaseModel):
     query: str
+    local_first: Optional[bool] = None  # None - по настройке local_first
 
 class SourceInfo(BaseModel):
     url: str
@@ -13,3 +15,21 @@ class AnalysisResponse(BaseModel):
     sources: List[SourceInfo]
     model_analyses: Dict[str, str]
     confidence_flags: List[str]
+
+class JobCreated(BaseModel):
+    job_id: str
+    status: str
+
+class JobStatus(BaseModel):
+    job_id: str
+    status: str  # queued, running, completed, failed
+    stage: Optional[str] = None
+    query: str
+    query_id: Optional[str] = None
+    partial: Optional[Dict[str, Any]] = None
+    result: Optional[AnalysisResponse] = None
+    error: Optional[str] = None
+    attempts: int = 0
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
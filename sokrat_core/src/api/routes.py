@@ -1,24 +1,62 @@
-﻿from fastapi import APIRouter, HTTPException
-from src.api.models import AnalysisRequest, AnalysisResponse
-from src.core.orchestrator import AnalysisOrchestrator
+﻿from typing import Optional
+from fastapi import APIRouter, HTTPException, Request, Response
+from src.api.models import AnalysisRequest, AnalysisResponse, JobCreated, JobStatus
+from src.config import settings
+from src.utils import metrics
 from src.utils.logging_config import get_logger
+from src.utils.tracing import get_tracer
 
+# Оркестратор и очередь задач создаются в lifespan приложения (в каждом
+# воркере свои) и лежат в app.state
 router = APIRouter()
-orchestrator = AnalysisOrchestrator()
 logger = get_logger(__name__)
 
 @router.post("/analyze", response_model=AnalysisResponse)
-async def analyze(request: AnalysisRequest):
+async def analyze(request: AnalysisRequest, http_request: Request):
     """Анализ запроса с веб-поиском и мульти-модельным разбором"""
     try:
-        logger.info(f" Получен запрос: {request.query}")
-        result = await orchestrator.run_analysis(request.query)
+        logger.info(" Получен запрос: %s", request.query[:200])
+        orchestrator = http_request.app.state.orchestrator
+        result = await orchestrator.run_analysis(request.query, local_first=request.local_first)
         logger.info(" Анализ завершён")
         return result
     except Exception as e:
-        logger.error(f" Ошибка: {str(e)}")
+        logger.error(" Ошибка: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/jobs", response_model=JobCreated, status_code=202)
+async def create_job(request: AnalysisRequest, http_request: Request):
+    """Поставить анализ в очередь; результат - GET /jobs/{job_id}"""
+    from src.core.jobs import JobQueueFull
+    try:
+        job_id = await http_request.app.state.jobs.submit(request.query, local_first=request.local_first)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"job_id": job_id, "status": "queued"}
+
+@router.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str, http_request: Request):
+    """Статус задачи, промежуточные и итоговые результаты"""
+    job = await http_request.app.state.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return job
+
+@router.get("/traces")
+async def traces(limit: int = 20, name: Optional[str] = None):
+    """Последние трассы из кольцевого буфера (новые первыми)"""
+    buffer = get_tracer().ring_buffer()
+    if buffer is None:
+        raise HTTPException(status_code=404, detail="Трассировка выключена")
+    return {"traces": buffer.traces(limit=limit, name=name)}
+
+@router.get("/metrics")
+async def metrics_endpoint():
+    """Метрики процесса в текстовом формате Prometheus"""
+    if not settings.metrics_enabled:
+        raise HTTPException(status_code=404, detail="Метрики выключены")
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 @router.get("/health")
 async def health():
     return {"status": "healthy"}
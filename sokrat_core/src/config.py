@@ -1,5 +1,5 @@
 ﻿from pydantic_settings import BaseSettings
-from typing import List
+from typing import Dict, List
 import json
 
 class Settings(BaseSettings):
@@ -9,6 +9,7 @@ class Settings(BaseSettings):
     
     # Database
     database_url: str = "sqlite+aiosqlite:///./data/sokrat.db"
+    db_writer_max_batch: int = 64  # операций в одном групповом коммите
     
     # Search settings
     max_search_results: int = 8
@@ -23,12 +24,55 @@ class Settings(BaseSettings):
     request_timeout: int = 15
     user_agent: str = "Mozilla/5.0 (compatible; SokratBot/1.0)"
     
+    # Local-first: ответ по локальному FTS-индексу без веб-поиска
+    local_first: bool = False
+    local_min_documents: int = 3
+    local_max_age_days: int = 30
+    local_max_chunks: int = 50
+    
     # Models
     models: List[str] = ["openai/gpt-4", "deepseek/deepseek-chat", "qwen/qwen-2.5-72b-instruct"]
     
-    # Logging
+    # LLM-клиент (общий для /analyze и Research Engine)
+    openrouter_base_url: str = "https://openrouter.ai/api/v1"
+    llm_timeout: float = 30.0
+    llm_max_connections: int = 20
+    llm_max_concurrency: int = 16  # одновременных запросов к API
+    
+    # Фоновые задачи анализа (POST /jobs)
+    job_workers: int = 4  # одновременно выполняемых анализов
+    job_queue_size: int = 1000  # задач в очереди, сверх - 503
+    job_lease_seconds: int = 60  # без продления захват истекает, задачу берёт другой процесс
+    
+    # Tracing: спаны этапов в кольцевом буфере (GET /traces) и, если
+    # задан trace_file, в файле OTLP/JSON
+    tracing_enabled: bool = True
+    trace_buffer_size: int = 2048
+    trace_file: str = ""
+    
+    # Metrics: GET /metrics в формате Prometheus, длительности этапов - по спанам
+    metrics_enabled: bool = True
+    server_timing: bool = True  # заголовок Server-Timing с временем этапов запроса
+    
+    # Server: воркеров uvicorn при запуске python -m src.main
+    workers: int = 1
+    
+    # Logging ({pid} в имени файла - свой файл у каждого воркера)
     log_level: str = "INFO"
     log_file: str = "logs/sokrat.log"
+    log_json: bool = False  # JSON Lines вместо текста
+    log_rotation: str = ""  # "size", "time" или "" - без ротации
+    log_max_bytes: int = 50 * 1024 * 1024
+    log_rotate_when: str = "midnight"
+    log_backup_count: int = 7
+    # Доля записей ниже WARNING для шумных логгеров, например {"httpx": 0.1}
+    log_sampling: Dict[str, float] = {}
+    
+    # Retention
+    retention_days: int = 90
+    retention_batch_size: int = 50
+    retention_interval_hours: float = 0  # 0 - фоновая архивация отключена
+    archive_dir: str = "data/archive"
     
     class Config:
         env_file = ".env"
@@ -57,5 +57,5 @@ def clean_documents(documents: List[Dict]) -> List[Dict]:
         
         cleaned.append(doc)
     
-    logger.info(f" Очищено {len(cleaned)} документов")
+    logger.info(" Очищено %d документов", len(cleaned))
     return cleaned
@@ -1,14 +1,23 @@
-﻿import httpx
-import asyncio
-from typing import Dict
+﻿import asyncio
+from typing import Awaitable, Callable, Dict, Optional
 from src.config import settings
+from src.core.llm import get_llm_client
 from src.db import crud
 from src.utils.logging_config import get_logger
 
 logger = get_logger(__name__)
 
-async def dispatch_to_models(query_id: str, context: str) -> Dict[str, str]:
-    """Отправка контекста всем моделям параллельно"""
+async def dispatch_to_models(
+    query_id: str,
+    context: str,
+    on_response: Optional[Callable[[str, str], Awaitable[None]]] = None
+) -> Dict[str, str]:
+    """
+    Отправка контекста всем моделям параллельно.
+    
+    Args:
+        on_response: вызывается с (модель, ответ) по мере ответов моделей
+    """
     
     prompt_template = """На основе следующего материала:
 {context}
@@ -33,80 +42,39 @@ async def dispatch_to_models(query_id: str, context: str) -> Dict[str, str]:
 - Если данных нет  напиши "нет данных в источнике"
 """
 
+    # Общий клиент: пул соединений, лимиты и учёт токенов - в нём
+    client = get_llm_client()
+    
     async def call_model(model_name: str) -> tuple:
-        start_time = asyncio.get_event_loop().time()
-        
         prompt = prompt_template.format(context=context[:10000])
         
-        payload = {
-            "model": model_name,
-            "messages": [
-                {"role": "system", "content": "Ты аналитик, работающий строго по тексту. Не выдумывай."},
-                {"role": "user", "content": prompt}
-            ],
-            "temperature": 0.1
-        }
+        messages = [
+            {"role": "system", "content": "Ты аналитик, работающий строго по тексту. Не выдумывай."},
+            {"role": "user", "content": prompt}
+        ]
         
-        # Если нет ключа OpenRouter - возвращаем заглушку
-        if not settings.openrouter_api_key or settings.openrouter_api_key == "your-openrouter-key-here":
-            mock_response = f"[MOCK] Анализ от {model_name}\n\nКлючевые параметры: 45% эффективность\nНедостающие данные: стоимость, срок службы\nНеопределённость: зависит от погодных условий"
+        try:
+            response = await client.chat(model_name, messages, temperature=0.1)
             
-            # Логируем заглушку
-            elapsed = (asyncio.get_event_loop().time() - start_time) * 1000
+            # Логируем
             await crud.save_model_call({
                 "query_id": query_id,
                 "model_name": model_name,
                 "prompt": prompt,
-                "response": mock_response,
-                "prompt_tokens": 0,
-                "completion_tokens": 0,
-                "total_tokens": 0,
-                "response_time_ms": int(elapsed),
+                "response": response.content,
+                "prompt_tokens": response.prompt_tokens,
+                "completion_tokens": response.completion_tokens,
+                "total_tokens": response.total_tokens,
+                "response_time_ms": response.latency_ms,
                 "status": "success"
             })
             
-            return model_name, mock_response
-        
-        try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(
-                    "https://openrouter.ai/api/v1/chat/completions",
-                    headers={
-                        "Authorization": f"Bearer {settings.openrouter_api_key}",
-                        "Content-Type": "application/json"
-                    },
-                    json=payload
-                )
-                response.raise_for_status()
-                data = response.json()
-                
-                result = data["choices"][0]["message"]["content"]
-                
-                # Получаем токены
-                usage = data.get("usage", {})
-                prompt_tokens = usage.get("prompt_tokens", 0)
-                completion_tokens = usage.get("completion_tokens", 0)
-                total_tokens = usage.get("total_tokens", 0)
-                
-                # Логируем
-                elapsed = (asyncio.get_event_loop().time() - start_time) * 1000
-                await crud.save_model_call({
-                    "query_id": query_id,
-                    "model_name": model_name,
-                    "prompt": prompt,
-                    "response": result,
-                    "prompt_tokens": prompt_tokens,
-                    "completion_tokens": completion_tokens,
-                    "total_tokens": total_tokens,
-                    "response_time_ms": int(elapsed),
-                    "status": "success"
-                })
-                
-                logger.info(f" {model_name} ответил за {int(elapsed)}ms, токенов: {total_tokens}")
-                return model_name, result
+            if not response.mock:
+                logger.info(" %s ответил за %sms, токенов: %s", model_name, response.latency_ms, response.total_tokens)
+            return model_name, response.content
                 
         except Exception as e:
-            logger.error(f" {model_name} ошибка: {str(e)}")
+            logger.error(" %s ошибка: %s", model_name, e)
             
             await crud.save_model_call({
                 "query_id": query_id,
@@ -122,8 +90,14 @@ async def call_model(model_name: str) -> tuple:
             
             return model_name, f"[ERROR: {model_name} failed]"
     
+    async def call_and_report(model_name: str) -> tuple:
+        result = await call_model(model_name)
+        if on_response is not None:
+            await on_response(*result)
+        return result
+    
     # Запускаем все модели параллельно
-    tasks = [call_model(model) for model in settings.models]
+    tasks = [call_and_report(model) for model in settings.models]
     results = await asyncio.gather(*tasks)
     
     return dict(results)
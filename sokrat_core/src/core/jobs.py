@@ -0,0 +1,236 @@
+﻿"""
+Фоновые задачи анализа (POST /jobs, GET /jobs/{id}).
+
+POST /jobs сохраняет задачу в таблицу jobs и сразу возвращает её id;
+ограниченный пул воркеров в процессе приложения выполняет run_analysis.
+Этап и промежуточные результаты (источники, число документов, ответы
+моделей по мере готовности) пишутся в строку задачи, поэтому GET
+/jobs/{id} видит прогресс. Состояние живёт в БД: при старте и затем
+периодически задачи в статусе queued и running с истёкшим захватом
+ставятся в очередь снова, не больше max_attempts запусков на задачу.
+
+Перед запуском воркер захватывает задачу одним UPDATE (owner, lease_until)
+и продлевает захват, пока её выполняет. Поэтому при нескольких воркерах
+uvicorn задачу выполняет один процесс, а running-задачу другого процесса
+можно перезапустить только после истечения её захвата (процесс упал).
+При остановке процесс возвращает свои running-задачи в queued, и их
+подбирает следующий старт или периодический обход другого воркера.
+"""
+import asyncio
+import json
+import os
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+
+from src.config import settings
+from src.core.orchestrator import AnalysisOrchestrator
+from src.db import crud
+from src.db.database import get_engine
+from src.db.models import Job
+from src.utils.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+
+class JobQueueFull(Exception):
+    """Очередь задач заполнена"""
+
+
+class JobManager:
+    """Очередь задач анализа и пул воркеров"""
+
+    def __init__(
+        self,
+        orchestrator: Optional[AnalysisOrchestrator] = None,
+        workers: Optional[int] = None,
+        queue_size: Optional[int] = None,
+        max_attempts: int = 3
+    ):
+        self.orchestrator = orchestrator or AnalysisOrchestrator()
+        self.workers = workers or settings.job_workers
+        self.queue_size = queue_size or settings.job_queue_size
+        self.max_attempts = max_attempts
+        self.lease_seconds = settings.job_lease_seconds
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._queue: Optional[asyncio.Queue] = None
+        # Задачи в локальной очереди: обход не ставит их второй раз
+        self._queued: Set[str] = set()
+        self._tasks: List[asyncio.Task] = []
+        self.running_jobs = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def start(self):
+        """Создать таблицу (если её нет), запустить воркеров и обход незавершённых задач"""
+        if self._tasks:
+            return
+        await _ensure_table()
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._queued = set()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        # Незавершённые задачи могут не поместиться в очередь - ставим в фоне
+        self._tasks.append(asyncio.create_task(self._sweep()))
+
+    async def stop(self):
+        """
+        Остановить воркеров. Выполнявшиеся задачи возвращаются в queued
+        (попытка не засчитывается) и будут запущены заново при следующем
+        старте или другим воркером.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+        self._queued = set()
+        try:
+            released = await crud.release_jobs(self.owner)
+        except Exception as e:
+            logger.warning(" Не удалось вернуть задачи в очередь: %s", e)
+            return
+        if released:
+            logger.info(" Возвращено в очередь выполнявшихся задач: %d", released)
+
+    async def submit(self, query: str, local_first: Optional[bool] = None) -> str:
+        """
+        Создать задачу и поставить в очередь.
+
+        Raises:
+            JobQueueFull: очередь заполнена
+        """
+        if self._queue is None:
+            raise RuntimeError("JobManager не запущен")
+        if self._queue.full():
+            raise JobQueueFull(f"В очереди {self.queue_size} задач")
+        job_id = str(uuid.uuid4())
+        await crud.create_job(job_id, query, local_first)
+        try:
+            self._queue.put_nowait((job_id, query, local_first))
+            self._queued.add(job_id)
+        except asyncio.QueueFull:
+            # Очередь заполнилась, пока создавалась строка задачи
+            await crud.update_job(job_id, status="failed", error="Очередь задач заполнена", finished_at=datetime.utcnow())
+            raise JobQueueFull(f"В очереди {self.queue_size} задач")
+        logger.info(" Задача %s поставлена в очередь", job_id)
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = await crud.get_job(job_id)
+        return job_to_dict(job) if job else None
+
+    async def _sweep(self):
+        """Периодически возвращать в очередь брошенные задачи (захват истёк)"""
+        while True:
+            try:
+                await self._requeue_unfinished()
+            except Exception as e:
+                logger.warning(" Ошибка обхода незавершённых задач: %s", e)
+            await asyncio.sleep(self.lease_seconds)
+
+    async def _requeue_unfinished(self):
+        # running-задачи с действующим захватом выполняет другой процесс
+        now = datetime.utcnow()
+        jobs = [
+            job for job in await crud.list_unfinished_jobs()
+            if job.id not in self._queued
+            and (job.status == "queued" or job.lease_until is None or job.lease_until < now)
+        ]
+        if jobs:
+            logger.info(" Возврат в очередь незавершённых задач: %d", len(jobs))
+        for job in jobs:
+            if (job.attempts or 0) >= self.max_attempts:
+                await crud.fail_abandoned_job(
+                    job.id,
+                    self.max_attempts,
+                    f"Прервана {job.attempts} раз(а), попытки исчерпаны"
+                )
+                continue
+            # Задачу могут поставить в очередь и другие процессы - выполнит
+            # тот, кто первым захватит её в _run
+            self._queued.add(job.id)
+            await self._queue.put((job.id, job.query_text, job.local_first))
+
+    async def _worker(self):
+        while True:
+            job_id, query, local_first = await self._queue.get()
+            self._queued.discard(job_id)
+            self.running_jobs += 1
+            try:
+                await self._run(job_id, query, local_first)
+            except Exception as e:
+                logger.error(" Задача %s упала: %s", job_id, e)
+                await crud.update_job(job_id, status="failed", error=str(e), finished_at=datetime.utcnow())
+            finally:
+                self.running_jobs -= 1
+
+    async def _run(self, job_id: str, query: str, local_first: Optional[bool]):
+        if not await crud.claim_job(job_id, self.owner, self.lease_seconds, self.max_attempts):
+            logger.debug(" Задача %s уже захвачена или завершена", job_id)
+            return
+        renewal = asyncio.create_task(self._renew_lease(job_id))
+        try:
+            await self._execute(job_id, query, local_first)
+        finally:
+            renewal.cancel()
+
+    async def _renew_lease(self, job_id: str):
+        """Продлевать захват задачи, пока она выполняется"""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                if not await crud.renew_job_lease(job_id, self.owner, self.lease_seconds):
+                    logger.warning(" Захват задачи %s потерян", job_id)
+                    return
+            except Exception as e:
+                logger.warning(" Не удалось продлить захват задачи %s: %s", job_id, e)
+
+    async def _execute(self, job_id: str, query: str, local_first: Optional[bool]):
+        partial: Dict[str, Any] = {}
+
+        async def on_progress(stage: str, data: Dict[str, Any]):
+            if stage == "model":
+                partial.setdefault("model_analyses", {})[data["model"]] = data["analysis"]
+            else:
+                partial.update(data)
+            fields = {"stage": stage, "partial": json.dumps(partial, ensure_ascii=False)}
+            if stage == "started":
+                fields["query_id"] = data["query_id"]
+            await crud.update_job(job_id, **fields)
+
+        result = await self.orchestrator.run_analysis(query, local_first=local_first, on_progress=on_progress)
+        await crud.update_job(
+            job_id,
+            status="completed",
+            stage="completed",
+            query_id=result.get("query_id"),
+            result=json.dumps(result, ensure_ascii=False),
+            finished_at=datetime.utcnow()
+        )
+        logger.info(" Задача %s выполнена", job_id)
+
+
+def job_to_dict(job: Job) -> Dict[str, Any]:
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "stage": job.stage,
+        "query": job.query_text,
+        "query_id": job.query_id,
+        "partial": json.loads(job.partial) if job.partial else None,
+        "result": json.loads(job.result) if job.result else None,
+        "error": job.error,
+        "attempts": job.attempts or 0,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+
+async def _ensure_table():
+    """Таблица jobs в БД, созданной до её появления"""
+    engine = get_engine()
+    async with engine.begin() as conn:
+        await conn.run_sync(lambda sync_conn: Job.__table__.create(sync_conn, checkfirst=True))
@@ -0,0 +1,283 @@
+﻿"""
+Единый асинхронный клиент LLM (OpenRouter, chat completions).
+
+Один клиент на процесс (на event loop) обслуживает и /analyze, и
+Research Engine: общий пул соединений httpx, общий лимит одновременных
+запросов, дедупликация одинаковых запросов в полёте (второй вызывающий
+ждёт ответ первого, а не платит за него ещё раз) и учёт токенов и
+задержек по моделям.
+
+Интерфейс для внешних потребителей (Research Engine получает клиент
+через llm_client):
+    response = await client.chat(model, messages, temperature=0.1)
+    response.content, response.total_tokens, response.latency_ms
+"""
+import asyncio
+import hashlib
+import json
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+from pydantic import BaseModel
+
+from src.config import settings
+from src.utils import metrics
+from src.utils.logging_config import get_logger
+from src.utils.tracing import get_tracer
+
+logger = get_logger(__name__)
+
+
+class LLMResponse(BaseModel):
+    """Ответ модели с учётом токенов и задержки"""
+    model: str
+    content: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    total_tokens: int = 0
+    latency_ms: int = 0
+    mock: bool = False  # ответ-заглушка (ключ API не задан)
+    shared: bool = False  # получен дедупликацией чужого запроса
+
+
+class ModelUsage(BaseModel):
+    """Накопленная статистика по модели"""
+    calls: int = 0
+    errors: int = 0
+    deduplicated: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    total_tokens: int = 0
+    latency_ms_total: int = 0
+
+    @property
+    def avg_latency_ms(self) -> float:
+        return self.latency_ms_total / self.calls if self.calls else 0.0
+
+
+class _InflightCall:
+    """Вызов API в отдельной задаче и число ждущих его ответа"""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class LLMClient:
+    """
+    Клиент OpenRouter с общим пулом соединений и лимитом запросов.
+
+    Без ключа API возвращает заглушки, как и раньше dispatcher.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        timeout: Optional[float] = None,
+        max_connections: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        self.api_key = settings.openrouter_api_key if api_key is None else api_key
+        self.base_url = (base_url or settings.openrouter_base_url).rstrip("/")
+        self.timeout = timeout or settings.llm_timeout
+        self.max_connections = max_connections or settings.llm_max_connections
+        self._semaphore = asyncio.Semaphore(max_concurrency or settings.llm_max_concurrency)
+        metrics.LLM_POOL_LIMIT.set(max_concurrency or settings.llm_max_concurrency)
+        self._transport = transport
+        self._http: Optional[httpx.AsyncClient] = None
+        self._inflight: Dict[str, _InflightCall] = {}
+        self.usage: Dict[str, ModelUsage] = {}
+
+    @property
+    def is_mock(self) -> bool:
+        return not self.api_key or self.api_key == "your-openrouter-key-here"
+
+    def _client(self) -> httpx.AsyncClient:
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                ),
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json"
+                },
+                transport=self._transport
+            )
+        return self._http
+
+    async def close(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    def _usage(self, model: str) -> ModelUsage:
+        if model not in self.usage:
+            self.usage[model] = ModelUsage()
+        return self.usage[model]
+
+    def stats(self) -> Dict[str, Any]:
+        """Учёт по моделям: вызовы, ошибки, токены, средняя задержка"""
+        return {
+            model: {**usage.model_dump(), "avg_latency_ms": usage.avg_latency_ms}
+            for model, usage in self.usage.items()
+        }
+
+    @staticmethod
+    def _request_key(payload: Dict[str, Any]) -> str:
+        raw = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def chat(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.1,
+        max_tokens: Optional[int] = None
+    ) -> LLMResponse:
+        """
+        Запрос chat completion. Одинаковые запросы, выполняющиеся
+        одновременно, объединяются в один вызов API.
+
+        Raises:
+            httpx.HTTPError: ошибка сети или API
+        """
+        payload: Dict[str, Any] = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature
+        }
+        if max_tokens is not None:
+            payload["max_tokens"] = max_tokens
+
+        with get_tracer().span("llm.chat", model=model) as span:
+            response = await self._chat(payload)
+            span.set(
+                tokens=response.total_tokens,
+                prompt_tokens=response.prompt_tokens,
+                completion_tokens=response.completion_tokens,
+                shared=response.shared,
+                mock=response.mock
+            )
+            return response
+
+    async def _chat(self, payload: Dict[str, Any]) -> LLMResponse:
+        """
+        Вызов API идёт в отдельной задаче: отмена одного ждущего (в том
+        числе начавшего запрос) не отменяет ответ остальным. Задача
+        отменяется, только когда ждущих не осталось.
+        """
+        model = payload["model"]
+        key = self._request_key(payload)
+        call = self._inflight.get(key)
+        shared = call is not None
+        if shared:
+            self._usage(model).deduplicated += 1
+            metrics.CACHE_REQUESTS.labels(cache="llm_inflight", result="hit").inc()
+        else:
+            metrics.CACHE_REQUESTS.labels(cache="llm_inflight", result="miss").inc()
+            call = self._inflight[key] = _InflightCall(asyncio.create_task(self._call(payload)))
+            call.task.add_done_callback(lambda task: self._call_done(key, call))
+
+        call.waiters += 1
+        try:
+            response = await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Ответ больше никому не нужен; новые запросы начнут свой вызов
+                self._forget_call(key, call)
+                call.task.cancel()
+        return response.model_copy(update={"shared": True}) if shared else response
+
+    def _forget_call(self, key: str, call: _InflightCall):
+        if self._inflight.get(key) is call:
+            del self._inflight[key]
+
+    def _call_done(self, key: str, call: _InflightCall):
+        self._forget_call(key, call)
+        if not call.task.cancelled():
+            # Исключение передаётся ждущим; без них не логировать как необработанное
+            call.task.exception()
+
+    async def _call(self, payload: Dict[str, Any]) -> LLMResponse:
+        model = payload["model"]
+        usage = self._usage(model)
+        start = time.monotonic()
+
+        if self.is_mock:
+            response = LLMResponse(
+                model=model,
+                content=_mock_content(model, payload["messages"]),
+                mock=True
+            )
+        else:
+            async with self._semaphore:
+                metrics.LLM_POOL_IN_USE.inc()
+                try:
+                    http_response = await self._client().post("/chat/completions", json=payload)
+                    http_response.raise_for_status()
+                    data = http_response.json()
+                except Exception:
+                    usage.errors += 1
+                    metrics.LLM_ERRORS.labels(model=model).inc()
+                    raise
+                finally:
+                    metrics.LLM_POOL_IN_USE.dec()
+            tokens = data.get("usage", {})
+            response = LLMResponse(
+                model=model,
+                content=data["choices"][0]["message"]["content"],
+                prompt_tokens=tokens.get("prompt_tokens", 0),
+                completion_tokens=tokens.get("completion_tokens", 0),
+                total_tokens=tokens.get("total_tokens", 0)
+            )
+
+        response.latency_ms = int((time.monotonic() - start) * 1000)
+        usage.calls += 1
+        usage.prompt_tokens += response.prompt_tokens
+        usage.completion_tokens += response.completion_tokens
+        usage.total_tokens += response.total_tokens
+        usage.latency_ms_total += response.latency_ms
+        metrics.LLM_REQUESTS.labels(model=model).inc()
+        metrics.LLM_REQUEST_DURATION.labels(model=model).observe(response.latency_ms / 1000)
+        metrics.LLM_TOKENS.labels(model=model, kind="prompt").inc(response.prompt_tokens)
+        metrics.LLM_TOKENS.labels(model=model, kind="completion").inc(response.completion_tokens)
+        return response
+
+
+def _mock_content(model: str, messages: List[Dict[str, str]]) -> str:
+    return (
+        f"[MOCK] Анализ от {model}\n\n"
+        "Ключевые параметры: 45% эффективность\n"
+        "Недостающие данные: стоимость, срок службы\n"
+        "Неопределённость: зависит от погодных условий"
+    )
+
+
+_clients: Dict[int, Tuple[asyncio.AbstractEventLoop, LLMClient]] = {}
+
+
+def get_llm_client() -> LLMClient:
+    """Общий клиент для текущего event loop (пул соединений привязан к циклу)."""
+    loop = asyncio.get_running_loop()
+    entry = _clients.get(id(loop))
+    if entry is None or entry[0] is not loop:
+        for key in [k for k, (l, _) in _clients.items() if l.is_closed()]:
+            del _clients[key]
+        entry = (loop, LLMClient())
+        _clients[id(loop)] = entry
+    return entry[1]
+
+
+async def close_llm_client():
+    """Закрыть общий клиент текущего event loop (при остановке приложения)."""
+    entry = _clients.pop(id(asyncio.get_running_loop()), None)
+    if entry is not None:
+        await entry[1].close()
@@ -1,68 +1,153 @@
 ﻿import asyncio
 import uuid
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Callable, Awaitable
 
 from src.core.search import search_web
 from src.core.parser import parse_urls
 from src.core.cleaner import clean_documents
 from src.core.dispatcher import dispatch_to_models
+from src.config import settings
+from src.db import fts
 from src.db import crud
+from src.utils import metrics
 from src.utils.logging_config import get_logger
+from src.utils.tracing import get_tracer
 
 logger = get_logger(__name__)
 
+# Колбэк прогресса: (этап, промежуточные данные этапа)
+ProgressCallback = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
 class AnalysisOrchestrator:
-    async def run_analysis(self, query: str) -> Dict[str, Any]:
+    async def run_analysis(
+        self,
+        query: str,
+        local_first: Optional[bool] = None,
+        on_progress: Optional[ProgressCallback] = None
+    ) -> Dict[str, Any]:
+        """
+        Полный анализ запроса.
+        
+        Args:
+            on_progress: вызывается после этапов: 'started' (query_id),
+                'sources', 'documents', 'model' (ответ одной модели)
+        """
         query_id = str(uuid.uuid4())
-        logger.info(f" Старт анализа [{query_id}]: {query}")
+        with get_tracer().span("analysis", query_id=query_id) as span:
+            result = await self._run_analysis(query_id, query, local_first, on_progress)
+            span.set(sources=len(result["sources"]), models=len(result["model_analyses"]))
+            if result["confidence_flags"]:
+                span.set(flags=len(result["confidence_flags"]))
+            return result
+    
+    async def _run_analysis(
+        self,
+        query_id: str,
+        query: str,
+        local_first: Optional[bool],
+        on_progress: Optional[ProgressCallback]
+    ) -> Dict[str, Any]:
+        logger.info(" Старт анализа [%s]: %s", query_id, query[:200])
+        tracer = get_tracer()
+        
+        async def progress(stage: str, data: Dict[str, Any]):
+            if on_progress is not None:
+                await on_progress(stage, data)
+        
+        if local_first is None:
+            local_first = settings.local_first
         
         try:
             # 1. Сохраняем запрос
             await crud.create_query(query_id, query)
+            await progress("started", {"query_id": query_id})
             
-            # 2. Поиск
-            logger.info(" Поиск в интернете...")
-            search_results = await search_web(query)
-            await crud.save_sources(query_id, search_results)
-            logger.info(f" Найдено {len(search_results)} источников")
+            # 2. Локальный индекс (local-first)
+            local_docs = []
+            if local_first:
+                logger.info(" Поиск в локальном индексе...")
+                with tracer.span("local_search") as span:
+                    try:
+                        local_docs = await fts.search_documents(query)
+                    except Exception as e:
+                        span.fail(str(e))
+                        logger.warning(" Локальный индекс недоступен: %s", e)
+                    cache_hit = len(local_docs) >= settings.local_min_documents
+                    span.set(documents=len(local_docs), cache_hit=cache_hit)
+                    metrics.CACHE_REQUESTS.labels(cache="local_index", result="hit" if cache_hit else "miss").inc()
             
-            if not search_results:
-                return {
-                    "query_id": query_id,
-                    "sources": [],
-                    "model_analyses": {},
-                    "confidence_flags": [" Не найдено источников"]
-                }
+            if local_docs and len(local_docs) >= settings.local_min_documents:
+                # Свежих материалов достаточно - веб-поиск и парсинг не нужны
+                logger.info(" Найдено %d локальных документов, веб-поиск пропущен", len(local_docs))
+                await crud.save_sources(query_id, self._local_sources(local_docs))
+                cleaned_docs = local_docs
+                await progress("sources", {"sources": self._source_infos(cleaned_docs)})
+            else:
+                # 3. Поиск
+                logger.info(" Поиск в интернете...")
+                with tracer.span("search") as span:
+                    search_results = await search_web(query)
+                    span.set(results=len(search_results))
+                
+                # Локальные документы, которых нет в выдаче, тоже считаем источниками
+                found_urls = {r["url"] for r in search_results}
+                extra_sources = [
+                    s for s in self._local_sources(local_docs, start_rank=len(search_results) + 1)
+                    if s["url"] not in found_urls
+                ]
+                await crud.save_sources(query_id, search_results + extra_sources)
+                logger.info(" Найдено %d источников", len(search_results))
+                await progress("sources", {"sources": self._source_infos(search_results + extra_sources)})
+                
+                if not search_results and not local_docs:
+                    return {
+                        "query_id": query_id,
+                        "sources": [],
+                        "model_analyses": {},
+                        "confidence_flags": [" Не найдено источников"]
+                    }
+                
+                # 4. Парсинг (страницы, уже найденные локально, не скачиваем)
+                logger.info(" Парсинг страниц...")
+                local_urls = {d["url"] for d in local_docs}
+                urls = [r["url"] for r in search_results if r["url"] not in local_urls]
+                with tracer.span("parse", urls=len(urls)) as span:
+                    parsed_docs = await parse_urls(urls) if urls else []
+                    span.set(documents=len(parsed_docs))
+                
+                if not parsed_docs and not local_docs:
+                    return {
+                        "query_id": query_id,
+                        "sources": [{"url": r["url"], "title": r["title"]} for r in search_results],
+                        "model_analyses": {},
+                        "confidence_flags": [" Не удалось распарсить страницы"]
+                    }
+                
+                # 5. Очистка
+                logger.info(" Очистка текста...")
+                with tracer.span("clean", documents=len(parsed_docs)) as span:
+                    cleaned_docs = clean_documents(parsed_docs)
+                    span.set(chars=sum(len(doc["cleaned_text"]) for doc in cleaned_docs))
+                await crud.save_documents(query_id, cleaned_docs)
+                cleaned_docs = cleaned_docs + local_docs
+                await progress("documents", {"documents": len(cleaned_docs)})
             
-            # 3. Парсинг
-            logger.info(" Парсинг страниц...")
-            urls = [r["url"] for r in search_results]
-            parsed_docs = await parse_urls(urls)
-            
-            if not parsed_docs:
-                return {
-                    "query_id": query_id,
-                    "sources": [{"url": r["url"], "title": r["title"]} for r in search_results],
-                    "model_analyses": {},
-                    "confidence_flags": [" Не удалось распарсить страницы"]
-                }
-            
-            # 4. Очистка
-            logger.info(" Очистка текста...")
-            cleaned_docs = clean_documents(parsed_docs)
-            await crud.save_documents(query_id, cleaned_docs)
-            
-            # 5. Подготовка контекста
+            # 6. Подготовка контекста
             combined_text = "\n\n---\n\n".join([
                 f"[{doc['title']}]({doc['url']})\n{doc['cleaned_text'][:5000]}"
                 for doc in cleaned_docs
             ])
             
-            # 6. Отправка моделям
+            # 7. Отправка моделям
             logger.info(" Отправка запросов к моделям...")
-            model_responses = await dispatch_to_models(query_id, combined_text)
+            with tracer.span("dispatch", models=len(settings.models), context_chars=len(combined_text)):
+                model_responses = await dispatch_to_models(
+                    query_id,
+                    combined_text,
+                    on_response=lambda model, text: progress("model", {"model": model, "analysis": text})
+                )
             
-            # 7. Результат
+            # 8. Результат
             result = {
                 "query_id": query_id,
                 "sources": [
@@ -77,7 +162,7 @@ async def run_analysis(self, query: str) -> Dict[str, Any]:
             return result
             
         except Exception as e:
-            logger.error(f" Критическая ошибка: {str(e)}")
+            logger.error(" Критическая ошибка: %s", e)
             return {
                 "query_id": query_id,
                 "sources": [],
@@ -85,6 +170,21 @@ async def run_analysis(self, query: str) -> Dict[str, Any]:
                 "confidence_flags": [f" Ошибка: {str(e)[:100]}"]
             }
     
+    def _local_sources(self, docs, start_rank: int = 1):
+        """Источники для документов из локального индекса"""
+        return [
+            {
+                "url": doc["url"],
+                "title": doc["title"],
+                "snippet": doc["cleaned_text"][:500],
+                "rank": start_rank + i
+            }
+            for i, doc in enumerate(docs)
+        ]
+    
+    def _source_infos(self, items):
+        return [{"url": item["url"], "title": item["title"]} for item in items]
+    
     def _check_confidence(self, responses):
         flags = []
         for model, resp in responses.items():
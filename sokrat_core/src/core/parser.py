@@ -1,34 +1,70 @@
-﻿import httpx
-from bs4 import BeautifulSoup
-from typing import List, Dict
+﻿"""
+Загрузка и разбор страниц источников.
+
+Страницы загружаются общим клиентом httpx текущего event loop: пул
+соединений (keep-alive, TLS-сессии) переиспользуется между запросами и
+закрывается при остановке приложения (close_http_client в lifespan).
+"""
+import httpx
+from typing import Dict, List, Tuple
 import asyncio
 from src.config import settings
 from src.utils.logging_config import get_logger
+from src.utils.tracing import get_tracer
 
 logger = get_logger(__name__)
 
+_clients: Dict[int, Tuple[asyncio.AbstractEventLoop, httpx.AsyncClient]] = {}
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Общий клиент загрузки страниц для текущего event loop."""
+    loop = asyncio.get_running_loop()
+    entry = _clients.get(id(loop))
+    if entry is None or entry[0] is not loop:
+        for key in [k for k, (l, _) in _clients.items() if l.is_closed()]:
+            del _clients[key]
+        client = httpx.AsyncClient(
+            timeout=settings.request_timeout,
+            follow_redirects=True,
+            headers={"User-Agent": settings.user_agent}
+        )
+        entry = (loop, client)
+        _clients[id(loop)] = entry
+    return entry[1]
+
+
+async def close_http_client():
+    """Закрыть общий клиент текущего event loop (при остановке приложения)."""
+    entry = _clients.pop(id(asyncio.get_running_loop()), None)
+    if entry is not None:
+        await entry[1].aclose()
+
+
 async def parse_urls(urls: List[str]) -> List[Dict]:
     """Параллельный парсинг страниц"""
     
+    tracer = get_tracer()
+    
     async def fetch_and_parse(url: str):
         try:
-            async with httpx.AsyncClient(
-                timeout=settings.request_timeout,
-                follow_redirects=True,
-                headers={"User-Agent": settings.user_agent}
-            ) as client:
+            client = get_http_client()
+            with tracer.span("fetch", url=url) as span:
                 response = await client.get(url)
+                span.set(status_code=response.status_code, bytes=len(response.content))
                 response.raise_for_status()
-                
-                # Проверка типа контента
-                content_type = response.headers.get("content-type", "")
-                if "text/html" not in content_type:
-                    return None
-                
-                # Сохраняем raw_html (обрезаем если слишком большой)
-                raw_html = response.text[:50000]  # Ограничим 50KB для БД
-                
-                # Парсинг
+            
+            # Проверка типа контента
+            content_type = response.headers.get("content-type", "")
+            if "text/html" not in content_type:
+                return None
+            
+            # Сохраняем raw_html (обрезаем если слишком большой)
+            raw_html = response.text[:50000]  # Ограничим 50KB для БД
+            
+            # Парсинг (bs4 и lxml загружаются при первом разборе, а не при старте)
+            from bs4 import BeautifulSoup
+            with tracer.span("parse_html", url=url) as span:
                 soup = BeautifulSoup(response.text, "lxml")
                 
                 # Удаляем мусор
@@ -41,21 +77,22 @@ async def fetch_and_parse(url: str):
                     main_content = soup
                 
                 text = main_content.get_text(separator="\n", strip=True)
-                
-                # Обрезаем если слишком длинно
-                if len(text) > settings.max_page_size_chars:
-                    text = text[:settings.max_page_size_chars] + "...[truncated]"
-                
-                return {
-                    "url": url,
-                    "title": soup.title.string if soup.title else url,
-                    "cleaned_text": text,
-                    "raw_html": raw_html,
-                    "word_count": len(text.split())
-                }
-                
+                span.set(chars=len(text))
+            
+            # Обрезаем если слишком длинно
+            if len(text) > settings.max_page_size_chars:
+                text = text[:settings.max_page_size_chars] + "...[truncated]"
+            
+            return {
+                "url": url,
+                "title": soup.title.string if soup.title else url,
+                "cleaned_text": text,
+                "raw_html": raw_html,
+                "word_count": len(text.split())
+            }
+            
         except Exception as e:
-            logger.warning(f" Ошибка парсинга {url}: {str(e)}")
+            logger.warning(" Ошибка парсинга %s: %s", url, e)
             return None
     
     # Ограничиваем параллельные запросы
@@ -69,6 +106,6 @@ async def bounded_fetch(url):
     results = await asyncio.gather(*tasks)
     
     valid_docs = [r for r in results if r is not None]
-    logger.info(f" Успешно спарсено {len(valid_docs)}/{len(urls)} страниц")
+    logger.info(" Успешно спарсено %d/%d страниц", len(valid_docs), len(urls))
     
     return valid_docs
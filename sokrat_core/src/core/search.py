@@ -59,9 +59,9 @@ async def search_web(query: str) -> List[Dict]:
                     "rank": idx + 1
                 })
             
-            logger.info(f" Найдено {len(results)} результатов")
+            logger.info(" Найдено %d результатов", len(results))
             return results
             
     except Exception as e:
-        logger.error(f" Ошибка поиска: {str(e)}")
+        logger.error(" Ошибка поиска: %s", e)
         return []
@@ -1,27 +1,34 @@
 ﻿from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, update, insert, or_, and_, func
 from src.db.database import AsyncSessionLocal
-from src.db.models import Query, Source, Document, ModelCall
-from datetime import datetime
+from src.db import fts
+from src.db.writer import get_writer
+from src.db.models import Query, Source, Document, ModelCall, Job, Lease
+from datetime import datetime, timedelta
+import uuid
 from src.utils.logging_config import get_logger
 
 logger = get_logger(__name__)
 
+# Все записи идут через единственного писателя (src.db.writer): операции
+# из конкурентных запросов объединяются в групповые коммиты.
+
 async def create_query(query_id: str, query_text: str):
     """Создать запись о запросе"""
-    async with AsyncSessionLocal() as session:
-        query = Query(
+    async def op(session: AsyncSession):
+        session.add(Query(
             id=query_id,
             query_text=query_text,
             timestamp=datetime.utcnow()
-        )
-        session.add(query)
-        await session.commit()
-    logger.debug(f"Query saved: {query_id}")
+        ))
+        await session.flush()
+    
+    await get_writer().submit(op)
+    logger.debug("Query saved: %s", query_id)
 
 async def save_sources(query_id: str, sources: list):
     """Сохранить найденные источники"""
-    async with AsyncSessionLocal() as session:
+    async def op(session: AsyncSession):
         for src in sources:
             source = Source(
                 query_id=query_id,
@@ -31,33 +38,42 @@ async def save_sources(query_id: str, sources: list):
                 rank=src["rank"]
             )
             session.add(source)
-        await session.commit()
-    logger.debug(f"Saved {len(sources)} sources for query {query_id}")
+        await session.flush()
+    
+    await get_writer().submit(op)
+    logger.debug("Saved %d sources for query %s", len(sources), query_id)
 
 async def save_documents(query_id: str, documents: list):
-    """Сохранить распарсенные документы с raw_html"""
-    async with AsyncSessionLocal() as session:
+    """Сохранить распарсенные документы с raw_html и обновить FTS-индекс"""
+    async def op(session: AsyncSession):
         for doc in documents:
-            # Находим source по url
+            # Находим source по url (тот же url мог встречаться в других запросах)
             result = await session.execute(
-                select(Source).where(Source.url == doc["url"])
+                select(Source).where(
+                    Source.query_id == query_id,
+                    Source.url == doc["url"]
+                )
             )
-            source = result.scalar_one()
+            source = result.scalars().first()
             
             document = Document(
+                id=str(uuid.uuid4()),
                 source_id=source.id,
                 cleaned_text=doc["cleaned_text"],
                 raw_html=doc.get("raw_html", ""),  # Добавлено
                 word_count=doc["word_count"]
             )
             session.add(document)
-        await session.commit()
-    logger.debug(f"Saved {len(documents)} documents for query {query_id}")
+            await fts.index_document(session, document.id, doc.get("title"), doc["cleaned_text"])
+        await session.flush()
+    
+    await get_writer().submit(op)
+    logger.debug("Saved %d documents for query %s", len(documents), query_id)
 
 async def save_model_call(call_data: dict):
     """Сохранить вызов модели с токенами"""
-    async with AsyncSessionLocal() as session:
-        call = ModelCall(
+    async def op(session: AsyncSession):
+        session.add(ModelCall(
             query_id=call_data["query_id"],
             model_name=call_data["model_name"],
             prompt=call_data["prompt"],
@@ -68,10 +84,11 @@ async def save_model_call(call_data: dict):
             response_time_ms=call_data.get("response_time_ms"),
             status=call_data["status"],
             error_message=call_data.get("error_message")
-        )
-        session.add(call)
-        await session.commit()
-    logger.debug(f"Saved model call for {call_data['model_name']}")
+        ))
+        await session.flush()
+    
+    await get_writer().submit(op)
+    logger.debug("Saved model call for %s", call_data['model_name'])
 
 async def get_query_stats(query_id: str):
     """Получить статистику по запросу (для проверки)"""
@@ -100,3 +117,148 @@ async def get_query_stats(query_id: str):
             "model_calls_count": len(calls),
             "total_tokens": sum(c.total_tokens or 0 for c in calls)
         }
+
+async def create_job(job_id: str, query_text: str, local_first=None):
+    """Создать фоновую задачу анализа в статусе queued"""
+    async def op(session: AsyncSession):
+        session.add(Job(
+            id=job_id,
+            query_text=query_text,
+            local_first=local_first,
+            status="queued",
+            created_at=datetime.utcnow()
+        ))
+        await session.flush()
+    
+    await get_writer().submit(op)
+    logger.debug("Job created: %s", job_id)
+
+async def update_job(job_id: str, **fields):
+    """Обновить поля задачи (status, stage, partial, result, error, ...)"""
+    async def op(session: AsyncSession):
+        await session.execute(update(Job).where(Job.id == job_id).values(**fields))
+    
+    await get_writer().submit(op)
+
+async def get_job(job_id: str):
+    """Задача по id или None"""
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(select(Job).where(Job.id == job_id))
+        return result.scalar_one_or_none()
+
+async def list_unfinished_jobs():
+    """Задачи в статусах queued и running, старые первыми (для повторного запуска)"""
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(Job)
+            .where(Job.status.in_(("queued", "running")))
+            .order_by(Job.created_at)
+        )
+        return result.scalars().all()
+
+def _job_claimable(now: datetime):
+    """Задача ждёт запуска или её захват истёк (процесс-владелец умер)"""
+    return or_(
+        Job.status == "queued",
+        and_(Job.status == "running", or_(Job.lease_until.is_(None), Job.lease_until < now))
+    )
+
+async def claim_job(job_id: str, owner: str, lease_seconds: float, max_attempts: int) -> bool:
+    """
+    Атомарно захватить задачу для выполнения (status=running, owner,
+    attempts+1). False - задачу уже взял другой воркер или процесс,
+    либо попытки исчерпаны.
+    """
+    async def op(session: AsyncSession):
+        now = datetime.utcnow()
+        result = await session.execute(
+            update(Job)
+            .where(Job.id == job_id, _job_claimable(now), func.coalesce(Job.attempts, 0) < max_attempts)
+            .values(
+                status="running",
+                owner=owner,
+                attempts=func.coalesce(Job.attempts, 0) + 1,
+                lease_until=now + timedelta(seconds=lease_seconds),
+                started_at=now,
+                partial=None
+            )
+        )
+        return result.rowcount == 1
+    
+    return await get_writer().submit(op)
+
+async def renew_job_lease(job_id: str, owner: str, lease_seconds: float) -> bool:
+    """Продлить захват задачи владельцем. False - задача больше не его."""
+    async def op(session: AsyncSession):
+        result = await session.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.owner == owner, Job.status == "running")
+            .values(lease_until=datetime.utcnow() + timedelta(seconds=lease_seconds))
+        )
+        return result.rowcount == 1
+    
+    return await get_writer().submit(op)
+
+async def release_jobs(owner: str) -> int:
+    """
+    Вернуть в queued задачи, которые выполняет owner (при остановке
+    процесса). Прерванная остановкой попытка не засчитывается.
+    """
+    async def op(session: AsyncSession):
+        result = await session.execute(
+            update(Job)
+            .where(Job.owner == owner, Job.status == "running")
+            .values(
+                status="queued",
+                owner=None,
+                lease_until=None,
+                attempts=func.max(func.coalesce(Job.attempts, 0) - 1, 0)
+            )
+        )
+        return result.rowcount
+    
+    return await get_writer().submit(op)
+
+async def fail_abandoned_job(job_id: str, max_attempts: int, error: str) -> bool:
+    """Пометить failed задачу, брошенную max_attempts раз, если её никто не выполняет"""
+    async def op(session: AsyncSession):
+        now = datetime.utcnow()
+        result = await session.execute(
+            update(Job)
+            .where(Job.id == job_id, _job_claimable(now), func.coalesce(Job.attempts, 0) >= max_attempts)
+            .values(status="failed", error=error, finished_at=now)
+        )
+        return result.rowcount == 1
+    
+    return await get_writer().submit(op)
+
+async def acquire_lease(name: str, owner: str, lease_seconds: float) -> bool:
+    """
+    Захватить или продлить именованный захват. False - он у другого
+    процесса и ещё не истёк.
+    """
+    async def op(session: AsyncSession):
+        now = datetime.utcnow()
+        await session.execute(insert(Lease).prefix_with("OR IGNORE").values(name=name))
+        result = await session.execute(
+            update(Lease)
+            .where(
+                Lease.name == name,
+                or_(Lease.owner == owner, Lease.owner.is_(None), Lease.lease_until.is_(None), Lease.lease_until < now)
+            )
+            .values(owner=owner, lease_until=now + timedelta(seconds=lease_seconds))
+        )
+        return result.rowcount == 1
+    
+    return await get_writer().submit(op)
+
+async def release_lease(name: str, owner: str):
+    """Отпустить захват, если он принадлежит owner"""
+    async def op(session: AsyncSession):
+        await session.execute(
+            update(Lease)
+            .where(Lease.name == name, Lease.owner == owner)
+            .values(owner=None, lease_until=None)
+        )
+    
+    await get_writer().submit(op)
@@ -1,27 +1,61 @@
-﻿from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+﻿from typing import Optional
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
 from src.config import settings
 from src.db.models import Base
 from pathlib import Path
 
-# Создаём папку data если нет
-Path("data").mkdir(exist_ok=True)
+# Engine создаётся при первом обращении, а не при импорте: в каждом
+# воркере свой (пул соединений не переживает fork) и закрывается в lifespan
+_engine: Optional[AsyncEngine] = None
+_sessionmaker: Optional[sessionmaker] = None
 
-engine = create_async_engine(
-    settings.database_url,
-    echo=False,
-    future=True
-)
+def get_engine() -> AsyncEngine:
+    global _engine
+    if _engine is None:
+        url = make_url(settings.database_url)
+        if url.get_backend_name() == "sqlite" and url.database and url.database != ":memory:":
+            # Создаём папку БД если нет
+            Path(url.database).parent.mkdir(parents=True, exist_ok=True)
+        _engine = create_async_engine(
+            settings.database_url,
+            echo=False,
+            future=True
+        )
+    return _engine
 
-AsyncSessionLocal = sessionmaker(
-    engine,
-    class_=AsyncSession,
-    expire_on_commit=False
-)
+def AsyncSessionLocal() -> AsyncSession:
+    """Новая сессия на общем engine"""
+    global _sessionmaker
+    engine = get_engine()
+    if _sessionmaker is None or _sessionmaker.kw["bind"] is not engine:
+        _sessionmaker = sessionmaker(
+            engine,
+            class_=AsyncSession,
+            expire_on_commit=False
+        )
+    return _sessionmaker()
+
+async def dispose_engine():
+    """Закрыть пул соединений (при остановке приложения)"""
+    global _engine, _sessionmaker
+    if _engine is not None:
+        await _engine.dispose()
+    _engine = None
+    _sessionmaker = None
 
 async def init_db():
+    engine = get_engine()
     async with engine.begin() as conn:
+        if engine.dialect.name == "sqlite":
+            # Действует только для новой БД (до создания таблиц)
+            await conn.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
         await conn.run_sync(Base.metadata.create_all)
+        if engine.dialect.name == "sqlite":
+            # Локальный импорт: fts сам зависит от engine
+            from src.db.fts import ensure_fts
+            await ensure_fts(conn)
 
 async def get_db():
     async with AsyncSessionLocal() as session:
@@ -0,0 +1,241 @@
+﻿"""
+Полнотекстовый индекс (SQLite FTS5) по очищенным документам.
+
+Каждый документ режется на абзацы, абзацы индексируются вместе с
+заголовком источника. Индекс обновляется в той же транзакции, что и
+запись документа (crud.save_documents), и позволяет отвечать на
+повторяющиеся запросы без веб-поиска и скачивания страниц.
+"""
+import json
+import re
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import text
+
+from src.config import settings
+from src.db.database import get_engine
+from src.db.writer import get_writer
+from src.utils.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+FTS_TABLE = "document_chunks"
+MIN_CHUNK_CHARS = 200
+MAX_CHUNK_CHARS = 2000
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+_INSERT_CHUNK = text(
+    f"INSERT INTO {FTS_TABLE} (content, title, document_id, chunk_no) "
+    "VALUES (:content, :title, :document_id, :chunk_no)"
+)
+
+
+async def ensure_fts(conn):
+    """Создать FTS5-таблицу, если её нет."""
+    await conn.execute(text(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        "content, title, document_id UNINDEXED, chunk_no UNINDEXED, "
+        "tokenize = 'unicode61 remove_diacritics 2')"
+    ))
+
+
+async def ensure_index():
+    """
+    Индекс в БД, созданной до его появления: crud.save_documents пишет
+    в него каждый документ. Вызывается при старте приложения.
+    """
+    engine = get_engine()
+    if engine.dialect.name != "sqlite":
+        return
+    async with engine.begin() as conn:
+        await ensure_fts(conn)
+
+
+def split_chunks(cleaned_text: str) -> List[str]:
+    """
+    Разбить текст на чанки по абзацам.
+    Короткие соседние абзацы склеиваются, длинные режутся.
+    """
+    chunks = []
+    current = ""
+    for paragraph in (cleaned_text or "").split("\n\n"):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        while len(paragraph) > MAX_CHUNK_CHARS:
+            chunks.append(paragraph[:MAX_CHUNK_CHARS])
+            paragraph = paragraph[MAX_CHUNK_CHARS:]
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+        if len(current) >= MIN_CHUNK_CHARS:
+            chunks.append(current)
+            current = ""
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+async def index_document(conn, document_id: str, title: Optional[str], cleaned_text: str) -> int:
+    """Добавить документ в индекс. Возвращает число чанков."""
+    rows = [
+        {"content": chunk, "title": title or "", "document_id": document_id, "chunk_no": i}
+        for i, chunk in enumerate(split_chunks(cleaned_text))
+    ]
+    if rows:
+        await conn.execute(_INSERT_CHUNK, rows)
+    return len(rows)
+
+
+async def delete_documents(conn, document_ids: Sequence[str]):
+    """Убрать документы из индекса."""
+    if not document_ids:
+        return
+    await conn.execute(
+        text(f"DELETE FROM {FTS_TABLE} WHERE document_id = :document_id"),
+        [{"document_id": doc_id} for doc_id in document_ids]
+    )
+
+
+async def reindex_documents(conn, document_ids: Sequence[str]) -> int:
+    """Переиндексировать документы по id (после восстановления из архива)."""
+    if not document_ids:
+        return 0
+    await delete_documents(conn, document_ids)
+    result = await conn.execute(
+        text(
+            "SELECT d.id, d.cleaned_text, s.title FROM documents d "
+            "LEFT JOIN sources s ON s.id = d.source_id "
+            "WHERE d.id IN (SELECT value FROM json_each(:ids))"
+        ),
+        {"ids": json.dumps(list(document_ids))}
+    )
+    count = 0
+    for doc_id, cleaned_text, title in result.fetchall():
+        count += await index_document(conn, doc_id, title, cleaned_text)
+    return count
+
+
+async def rebuild_index(batch_size: int = 200) -> int:
+    """
+    Полностью перестроить индекс по таблице documents.
+    Документы читаются пачками по rowid, чтобы не держать всё в памяти;
+    индекс пишется через единственного писателя.
+    """
+    engine = get_engine()
+    writer = get_writer()
+    total_docs = 0
+    total_chunks = 0
+
+    async def clear(session):
+        await ensure_fts(session)
+        await session.execute(text(f"DELETE FROM {FTS_TABLE}"))
+
+    await writer.submit(clear)
+
+    last_rowid = 0
+    while True:
+        async with engine.connect() as conn:
+            result = await conn.execute(
+                text(
+                    "SELECT d.rowid, d.id, d.cleaned_text, s.title FROM documents d "
+                    "LEFT JOIN sources s ON s.id = d.source_id "
+                    "WHERE d.rowid > :last ORDER BY d.rowid LIMIT :limit"
+                ),
+                {"last": last_rowid, "limit": batch_size}
+            )
+            rows = result.fetchall()
+        if not rows:
+            break
+
+        async def index_batch(session):
+            chunks = 0
+            for _, doc_id, cleaned_text, title in rows:
+                chunks += await index_document(session, doc_id, title, cleaned_text)
+            return chunks
+
+        total_chunks += await writer.submit(index_batch)
+        last_rowid = rows[-1][0]
+        total_docs += len(rows)
+        logger.info(" Проиндексировано документов: %s", total_docs)
+
+    logger.info(" Индекс перестроен: %s документов, %s чанков", total_docs, total_chunks)
+    return total_docs
+
+
+def _query_terms(query: str) -> List[str]:
+    return [t.lower() for t in _WORD_RE.findall(query) if len(t) > 1]
+
+
+def _match_expression(terms: List[str]) -> str:
+    # Каждое слово в кавычках: пользовательский ввод не должен
+    # интерпретироваться как синтаксис FTS5
+    return " OR ".join(f'"{t}"' for t in terms)
+
+
+def _coverage(terms: List[str], content: str) -> float:
+    lowered = content.lower()
+    return sum(1 for t in terms if t in lowered) / len(terms)
+
+
+async def search_documents(
+    query: str,
+    max_age_days: Optional[int] = None,
+    limit: Optional[int] = None,
+    min_coverage: float = 0.5
+) -> List[Dict]:
+    """
+    Найти свежие локальные документы по запросу (ранжирование BM25).
+
+    Returns:
+        Документы в формате parse_urls/clean_documents: url, title,
+        cleaned_text (совпавшие абзацы по релевантности), word_count, score
+    """
+    engine = get_engine()
+    terms = _query_terms(query)
+    if not terms:
+        return []
+
+    max_age_days = settings.local_max_age_days if max_age_days is None else max_age_days
+    limit = limit or settings.local_max_chunks
+    fresh_since = (datetime.utcnow() - timedelta(days=max_age_days)).isoformat(sep=" ")
+
+    async with engine.connect() as conn:
+        result = await conn.execute(
+            text(
+                f"SELECT f.document_id, f.content, bm25({FTS_TABLE}, 1.0, 2.0) AS score, "
+                "s.url, s.title "
+                f"FROM {FTS_TABLE} f "
+                "JOIN documents d ON d.id = f.document_id "
+                "JOIN sources s ON s.id = d.source_id "
+                f"WHERE {FTS_TABLE} MATCH :match AND d.created_at >= :fresh_since "
+                "ORDER BY score LIMIT :limit"
+            ),
+            {"match": _match_expression(terms), "fresh_since": fresh_since, "limit": limit}
+        )
+        rows = result.fetchall()
+
+    # Группируем чанки по URL: один и тот же источник мог скачиваться
+    # разными запросами
+    docs: Dict[str, Dict] = {}
+    for document_id, content, score, url, title in rows:
+        if _coverage(terms, content) < min_coverage:
+            continue
+        doc = docs.setdefault(url, {
+            "url": url,
+            "title": title or url,
+            "chunks": [],
+            "score": score
+        })
+        if content not in doc["chunks"]:
+            doc["chunks"].append(content)
+
+    found = []
+    for doc in docs.values():
+        cleaned_text = "\n\n".join(doc.pop("chunks"))
+        doc["cleaned_text"] = cleaned_text
+        doc["word_count"] = len(cleaned_text.split())
+        found.append(doc)
+
+    logger.info(" Локальный индекс: %d документов по запросу", len(found))
+    return found
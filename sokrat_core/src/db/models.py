@@ -1,4 +1,4 @@
-﻿from sqlalchemy import Column, String, Text, Integer, DateTime, ForeignKey
+﻿from sqlalchemy import Column, String, Text, Integer, DateTime, ForeignKey, Boolean
 from sqlalchemy.ext.declarative import declarative_base
 import uuid
 from datetime import datetime
@@ -49,3 +49,31 @@ class ModelCall(Base):
     status = Column(String(50))
     error_message = Column(Text)
     created_at = Column(DateTime, default=datetime.utcnow)
+
+class Job(Base):
+    """Фоновая задача анализа (POST /jobs)"""
+    __tablename__ = "jobs"
+    
+    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    query_text = Column(Text, nullable=False)
+    local_first = Column(Boolean, nullable=True)
+    status = Column(String(20), nullable=False, default="queued", index=True)  # queued, running, completed, failed
+    stage = Column(String(50))  # последний пройденный этап
+    query_id = Column(String(36))  # запрос в queries, когда анализ начат
+    partial = Column(Text)  # JSON: промежуточные результаты этапов
+    result = Column(Text)  # JSON: итог run_analysis
+    error = Column(Text)
+    attempts = Column(Integer, default=0)
+    owner = Column(String(64))  # процесс, захвативший задачу
+    lease_until = Column(DateTime)  # захват действителен до; продлевается, пока задача выполняется
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+class Lease(Base):
+    """Захват фоновой работы одним процессом из нескольких воркеров (например, архивации)"""
+    __tablename__ = "leases"
+    
+    name = Column(String(50), primary_key=True)
+    owner = Column(String(64))
+    lease_until = Column(DateTime)
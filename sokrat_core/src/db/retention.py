@@ -0,0 +1,302 @@
+﻿"""
+Ретеншн и архивация исторических данных.
+
+Запросы старше заданного возраста вместе с источниками, документами и
+вызовами моделей выгружаются в сжатые JSONL-архивы, разбитые по дате
+запроса (<archive_dir>/date=YYYY-MM-DD/<table>.jsonl.gz), и удаляются из
+рабочей БД пачками. После удаления выполняется incremental vacuum, чтобы
+файл БД реально уменьшался. Удаление и восстановление идут через
+единственного писателя (src.db.writer), как и остальные записи.
+
+При нескольких воркерах фоновую архивацию выполняет один процесс:
+retention_loop каждого воркера пытается взять захват RETENTION_LEASE в
+таблице leases, остальные пропускают свой цикл. Если владелец умер,
+захват истекает и его берёт другой воркер.
+"""
+import asyncio
+import gzip
+import json
+import os
+import uuid
+from datetime import datetime, timedelta, date
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from sqlalchemy import select, delete, insert, DateTime
+
+from src.config import settings
+from src.db.database import get_engine
+from src.db import fts
+from src.db import crud
+from src.db.models import Query, Source, Document, ModelCall, Lease
+from src.db.writer import get_writer
+from src.utils.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Порядок восстановления: сначала родители, потом зависимые таблицы.
+# Удаление идёт в обратном порядке.
+RESTORE_ORDER = [Query.__table__, Source.__table__, Document.__table__, ModelCall.__table__]
+
+
+def _row_to_dict(table, row) -> Dict:
+    data = {}
+    for column in table.columns:
+        value = row._mapping[column]
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        data[column.name] = value
+    return data
+
+
+def _dict_to_row(table, data: Dict) -> Dict:
+    row = {}
+    for column in table.columns:
+        value = data.get(column.name)
+        if value is not None and isinstance(column.type, DateTime):
+            value = datetime.fromisoformat(value)
+        row[column.name] = value
+    return row
+
+
+def _partition_dir(archive_dir: Path, day: date) -> Path:
+    return archive_dir / f"date={day.isoformat()}"
+
+
+def _append_jsonl(path: Path, rows: List[Dict]):
+    """Дописать строки в gzip-архив (каждый вызов — отдельный gzip member)."""
+    if not rows:
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with gzip.open(path, "at", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False))
+            f.write("\n")
+
+
+async def _incremental_vacuum(conn):
+    mode = (await conn.exec_driver_sql("PRAGMA auto_vacuum")).scalar()
+    if mode != 2:
+        logger.warning(
+            " auto_vacuum не в режиме INCREMENTAL, место не освобождается. "
+            "Запусти scripts/retention.py archive --enable-incremental-vacuum"
+        )
+        return
+    # sqlite3.execute делает один шаг прагмы (= одна страница),
+    # executescript прогоняет её до конца
+    raw = await conn.get_raw_connection()
+    await raw.driver_connection.executescript("PRAGMA incremental_vacuum;")
+
+
+async def enable_incremental_vacuum():
+    """
+    Перевести существующую БД в режим auto_vacuum=INCREMENTAL.
+    Требует одного полного VACUUM, поэтому запускается только вручную.
+    """
+    engine = get_engine()
+    if engine.dialect.name != "sqlite":
+        return
+    async with engine.connect() as conn:
+        mode = (await conn.exec_driver_sql("PRAGMA auto_vacuum")).scalar()
+        if mode == 2:
+            return
+        logger.info(" Включаю auto_vacuum=INCREMENTAL (полный VACUUM)...")
+        await conn.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+        await conn.exec_driver_sql("VACUUM")
+
+
+async def archive_old_data(
+    days: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    archive_dir: Optional[str] = None
+) -> Dict[str, int]:
+    """
+    Выгрузить в архив и удалить запросы старше `days` дней.
+
+    Данные обрабатываются пачками по `batch_size` запросов: пачка
+    записывается в архив, затем прочитанные строки удаляются одной
+    транзакцией. Архив пишется до удаления, поэтому при сбое строки могут
+    попасть в архив дважды — восстановление это учитывает.
+
+    Returns:
+        Количество архивированных строк по таблицам
+    """
+    engine = get_engine()
+    days = settings.retention_days if days is None else days
+    batch_size = batch_size or settings.retention_batch_size
+    archive_root = Path(archive_dir or settings.archive_dir)
+    cutoff = datetime.utcnow() - timedelta(days=days)
+
+    stats = {table.name: 0 for table in RESTORE_ORDER}
+    logger.info(" Архивация данных старше %s в %s", cutoff.isoformat(), archive_root)
+
+    while True:
+        async with engine.connect() as conn:
+            result = await conn.execute(
+                select(Query.__table__)
+                .where(Query.timestamp < cutoff)
+                .order_by(Query.timestamp)
+                .limit(batch_size)
+            )
+            queries = result.fetchall()
+            if not queries:
+                break
+
+            query_ids = [q.id for q in queries]
+            query_dates = {q.id: (q.timestamp or cutoff).date() for q in queries}
+
+            sources = (await conn.execute(
+                select(Source.__table__).where(Source.query_id.in_(query_ids))
+            )).fetchall()
+            source_ids = [s.id for s in sources]
+            source_dates = {s.id: query_dates[s.query_id] for s in sources}
+
+            documents = (await conn.execute(
+                select(Document.__table__).where(Document.source_id.in_(source_ids))
+            )).fetchall()
+            calls = (await conn.execute(
+                select(ModelCall.__table__).where(ModelCall.query_id.in_(query_ids))
+            )).fetchall()
+
+        # Раскладываем строки по партициям (дата запроса)
+        partitions: Dict[tuple, List[Dict]] = {}
+        for table, rows, day_of in (
+            (Query.__table__, queries, lambda r: query_dates[r.id]),
+            (Source.__table__, sources, lambda r: source_dates[r.id]),
+            (Document.__table__, documents, lambda r: source_dates.get(r.source_id, cutoff.date())),
+            (ModelCall.__table__, calls, lambda r: query_dates[r.query_id]),
+        ):
+            for row in rows:
+                partitions.setdefault((day_of(row), table.name), []).append(
+                    _row_to_dict(table, row)
+                )
+            stats[table.name] += len(rows)
+
+        await asyncio.to_thread(_write_partitions, archive_root, partitions)
+
+        # Удаляются только прочитанные строки: записанное после чтения
+        # не пропадёт, не попав в архив
+        document_ids = [d.id for d in documents]
+        call_ids = [c.id for c in calls]
+
+        async def delete_batch(session):
+            # Удаляем в порядке от зависимых таблиц к родительским
+            if engine.dialect.name == "sqlite":
+                await fts.delete_documents(session, document_ids)
+            await session.execute(delete(Document.__table__).where(Document.id.in_(document_ids)))
+            await session.execute(delete(Source.__table__).where(Source.id.in_(source_ids)))
+            await session.execute(delete(ModelCall.__table__).where(ModelCall.id.in_(call_ids)))
+            await session.execute(delete(Query.__table__).where(Query.id.in_(query_ids)))
+
+        await get_writer().submit(delete_batch)
+        logger.info(" Архивировано запросов: %s", stats['queries'])
+
+    if engine.dialect.name == "sqlite" and stats["queries"]:
+        async with engine.connect() as conn:
+            await _incremental_vacuum(conn)
+
+    logger.info(" Архивация завершена: %s", stats)
+    return stats
+
+
+def _write_partitions(archive_root: Path, partitions: Dict[tuple, List[Dict]]):
+    for (day, table_name), rows in partitions.items():
+        _append_jsonl(_partition_dir(archive_root, day) / f"{table_name}.jsonl.gz", rows)
+
+
+def _iter_partitions(archive_root: Path, date_from: Optional[date], date_to: Optional[date]):
+    for path in sorted(archive_root.glob("date=*")):
+        try:
+            day = date.fromisoformat(path.name.split("=", 1)[1])
+        except ValueError:
+            continue
+        if date_from and day < date_from:
+            continue
+        if date_to and day > date_to:
+            continue
+        yield day, path
+
+
+async def restore_archive(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    batch_size: Optional[int] = None,
+    archive_dir: Optional[str] = None
+) -> Dict[str, int]:
+    """
+    Вернуть данные из архива в рабочую БД.
+
+    Строки вставляются через INSERT OR IGNORE, поэтому повторное
+    восстановление одной и той же партиции безопасно.
+    """
+    batch_size = batch_size or settings.retention_batch_size
+    archive_root = Path(archive_dir or settings.archive_dir)
+    stats = {table.name: 0 for table in RESTORE_ORDER}
+
+    for day, partition in _iter_partitions(archive_root, date_from, date_to):
+        for table in RESTORE_ORDER:
+            path = partition / f"{table.name}.jsonl.gz"
+            if not path.exists():
+                continue
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                batch = []
+                for line in f:
+                    if not line.strip():
+                        continue
+                    batch.append(_dict_to_row(table, json.loads(line)))
+                    if len(batch) >= batch_size:
+                        stats[table.name] += await _restore_batch(table, batch)
+                        batch = []
+                if batch:
+                    stats[table.name] += await _restore_batch(table, batch)
+        logger.info(" Восстановлена партиция %s", day.isoformat())
+
+    logger.info(" Восстановление завершено: %s", stats)
+    return stats
+
+
+async def _restore_batch(table, rows: List[Dict]) -> int:
+    engine = get_engine()
+
+    async def restore(session):
+        result = await session.execute(insert(table).prefix_with("OR IGNORE"), rows)
+        if table is Document.__table__ and engine.dialect.name == "sqlite":
+            await fts.reindex_documents(session, [row["id"] for row in rows])
+        return max(result.rowcount, 0)
+
+    return await get_writer().submit(restore)
+
+
+RETENTION_LEASE = "retention"
+
+
+async def _ensure_lease_table():
+    """Таблица leases в БД, созданной до её появления"""
+    async with get_engine().begin() as conn:
+        await conn.run_sync(lambda sync_conn: Lease.__table__.create(sync_conn, checkfirst=True))
+
+
+async def retention_loop(interval_hours: float):
+    """
+    Фоновая задача: периодический запуск архивации. Архивирует только
+    процесс, владеющий захватом; захват держится два интервала и
+    продлевается каждый цикл.
+    """
+    owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    lease_seconds = interval_hours * 3600 * 2
+    await _ensure_lease_table()
+    try:
+        while True:
+            try:
+                if await crud.acquire_lease(RETENTION_LEASE, owner, lease_seconds):
+                    await archive_old_data()
+                else:
+                    logger.debug(" Архивацию выполняет другой процесс")
+            except Exception as e:
+                logger.error(" Ошибка архивации: %s", e)
+            await asyncio.sleep(interval_hours * 3600)
+    finally:
+        try:
+            await crud.release_lease(RETENTION_LEASE, owner)
+        except Exception as e:
+            logger.warning(" Не удалось отпустить захват архивации: %s", e)
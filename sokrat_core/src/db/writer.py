@@ -0,0 +1,86 @@
+﻿"""
+Единственный писатель в БД (single-writer actor).
+
+Все записи идут через одну задачу, которая владеет одним соединением и
+принимает операции из asyncio.Queue. Накопившиеся операции выполняются
+одной транзакцией (group commit), каждый вызывающий получает свой
+результат через future. Чтение остаётся на обычном пуле соединений.
+
+Очередь и групповые коммиты - общие с Базой Знаний
+(knowledge_base.writer.GroupCommitWriter), здесь только SQLAlchemy.
+Пакет knowledge_base ставится из корня репозитория: pip install -e .
+"""
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession
+
+from knowledge_base.writer import GroupCommitWriter
+from src.config import settings
+from src.db.database import get_engine
+from src.utils import metrics
+from src.utils.tracing import get_tracer
+
+WriteOp = Callable[[AsyncSession], Awaitable[Any]]
+
+
+class DatabaseWriter(GroupCommitWriter):
+    """
+    Писатель, выполняющий операции группами в одной транзакции.
+
+    Операция - корутина-функция, принимающая AsyncSession. Если пачка
+    падает, она откатывается и операции повторяются по одной, чтобы
+    ошибка одной не ломала остальные.
+    """
+
+    def __init__(self, engine: AsyncEngine, max_batch: Optional[int] = None):
+        super().__init__(max_batch or settings.db_writer_max_batch)
+        self.engine = engine
+
+    def __repr__(self) -> str:
+        return f"DatabaseWriter({self.engine.url!r})"
+
+    async def submit(self, op: WriteOp) -> Any:
+        """Поставить операцию в очередь и дождаться её фиксации."""
+        # Время спана - ожидание в очереди плюс групповой коммит
+        with get_tracer().span("db.write", op=op.__qualname__.split(".")[0], queue_depth=self.queue_depth):
+            return await super().submit(op)
+
+    async def _connect(self) -> AsyncConnection:
+        conn = await self.engine.connect()
+        try:
+            if self.engine.dialect.name == "sqlite":
+                # WAL: читатели не блокируются писателем
+                await conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+                await conn.exec_driver_sql("PRAGMA synchronous=NORMAL")
+                await conn.commit()
+        except BaseException:
+            await conn.close()
+            raise
+        return conn
+
+    async def _close(self, conn: AsyncConnection):
+        await conn.close()
+
+    async def _apply(self, conn: AsyncConnection, ops: List[WriteOp]) -> List[Any]:
+        # Незафиксированная транзакция откатывается при закрытии сессии
+        async with AsyncSession(bind=conn, expire_on_commit=False) as session:
+            results = [await op(session) for op in ops]
+            await session.commit()
+        return results
+
+    def _committed(self, count: int):
+        metrics.DB_WRITE_BATCHES.inc()
+        metrics.DB_WRITE_OPERATIONS.inc(count)
+
+
+_writers: Dict[str, DatabaseWriter] = {}
+
+
+def get_writer(engine: Optional[AsyncEngine] = None) -> DatabaseWriter:
+    """Писатель для файла БД (один на engine.url)."""
+    engine = engine or get_engine()
+    key = str(engine.url)
+    # После dispose_engine() engine пересоздаётся - писатель тоже
+    if key not in _writers or _writers[key].engine is not engine:
+        _writers[key] = DatabaseWriter(engine)
+    return _writers[key]
@@ -1,19 +1,112 @@
-﻿from fastapi import FastAPI
+﻿"""
+Приложение Sokrat API.
+
+create_app() собирает приложение без побочных эффектов; всё состояние
+(логирование, engine БД, писатель, HTTP-пулы клиента LLM, оркестратор,
+очередь задач) создаётся в lifespan - отдельно в каждом воркере - и
+закрывается при остановке. Запуск на нескольких ядрах:
+
+    uvicorn src.main:create_app --factory --workers 4
+
+Прежний запуск uvicorn src.main:app тоже работает: app собирается
+create_app() при первом обращении к атрибуту модуля.
+
+Импорт модуля лёгкий: конвейер анализа с SQLAlchemy, httpx и клиентом
+LLM импортируется в lifespan, уже в воркере. Время импорта проверяет
+benchmarks/bench_startup.py.
+"""
+from contextlib import asynccontextmanager
+import asyncio
+import time
+from typing import Optional
+from fastapi import FastAPI, Request
 from src.api.routes import router
-from src.utils.logging_config import get_logger
-import uvicorn
+from src.config import settings
+from src.utils import metrics
+from src.utils.logging_config import configure_logging, get_logger, shutdown_logging
+from src.utils.tracing import get_tracer
 
 logger = get_logger(__name__)
 
-app = FastAPI(
-    title="Sokrat - Multi-LLM Analysis System",
-    description="Модуль сбора и распределения информации",
-    version="0.1.0"
-)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    configure_logging()
+    
+    from src.core.jobs import JobManager
+    from src.core.llm import close_llm_client
+    from src.core.orchestrator import AnalysisOrchestrator
+    from src.core.parser import close_http_client
+    from src.db import fts
+    from src.db.database import dispose_engine
+    from src.db.retention import retention_loop
+    from src.db.writer import get_writer
+    
+    # FTS-индекс в БД, созданной до его появления (до старта писателя)
+    await fts.ensure_index()
+    
+    # Единственный писатель в БД (engine создаётся при первом обращении)
+    writer = get_writer()
+    await writer.start()
+    metrics.DB_WRITE_QUEUE_DEPTH.set_function(lambda: writer.queue_depth)
+    
+    # Фоновая архивация старых данных (если включена); при нескольких
+    # воркерах её выполняет тот, кто держит захват в таблице leases
+    retention_task = None
+    if settings.retention_interval_hours > 0:
+        retention_task = asyncio.create_task(
+            retention_loop(settings.retention_interval_hours)
+        )
+        logger.info(" Архивация включена, интервал %sч", settings.retention_interval_hours)
+    
+    # Оркестратор и пул воркеров фоновых задач (POST /jobs)
+    app.state.orchestrator = AnalysisOrchestrator()
+    app.state.jobs = JobManager(app.state.orchestrator)
+    await app.state.jobs.start()
+    metrics.JOB_QUEUE_DEPTH.set_function(lambda: app.state.jobs.queue_depth)
+    metrics.JOBS_RUNNING.set_function(lambda: app.state.jobs.running_jobs)
+    
+    yield
+    
+    await app.state.jobs.stop()
+    
+    if retention_task:
+        retention_task.cancel()
+        try:
+            await retention_task
+        except asyncio.CancelledError:
+            pass
+    
+    await close_llm_client()
+    await close_http_client()
+    await writer.stop()
+    await dispose_engine()
+    await asyncio.to_thread(get_tracer().flush)
+    shutdown_logging()
 
-app.include_router(router)
+async def record_request_metrics(request: Request, call_next):
+    """Задержка и число одновременных запросов для /metrics, заголовок Server-Timing"""
+    metrics.HTTP_REQUESTS_IN_FLIGHT.inc()
+    start = time.perf_counter()
+    timings = metrics.collect_request_timings()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        if settings.server_timing:
+            response.headers["Server-Timing"] = metrics.server_timing_header(
+                timings, (time.perf_counter() - start) * 1000
+            )
+        return response
+    finally:
+        metrics.HTTP_REQUESTS_IN_FLIGHT.dec()
+        # Шаблон маршрута, а не путь: /jobs/{job_id} - одна серия
+        route = request.scope.get("route")
+        metrics.HTTP_REQUEST_DURATION.labels(
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=status
+        ).observe(time.perf_counter() - start)
 
-@app.get("/")
 async def root():
     return {
         "message": "Sokrat API",
@@ -21,13 +114,45 @@ async def root():
         "version": "0.1.0",
         "endpoints": {
             "POST /analyze": "Анализ запроса",
+            "POST /jobs": "Анализ в фоне, возвращает job_id",
+            "GET /jobs/{job_id}": "Статус и результаты задачи",
+            "GET /traces": "Последние трассы этапов",
+            "GET /metrics": "Метрики в формате Prometheus",
             "GET /health": "Проверка здоровья"
         }
     }
 
-@app.get("/health")
-async def health():
-    return {"status": "healthy"}
+def create_app() -> FastAPI:
+    app = FastAPI(
+        title="Sokrat - Multi-LLM Analysis System",
+        description="Модуль сбора и распределения информации",
+        version="0.1.0",
+        lifespan=lifespan
+    )
+    app.include_router(router)
+    if settings.metrics_enabled:
+        app.middleware("http")(record_request_metrics)
+    app.get("/")(root)
+    return app
+
+_app: Optional[FastAPI] = None
+
+def __getattr__(name: str):
+    """Совместимость со старым запуском uvicorn src.main:app"""
+    global _app
+    if name == "app":
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == "__main__":
-    uvicorn.run("src.main:app", host="0.0.0.0", port=8000, reload=True)
+    import uvicorn
+    uvicorn.run(
+        "src.main:create_app",
+        factory=True,
+        host="0.0.0.0",
+        port=8000,
+        workers=settings.workers,
+        reload=settings.workers == 1
+    )
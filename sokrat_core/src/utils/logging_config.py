@@ -1,29 +1,186 @@
-﻿import logging
+﻿"""
+Настройка логирования процесса.
+
+Импорт модуля ничего не настраивает: обработчики подключает
+configure_logging() - приложение в lifespan (в каждом воркере), скрипты
+в начале main(). Имя файла лога может содержать {pid}, чтобы воркеры
+uvicorn --workers N писали каждый в свой файл.
+
+Логгеры не пишут сами: корневой логгер кладёт запись в очередь
+(QueueHandler), а форматирует и пишет в консоль и файл фоновый поток
+QueueListener, поэтому медленный диск не блокирует event loop. Аргументы
+%-стиля подставляются в сообщение сразу, в вызывающем потоке (изменяемые
+объекты логируются такими, какими были в момент вызова); в потоке
+остаются форматтер (время, JSON, трассировка исключения) и запись:
+
+    logger.info("Найдено %d источников", len(results))
+
+Настройки (src/config.py): log_json - JSON Lines вместо текста,
+log_rotation - ротация файла по размеру ("size") или времени ("time"),
+log_sampling - доля записей ниже WARNING, сохраняемых для шумных логгеров.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
 import sys
+from datetime import datetime, timezone
 from pathlib import Path
+from typing import Dict, List, Optional
+
+from src.config import settings
+
+FORMAT = '%(asctime)s | %(levelname)-8s | %(name)s - %(message)s'
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Обработчик и поток, подключённые configure_logging (для повторного вызова)
+_queue_handler: Optional[logging.Handler] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+_atexit_registered = False
+
+
+class JsonFormatter(logging.Formatter):
+    """Запись лога - одна строка JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage().strip(),
+            "pid": record.process,
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Прореживание записей ниже WARNING для заданных логгеров (и их потомков):
+    при доле 0.1 сохраняется каждая десятая запись. Предупреждения и
+    ошибки проходят всегда.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self._counters: Dict[str, int] = {}
+
+    def _rate(self, name: str) -> Optional[str]:
+        while name:
+            if name in self.rates:
+                return name
+            name = name.rpartition(".")[0]
+        return None
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        key = self._rate(record.name)
+        if key is None:
+            return True
+        rate = self.rates[key]
+        if rate <= 0:
+            return False
+        count = self._counters.get(key, 0)
+        self._counters[key] = count + 1
+        return count % max(1, round(1 / rate)) == 0
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler, откладывающий форматтер на поток QueueListener: стандартный
+    prepare() форматирует запись целиком (с трассировкой) на event loop.
+    Здесь сразу подставляются только аргументы - иначе поток увидел бы
+    объекты, изменённые после вызова логгера.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def _file_handler(path: Path) -> logging.Handler:
+    if settings.log_rotation == "size":
+        return logging.handlers.RotatingFileHandler(
+            path,
+            maxBytes=settings.log_max_bytes,
+            backupCount=settings.log_backup_count,
+            encoding='utf-8'
+        )
+    if settings.log_rotation == "time":
+        return logging.handlers.TimedRotatingFileHandler(
+            path,
+            when=settings.log_rotate_when,
+            backupCount=settings.log_backup_count,
+            encoding='utf-8'
+        )
+    return logging.FileHandler(path, encoding='utf-8')
+
+
+def configure_logging(
+    level: Optional[str] = None,
+    log_file: Optional[str] = None,
+    json_format: Optional[bool] = None
+):
+    """
+    Подключить к корневому логгеру вывод в консоль и в файл через очередь
+    и фоновый поток. Повторный вызов заменяет прежнюю настройку.
+
+    Args:
+        level: уровень (по умолчанию settings.log_level)
+        log_file: путь к файлу, "" - без файла (по умолчанию settings.log_file)
+        json_format: JSON Lines вместо текста (по умолчанию settings.log_json)
+    """
+    global _queue_handler, _listener, _atexit_registered
+    level = level or settings.log_level
+    log_file = settings.log_file if log_file is None else log_file
+    json_format = settings.log_json if json_format is None else json_format
+
+    shutdown_logging()
+
+    formatter = JsonFormatter() if json_format else logging.Formatter(FORMAT, datefmt=DATE_FORMAT)
+    handlers: List[logging.Handler] = []
+    if log_file:
+        path = Path(log_file.format(pid=os.getpid()))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        handlers.append(_file_handler(path))
+    handlers.append(logging.StreamHandler(sys.stdout))
+    for handler in handlers:
+        handler.setFormatter(formatter)
 
-# Создаём папку для логов
-Path("logs").mkdir(exist_ok=True)
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    _queue_handler = _DeferredQueueHandler(log_queue)
+    if settings.log_sampling:
+        _queue_handler.addFilter(SamplingFilter(settings.log_sampling))
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
 
-# Настройка форматирования
-formatter = logging.Formatter(
-    '%(asctime)s | %(levelname)-8s | %(name)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
+    root_logger = logging.getLogger()
+    root_logger.addHandler(_queue_handler)
+    root_logger.setLevel(level)
+    # Скрипты не вызывают shutdown_logging сами - записи из очереди не теряются при выходе
+    if not _atexit_registered:
+        atexit.register(shutdown_logging)
+        _atexit_registered = True
 
-# Корневой логгер
-root_logger = logging.getLogger()
-root_logger.setLevel(logging.INFO)
 
-# Обработчик для файла
-file_handler = logging.FileHandler("logs/sokrat.log", encoding='utf-8')
-file_handler.setFormatter(formatter)
-root_logger.addHandler(file_handler)
+def shutdown_logging():
+    """Дописать записи из очереди, остановить поток и закрыть файлы"""
+    global _queue_handler, _listener
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+        _queue_handler = None
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
 
-# Обработчик для консоли
-console_handler = logging.StreamHandler(sys.stdout)
-console_handler.setFormatter(formatter)
-root_logger.addHandler(console_handler)
 
 # Функция для получения логгера
 def get_logger(name):
@@ -0,0 +1,330 @@
+﻿"""
+Метрики процесса в текстовом формате Prometheus (GET /metrics).
+
+Инструменты живут в памяти процесса и стоят одну операцию со словарём
+на событие, без внешних зависимостей:
+    Counter   - монотонный счётчик (inc);
+    Gauge     - текущее значение (set/inc/dec) или функция, вызываемая
+                при чтении (set_function) - очередь писателя, пул LLM;
+    Histogram - распределение с накопительными корзинами (observe).
+
+    REQUESTS = Counter("sokrat_things_total", "Описание", ["kind"])
+    REQUESTS.labels(kind="a").inc()
+
+Длительность этапов (search, fetch, parse, clean, dispatch, db.write,
+llm.chat, ...) собирает StageMetricsExporter из спанов трассировщика,
+поэтому этапы не размечаются отдельно. Он же копит время этапов текущего
+HTTP-запроса для заголовка Server-Timing (см. collect_request_timings).
+"""
+import bisect
+import contextvars
+import math
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Корзины длительностей, секунды: от миллисекунд (db.write) до минут (анализ)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+class Registry:
+    """Набор метрик, отдаваемых одним /metrics"""
+
+    def __init__(self):
+        self._metrics: Dict[str, "_Metric"] = {}
+
+    def register(self, metric: "_Metric"):
+        if metric.name in self._metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self._metrics[metric.name] = metric
+
+    def get(self, name: str) -> Optional["_Metric"]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {_escape_help(metric.documentation)}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        registry: Optional[Registry] = REGISTRY
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], "_Metric"] = {}
+        if registry is not None:
+            registry.register(self)
+
+    def labels(self, **labels: str) -> "_Metric":
+        """Дочерняя метрика с заданными значениями меток"""
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = self._child()
+        return child
+
+    def _child(self) -> "_Metric":
+        raise NotImplementedError
+
+    def _series(self) -> Iterable[Tuple[Dict[str, str], "_Metric"]]:
+        if not self.labelnames:
+            yield {}, self
+            return
+        for key, child in list(self._children.items()):
+            yield dict(zip(self.labelnames, key)), child
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Монотонный счётчик"""
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry: Optional[Registry] = REGISTRY):
+        super().__init__(name, documentation, labelnames, registry)
+        self.value = 0.0
+
+    def _child(self) -> "Counter":
+        return Counter(self.name, self.documentation, registry=None)
+
+    def inc(self, amount: float = 1.0):
+        if amount < 0:
+            raise ValueError("Счётчик не уменьшается")
+        self.value += amount
+
+    def samples(self) -> List[str]:
+        return [_sample(self.name, labels, child.value) for labels, child in self._series()]
+
+
+class Gauge(_Metric):
+    """Текущее значение"""
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry: Optional[Registry] = REGISTRY):
+        super().__init__(name, documentation, labelnames, registry)
+        self.value = 0.0
+        self._function: Optional[Callable[[], float]] = None
+
+    def _child(self) -> "Gauge":
+        return Gauge(self.name, self.documentation, registry=None)
+
+    def set(self, value: float):
+        self.value = float(value)
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+    def set_function(self, function: Callable[[], float]):
+        """Значение вычисляется при каждом чтении метрик"""
+        self._function = function
+
+    def get(self) -> float:
+        if self._function is None:
+            return self.value
+        try:
+            return float(self._function())
+        except Exception:
+            return math.nan
+
+    def samples(self) -> List[str]:
+        return [_sample(self.name, labels, child.get()) for labels, child in self._series()]
+
+
+class Histogram(_Metric):
+    """Распределение значений по корзинам (le - верхняя граница)"""
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        registry: Optional[Registry] = REGISTRY,
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+        # Последняя корзина - +Inf
+        self._counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def _child(self) -> "Histogram":
+        return Histogram(self.name, self.documentation, registry=None, buckets=self.buckets)
+
+    def observe(self, value: float):
+        self._counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self) -> List[str]:
+        lines = []
+        for labels, child in self._series():
+            cumulative = 0
+            for bound, count in zip(child.buckets + (math.inf,), child._counts):
+                cumulative += count
+                lines.append(_sample(f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+            lines.append(_sample(f"{self.name}_sum", labels, child.sum))
+            lines.append(_sample(f"{self.name}_count", labels, child.count))
+        return lines
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_help(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _sample(name: str, labels: Dict[str, str], value: float) -> str:
+    if labels:
+        rendered = ",".join(f'{key}="{_escape_label(val)}"' for key, val in labels.items())
+        return f"{name}{{{rendered}}} {_format_value(value)}"
+    return f"{name} {_format_value(value)}"
+
+
+def render() -> str:
+    """Все метрики процесса в текстовом формате Prometheus"""
+    return REGISTRY.render()
+
+
+# --- Метрики Sokrat ---
+
+HTTP_REQUEST_DURATION = Histogram(
+    "sokrat_http_request_duration_seconds",
+    "Время обработки HTTP-запроса",
+    ["method", "route", "status"]
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "sokrat_http_requests_in_flight",
+    "HTTP-запросы, обрабатываемые сейчас"
+)
+STAGE_DURATION = Histogram(
+    "sokrat_stage_duration_seconds",
+    "Длительность этапа конвейера (по спанам трассировки)",
+    ["stage"]
+)
+STAGE_ERRORS = Counter(
+    "sokrat_stage_errors_total",
+    "Этапы, завершившиеся ошибкой или отменой",
+    ["stage", "status"]
+)
+CACHE_REQUESTS = Counter(
+    "sokrat_cache_requests_total",
+    "Обращения к кешам: local_index - локальный FTS-индекс, llm_inflight - дедупликация запросов к LLM",
+    ["cache", "result"]
+)
+LLM_REQUESTS = Counter(
+    "sokrat_llm_requests_total",
+    "Вызовы API моделей",
+    ["model"]
+)
+LLM_ERRORS = Counter(
+    "sokrat_llm_errors_total",
+    "Ошибки вызовов API моделей",
+    ["model"]
+)
+LLM_TOKENS = Counter(
+    "sokrat_llm_tokens_total",
+    "Токены по моделям",
+    ["model", "kind"]
+)
+LLM_REQUEST_DURATION = Histogram(
+    "sokrat_llm_request_duration_seconds",
+    "Задержка вызова API модели",
+    ["model"]
+)
+LLM_POOL_IN_USE = Gauge(
+    "sokrat_llm_pool_in_use",
+    "Запросы к LLM, занимающие соединение пула сейчас"
+)
+LLM_POOL_LIMIT = Gauge(
+    "sokrat_llm_pool_limit",
+    "Предел одновременных запросов к LLM"
+)
+DB_WRITE_QUEUE_DEPTH = Gauge(
+    "sokrat_db_write_queue_depth",
+    "Операции в очереди единственного писателя БД"
+)
+DB_WRITE_BATCHES = Counter(
+    "sokrat_db_write_batches_total",
+    "Групповые коммиты писателя БД"
+)
+DB_WRITE_OPERATIONS = Counter(
+    "sokrat_db_write_operations_total",
+    "Операции, записанные писателем БД"
+)
+JOB_QUEUE_DEPTH = Gauge(
+    "sokrat_job_queue_depth",
+    "Фоновые задачи анализа в очереди"
+)
+JOBS_RUNNING = Gauge(
+    "sokrat_jobs_running",
+    "Фоновые задачи анализа, выполняемые сейчас"
+)
+
+
+# Суммарное время этапов текущего HTTP-запроса, мс. Словарь общий для
+# задач запроса: они копируют контекст, но не сам словарь
+_request_timings: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar("request_timings", default=None)
+
+
+def collect_request_timings() -> Dict[str, float]:
+    """Начать сбор времени этапов для текущего контекста (запроса)"""
+    timings: Dict[str, float] = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def server_timing_header(timings: Dict[str, float], total_ms: float) -> str:
+    """
+    Значение заголовка Server-Timing. Этапы, выполнявшиеся параллельно
+    (fetch по страницам, llm.chat по моделям), суммируются.
+    """
+    parts = [f"{stage};dur={ms:.1f}" for stage, ms in timings.items()]
+    parts.append(f"total;dur={total_ms:.1f}")
+    return ", ".join(parts)
+
+
+class StageMetricsExporter:
+    """Экспортёр трассировщика: длительность и ошибки спанов по имени этапа"""
+
+    def export(self, span):
+        stage = span.name
+        duration_s = (span.end_ns - span.start_ns) / 1e9
+        STAGE_DURATION.labels(stage=stage).observe(duration_s)
+        if span.status != "ok":
+            STAGE_ERRORS.labels(stage=stage, status=span.status).inc()
+        timings = _request_timings.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + duration_s * 1000
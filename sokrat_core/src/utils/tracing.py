@@ -0,0 +1,302 @@
+﻿"""
+Лёгкая трассировка этапов: вложенные спаны с атрибутами.
+
+    tracer = get_tracer()
+    with tracer.span("search", query=query) as span:
+        results = await search_web(query)
+        span.set(results=len(results))
+
+Текущий спан хранится в ContextVar, поэтому вложенность сохраняется и
+через await, и в задачах asyncio.gather (они копируют контекст).
+Завершённые спаны отдаются экспортёрам:
+    RingBufferExporter - последние N спанов в памяти (GET /traces);
+    OTLPFileExporter   - JSON Lines в формате OTLP/JSON (ExportTraceServiceRequest),
+                         совместимом с коллектором OpenTelemetry; файл пишет
+                         фоновый поток, flush() дожидается записи.
+    StageMetricsExporter - гистограммы длительности этапов для /metrics.
+Без экспортёров трассировка выключена и span() ничего не стоит.
+"""
+import asyncio
+import contextvars
+import json
+import os
+import queue
+import secrets
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from src.config import settings
+from src.utils.logging_config import get_logger
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+SERVICE_NAME = "sokrat"
+
+logger = get_logger(__name__)
+
+
+class Span:
+    """Интервал работы этапа"""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "status", "error")
+
+    def __init__(self, name: str, parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+        self.status = "ok"
+        self.error: Optional[str] = None
+
+    def set(self, **attributes: Any) -> "Span":
+        """Добавить атрибуты (bytes, tokens, cache_hit, ...)"""
+        self.attributes.update(attributes)
+        return self
+
+    def fail(self, error: str, status: str = "error"):
+        self.status = status
+        self.error = error
+
+    @property
+    def duration_ms(self) -> Optional[float]:
+        return (self.end_ns - self.start_ns) / 1e6 if self.end_ns else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or self.start_ns),
+            "attributes": [_otlp_attribute(key, value) for key, value in self.attributes.items()],
+            # STATUS_CODE_OK = 1, STATUS_CODE_ERROR = 2
+            "status": {"code": 1} if self.status == "ok" else {"code": 2, "message": self.error or self.status},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class _NoopSpan:
+    """Спан выключенной трассировки"""
+
+    def set(self, **attributes: Any) -> "_NoopSpan":
+        return self
+
+    def fail(self, error: str, status: str = "error"):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+class RingBufferExporter:
+    """Последние maxlen завершённых спанов в памяти"""
+
+    def __init__(self, maxlen: int = 2048):
+        self._spans: deque = deque(maxlen=maxlen)
+
+    def export(self, span: Span):
+        self._spans.append(span)
+
+    def spans(self) -> List[Span]:
+        return list(self._spans)
+
+    def traces(self, limit: int = 20, name: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Последние трассы (новые первыми): корневой спан и все его потомки,
+        попавшие в буфер, по времени начала.
+
+        Args:
+            name: только трассы с корневым спаном этого имени
+        """
+        by_trace: Dict[str, List[Span]] = {}
+        for span in self._spans:
+            by_trace.setdefault(span.trace_id, []).append(span)
+        traces = []
+        for spans in reversed(list(by_trace.values())):
+            root = next((s for s in spans if s.parent_id is None), None)
+            if root is None or (name is not None and root.name != name):
+                continue
+            traces.append({
+                "trace_id": root.trace_id,
+                "name": root.name,
+                "duration_ms": root.duration_ms,
+                "status": root.status,
+                "spans": [s.to_dict() for s in sorted(spans, key=lambda s: s.start_ns)],
+            })
+            if len(traces) >= limit:
+                break
+        return traces
+
+    def clear(self):
+        self._spans.clear()
+
+
+class OTLPFileExporter:
+    """
+    Запись спанов в файл JSON Lines: строка - ExportTraceServiceRequest
+    в OTLP/JSON с пачкой спанов. Пишется пачками по batch_size и при flush().
+
+    Пачку пишет в файл фоновый поток (как QueueListener логирования), поэтому
+    export() из корутины не блокирует event loop на диске.
+    """
+
+    def __init__(self, path: str, batch_size: int = 64):
+        self.path = path
+        self.batch_size = batch_size
+        self._batch: List[Span] = []
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[List[Span]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+    def export(self, span: Span):
+        with self._lock:
+            self._batch.append(span)
+            if len(self._batch) < self.batch_size:
+                return
+            batch, self._batch = self._batch, []
+        self._enqueue(batch)
+
+    def flush(self):
+        """Отдать неполную пачку и дождаться записи всех пачек в файл"""
+        with self._lock:
+            batch, self._batch = self._batch, []
+        if batch:
+            self._enqueue(batch)
+        self._queue.join()
+
+    def _enqueue(self, batch: List[Span]):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="otlp-file-exporter", daemon=True)
+                self._thread.start()
+        self._queue.put(batch)
+
+    def _run(self):
+        while True:
+            batch = self._queue.get()
+            try:
+                self._write(batch)
+            except Exception:
+                logger.exception("Не удалось записать спаны в %s", self.path)
+            finally:
+                self._queue.task_done()
+
+    def _write(self, spans: List[Span]):
+        request = {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", SERVICE_NAME)]},
+                "scopeSpans": [{
+                    "scope": {"name": "sokrat.tracing"},
+                    "spans": [span.to_otlp() for span in spans],
+                }],
+            }]
+        }
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(request, ensure_ascii=False) + "\n")
+
+
+class Tracer:
+    """Создание спанов и передача завершённых экспортёрам"""
+
+    def __init__(self, exporters: Optional[List[Any]] = None):
+        self.exporters = list(exporters or [])
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.exporters)
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span]:
+        """
+        Спан вокруг блока: вложен в текущий спан контекста. Исключение
+        (в том числе отмена задачи) помечает спан ошибкой и пробрасывается.
+        """
+        if not self.exporters:
+            yield NOOP_SPAN
+            return
+        span = Span(name, _current_span.get(), attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            if span.status == "ok":
+                span.fail(str(e) or type(e).__name__, "cancelled" if isinstance(e, asyncio.CancelledError) else "error")
+            raise
+        finally:
+            span.end_ns = time.time_ns()
+            _current_span.reset(token)
+            for exporter in self.exporters:
+                exporter.export(span)
+
+    def ring_buffer(self) -> Optional[RingBufferExporter]:
+        return next((e for e in self.exporters if isinstance(e, RingBufferExporter)), None)
+
+    def flush(self):
+        for exporter in self.exporters:
+            if hasattr(exporter, "flush"):
+                exporter.flush()
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+_tracer: Optional[Tracer] = None
+
+
+def get_tracer() -> Tracer:
+    """Общий трассировщик процесса (экспортёры - из настроек)"""
+    global _tracer
+    if _tracer is None:
+        exporters: List[Any] = []
+        if settings.metrics_enabled:
+            from src.utils.metrics import StageMetricsExporter
+            exporters.append(StageMetricsExporter())
+        if settings.tracing_enabled:
+            exporters.append(RingBufferExporter(settings.trace_buffer_size))
+            if settings.trace_file:
+                exporters.append(OTLPFileExporter(settings.trace_file))
+        _tracer = Tracer(exporters)
+    return _tracer
+
+
+def set_tracer(tracer: Tracer):
+    """Заменить общий трассировщик (тесты, свои экспортёры)"""
+    global _tracer
+    _tracer = tracer
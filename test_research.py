@@ -2,6 +2,7 @@
 Тестовый запуск Research Engine.
 """
 import asyncio
+import logging
 import sys
 import os
 from datetime import datetime
@@ -73,4 +74,5 @@ async def main():
     print("\n" + "="*60)
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     asyncio.run(main())
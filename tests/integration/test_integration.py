@@ -118,3 +118,28 @@ async def test_3_recover_session(self):
         print(f"\n Восстановление работает:")
         print(f"   Сессия восстановлена: {session_id}")
         print(f"   Раундов в истории: {len(history['rounds'])}")
+    
+    @pytest.mark.asyncio
+    async def test_4_one_commit_per_stage(self):
+        """
+        ТЕСТ: Каждый этап сессии записывается одним коммитом.
+        """
+        kb = KnowledgeBase(db_path=self.test_db)
+        await kb.open()
+        
+        orchestrator = ResearchOrchestrator(kb_client=kb)
+        writer = kb._writer()
+        ops_before = writer.operations
+        
+        context = SessionContext(
+            task="Тест коммитов",
+            initial_prompt="Тест",
+            max_rounds=1
+        )
+        await orchestrator.run(context)
+        
+        # session_started, primary_response, экспертизы, обсуждение, completed
+        commits = writer.operations - ops_before
+        assert commits == 5, f"Ожидалось 5 записей на сессию, получено {commits}"
+        
+        await kb.close()
@@ -3,6 +3,7 @@
 """
 import pytest
 import asyncio
+import json
 import os
 import sys
 from datetime import datetime
@@ -162,3 +163,389 @@ async def test_5_error_handling(self):
         # Удаление несуществующей сессии не должно падать
         await kb.delete_session("non-existent")
         print(" Обработка ошибок работает корректно")
+    
+    @pytest.mark.asyncio
+    async def test_6_concurrent_writes_group_commit(self):
+        """ТЕСТ: Конкурентные записи идут через одного писателя группами."""
+        from knowledge_base import KnowledgeBase
+        
+        kb = KnowledgeBase(db_path=self.test_db)
+        await kb._init_db()
+        
+        session_id = "test-session-writer"
+        await kb.save_session(session_id, "Параллельная запись", {})
+        
+        writer = kb._writer()
+        ops_before, batches_before = writer.operations, writer.batches
+        
+        await asyncio.gather(*[
+            kb.save_expertise(session_id, i, "code", [f"f{i}"], [], 5.0)
+            for i in range(50)
+        ])
+        
+        ops = writer.operations - ops_before
+        batches = writer.batches - batches_before
+        assert ops == 50, f"Ожидалось 50 операций, получено {ops}"
+        assert batches < ops, "Записи не объединились в групповые коммиты"
+        
+        # Ошибка одной записи не ломает остальные в той же пачке
+        results = await asyncio.gather(
+            kb.save_session(session_id, "Дубликат", {}),
+            kb.save_round(session_id, 1, {"type": "primary"}),
+            return_exceptions=True
+        )
+        assert isinstance(results[0], Exception), "Дубликат сессии должен упасть"
+        assert results[1] is None, "Соседняя запись не должна пострадать"
+        
+        history = await kb.get_session_history(session_id)
+        assert len(history['expertise']) == 50, "Не все экспертизы сохранились"
+        assert len(history['rounds']) == 1, "Раунд не сохранился"
+        
+        await kb.close()
+    
+    @pytest.mark.asyncio
+    async def test_7_connection_lifecycle(self):
+        """ТЕСТ: Пул соединений открывается один раз и закрывается в close()."""
+        from knowledge_base import KnowledgeBase
+        
+        async with KnowledgeBase(db_path=self.test_db, pool_size=2) as kb:
+            pool_connections = list(kb._pool._connections)
+            assert len(pool_connections) == 2, "Пул не открылся"
+            
+            await kb.save_session("test-session-pool", "Пул", {})
+            for _ in range(10):
+                assert await kb.session_exists("test-session-pool")
+            
+            # Соединения переиспользуются, а не создаются на каждый вызов
+            assert kb._pool._connections == pool_connections, "Соединения пересоздаются"
+        
+        assert not kb._pool.is_open, "Пул не закрылся"
+        assert not kb._writer().running, "Писатель не остановился"
+    
+    @pytest.mark.asyncio
+    async def test_8_batch_writes_and_transaction(self):
+        """ТЕСТ: Пакетные записи и transaction() дают один коммит."""
+        from knowledge_base import KnowledgeBase
+        
+        async with KnowledgeBase(db_path=self.test_db) as kb:
+            session_id = "test-session-batch"
+            writer = kb._writer()
+            ops_before = writer.operations
+            
+            async with kb.transaction():
+                await kb.save_session(session_id, "Пакетная запись", {})
+                await kb.save_expertise_many(session_id, 0, [
+                    {"expert_type": "code", "findings": ["a"], "suggestions": [], "score": 7.0},
+                    {"expert_type": "prompt", "findings": ["b"], "suggestions": [], "score": 8.0},
+                ])
+                await kb.save_rounds_many(session_id, [
+                    (0, {"type": "primary"}),
+                    (1, {"type": "final"}),
+                ])
+                # До выхода из блока ничего не записано
+                assert not await kb.session_exists(session_id), "Запись прошла до коммита"
+            
+            assert writer.operations - ops_before == 1, "Транзакция должна быть одной операцией"
+            history = await kb.get_session_history(session_id)
+            assert len(history['expertise']) == 2, "Экспертизы не сохранились"
+            assert len(history['rounds']) == 2, "Раунды не сохранились"
+            
+            # При исключении отложенные записи отбрасываются
+            with pytest.raises(RuntimeError):
+                async with kb.transaction():
+                    await kb.save_round(session_id, 2, {"type": "discussion"})
+                    raise RuntimeError("отмена")
+            
+            history = await kb.get_session_history(session_id)
+            assert len(history['rounds']) == 2, "Запись из отменённой транзакции сохранилась"
+    
+    @pytest.mark.asyncio
+    async def test_9_keyset_pagination_and_streaming(self):
+        """ТЕСТ: Постраничный листинг сессий и потоковое чтение истории."""
+        from knowledge_base import KnowledgeBase
+        
+        async with KnowledgeBase(db_path=self.test_db) as kb:
+            for i in range(7):
+                await kb.save_session(f"test-session-{i}", f"Задача {i}", {"n": i})
+            
+            seen = []
+            cursor = None
+            while True:
+                rows, cursor = await kb.list_sessions(limit=3, cursor=cursor)
+                seen.extend(row["id"] for row in rows)
+                if cursor is None:
+                    break
+            
+            assert len(seen) == 7, f"Ожидалось 7 сессий, получено {len(seen)}"
+            assert len(set(seen)) == 7, "Сессии повторяются между страницами"
+            assert seen[0] == "test-session-6", "Новые сессии должны идти первыми"
+            
+            rows, _ = await kb.list_sessions(status="completed")
+            assert rows == [], "Фильтр по статусу не работает"
+            
+            await kb.save_round("test-session-3", 0, {"type": "primary"})
+            await kb.save_expertise("test-session-3", 0, "code", ["баг"], [], 7.0)
+            
+            records = [r async for r in kb.iter_session_history("test-session-3")]
+            assert [r.kind for r in records] == ["session", "round", "expertise"], "Неверный порядок записей"
+            assert records[0].config == {"n": 3}, "Конфиг не декодирован"
+            assert records[1].data["type"] == "primary", "Данные раунда не декодированы"
+            assert records[2].findings == ["баг"], "Findings не декодированы"
+    
+    @pytest.mark.asyncio
+    async def test_10_read_cache_invalidation(self):
+        """ТЕСТ: Кэш чтений отдаёт повторные запросы из памяти и сбрасывается записью."""
+        from knowledge_base import KnowledgeBase
+        
+        async with KnowledgeBase(db_path=self.test_db, cache_size=8) as kb:
+            session_id = "test-session-cache"
+            
+            assert not await kb.session_exists(session_id)
+            await kb.save_session(session_id, "Кэш", {})
+            assert await kb.session_exists(session_id), "Кэш не сброшен после save_session"
+            
+            history = await kb.get_session_history(session_id)
+            for _ in range(5):
+                history = await kb.get_session_history(session_id)
+            assert len(history['rounds']) == 0
+            
+            stats = kb.cache_stats()
+            assert stats['hits'] >= 5, f"Повторные чтения не попали в кэш: {stats}"
+            
+            await kb.save_round(session_id, 0, {"type": "primary"})
+            history = await kb.get_session_history(session_id)
+            assert len(history['rounds']) == 1, "Кэш не сброшен после save_round"
+            
+            async with kb.transaction():
+                await kb.save_expertise_many(session_id, 0, [
+                    {"expert_type": "code", "findings": [], "suggestions": [], "score": 5.0}
+                ])
+            history = await kb.get_session_history(session_id)
+            assert len(history['expertise']) == 1, "Кэш не сброшен после транзакции"
+            
+            await kb.delete_session(session_id)
+            assert not await kb.session_exists(session_id), "Кэш не сброшен после delete_session"
+            assert kb.cache_stats()['invalidations'] > 0
+    
+    @pytest.mark.asyncio
+    async def test_11_sql_analytics(self):
+        """ТЕСТ: Аналитика по экспертизам и оценкам считается в SQL."""
+        from knowledge_base import KnowledgeBase
+        
+        async with KnowledgeBase(db_path=self.test_db) as kb:
+            for i, quality in enumerate([0.9, 0.4, 0.2]):
+                session_id = f"test-session-analytics-{i}"
+                await kb.save_session(session_id, f"Задача {i}", {})
+                await kb.save_round(session_id, 0, {"type": "primary"})
+                await kb.save_round(session_id, 1, {"type": "final", "quality_score": quality})
+                await kb.save_expertise_many(session_id, 0, [
+                    {"expert_type": "code", "findings": ["a", "b"], "suggestions": [], "score": 6.0 + i},
+                    {"expert_type": "prompt", "findings": [], "suggestions": [], "score": 4.0},
+                ])
+            
+            stats = {row['expert_type']: row for row in await kb.expert_score_stats()}
+            assert stats['code']['count'] == 3
+            assert stats['code']['avg_score'] == pytest.approx(7.0)
+            assert stats['code']['max_score'] == 8.0
+            assert stats['code']['avg_findings'] == 2
+            assert stats['prompt']['avg_findings'] == 0
+            
+            by_round = await kb.expert_score_by_round()
+            assert {(row['expert_type'], row['round_number']) for row in by_round} == {("code", 0), ("prompt", 0)}
+            
+            assert await kb.score_trend("test-session-analytics-0") == [(1, 0.9)]
+            
+            low = await kb.low_quality_sessions(0.5)
+            assert [row['id'] for row in low] == ["test-session-analytics-2", "test-session-analytics-1"]
+            
+            summary = await kb.quality_summary()
+            assert summary['sessions'] == 3
+            assert summary['avg_quality'] == pytest.approx(0.5)
+            
+            # Запросы используют индексы по вычисляемым колонкам
+            async with kb._pool.acquire() as db:
+                async with db.execute(
+                    "EXPLAIN QUERY PLAN SELECT id FROM research_rounds "
+                    "WHERE round_type = 'final' AND quality_score < 0.5"
+                ) as cursor:
+                    plan = " ".join(row[3] for row in await cursor.fetchall())
+            assert "idx_rounds_type_score" in plan, plan
+    
+    @pytest.mark.asyncio
+    async def test_12_export_import(self, tmp_path):
+        """ТЕСТ: Потоковый экспорт и импорт сессий с фильтрами и пачками."""
+        from knowledge_base import KnowledgeBase
+        from knowledge_base.export import available_formats, export_sessions, import_sessions
+        
+        target_db = str(tmp_path / "import.db")
+        async with KnowledgeBase(db_path=self.test_db) as kb:
+            for i in range(7):
+                session_id = f"test-session-export-{i}"
+                await kb.save_session(session_id, f"Задача {i}", {"n": i})
+                await kb.save_rounds_many(session_id, [(r, {"type": "primary", "r": r}) for r in range(i % 3)])
+                await kb.save_expertise(session_id, 0, "code", ["находка"], [], 7.0)
+            await kb.save_state("test-session-export-5", "full", "json", b'{"task": "\xd0\x97"}')
+            await kb.save_state("test-session-export-5", "delta", "json", b"\x00\xff")
+            await kb.save_session("test-session-export-failed", "Ошибка", {})
+            await kb._writer().execute(
+                "UPDATE research_sessions SET status = 'failed' WHERE id = ?",
+                ("test-session-export-failed",)
+            )
+            
+            for fmt in available_formats():
+                out_dir = str(tmp_path / f"export-{fmt}")
+                counts = await export_sessions(kb, out_dir, fmt=fmt, status="active", batch_size=3)
+                assert counts == {"sessions": 7, "rounds": 6, "expertise": 7, "state": 2}, counts
+                
+                if os.path.exists(target_db):
+                    os.remove(target_db)
+                async with KnowledgeBase(db_path=target_db) as target:
+                    imported = await import_sessions(target, out_dir, batch_size=2)
+                    assert imported["sessions"] == 7 and imported["rounds"] == 6
+                    history = await target.get_session_history("test-session-export-5")
+                    assert json.loads(history['session'][2]) == {"n": 5}
+                    assert len(history['rounds']) == 2
+                    assert await target.load_state("test-session-export-5") == [
+                        ("full", "json", b'{"task": "\xd0\x97"}'),
+                        ("delta", "json", b"\x00\xff"),
+                    ]
+                    assert not await target.session_exists("test-session-export-failed")
+                    
+                    again = await import_sessions(target, out_dir)
+                    assert again["sessions"] == 0 and again["skipped_sessions"] == 7
+                    assert len((await target.get_session_history("test-session-export-5"))['rounds']) == 2
+    
+    @pytest.mark.asyncio
+    async def test_13_similarity_index(self):
+        """ТЕСТ: Индекс похожести обновляется при записи и строится из БД при открытии."""
+        from knowledge_base import KnowledgeBase
+        
+        async with KnowledgeBase(db_path=self.test_db, similarity=True) as kb:
+            await kb.save_session("test-session-sort", "Напиши быструю сортировку на Python", {"initial_prompt": "оптимизируй память"})
+            await kb.save_session("test-session-parse", "Распарси HTML страницу и извлеки ссылки", {"initial_prompt": ""})
+            await kb.save_round("test-session-sort", 1, {"type": "final", "synthesis": "def quicksort(arr): ...", "quality_score": 8.5})
+            
+            matches = await kb.find_similar_sessions("Напиши быструю сортировку на Python\nоптимизируй память")
+            assert matches[0]['session_id'] == "test-session-sort"
+            assert matches[0]['similarity'] > 0.8
+            assert matches[0]['synthesis'] == "def quicksort(arr): ..."
+            
+            assert await kb.find_similar_sessions("извлеки ссылки из HTML", min_quality=8.0) == []
+            
+            await kb.delete_session("test-session-parse")
+            assert "test-session-parse" not in kb.similarity
+        
+        async with KnowledgeBase(db_path=self.test_db, similarity=True) as kb:
+            assert len(kb.similarity) == 1
+            matches = await kb.find_similar_sessions("быстрая сортировка на Python", min_quality=8.0)
+            assert matches and matches[0]['quality_score'] == 8.5
+    
+    @pytest.mark.asyncio
+    async def test_14_import_invalidates_cache(self, tmp_path):
+        """ТЕСТ: Импорт сбрасывает закэшированные чтения импортированных сессий."""
+        from knowledge_base import KnowledgeBase
+        from knowledge_base.export import export_sessions, import_sessions
+        
+        out_dir = str(tmp_path / "export")
+        async with KnowledgeBase(db_path=self.test_db) as kb:
+            await kb.save_session("sess-1", "Задача", {"n": 1})
+            await kb.save_round("sess-1", 1, {"type": "primary"})
+            await export_sessions(kb, out_dir)
+        
+        async with KnowledgeBase(db_path=str(tmp_path / "target.db"), cache_size=16) as target:
+            assert not await target.session_exists("sess-1")
+            assert (await target.get_session_history("sess-1"))['rounds'] == []
+            
+            imported = await import_sessions(target, out_dir)
+            assert imported["sessions"] == 1
+            assert await target.session_exists("sess-1")
+            assert len((await target.get_session_history("sess-1"))['rounds']) == 1
+
+    
+    @pytest.mark.asyncio
+    async def test_15_writer_failure_settles_callers(self):
+        """ТЕСТ: Если писатель не смог открыть БД, вызывающие получают ошибку, а не зависают."""
+        from knowledge_base.writer import SQLiteWriter
+        
+        writer = SQLiteWriter("/proc/nonexistent/sokrat.db")
+        for _ in range(2):
+            with pytest.raises(Exception):
+                await asyncio.wait_for(writer.execute("CREATE TABLE t (x)"), timeout=5)
+            assert not writer.running
+    
+    @pytest.mark.asyncio
+    async def test_16_writer_stop_drains_late_writes(self):
+        """ТЕСТ: Операция, поставленная в очередь за стоп-сигналом, всё равно записывается."""
+        from knowledge_base.writer import SQLiteWriter
+        
+        writer = SQLiteWriter(self.test_db)
+        await writer.execute("CREATE TABLE t (x INTEGER)")
+        # В очереди: вставка, стоп-сигнал, вставка
+        first, _, second = await asyncio.wait_for(
+            asyncio.gather(
+                writer.execute("INSERT INTO t VALUES (1)"),
+                writer.stop(),
+                writer.execute("INSERT INTO t VALUES (2)")
+            ),
+            timeout=5
+        )
+        assert (first, second) == (1, 1)
+        assert not writer.running
+        
+        import aiosqlite
+        async with aiosqlite.connect(self.test_db) as conn:
+            cursor = await conn.execute("SELECT COUNT(*) FROM t")
+            assert (await cursor.fetchone())[0] == 2
+    
+    @pytest.mark.asyncio
+    async def test_17_codec_matches_json(self, monkeypatch):
+        """ТЕСТ: JSON-поля кодируются одинаково с orjson и без него."""
+        from knowledge_base import KnowledgeBase, codec
+        
+        values = [
+            {1: "целый ключ", "список": [1, 2.5, None]},
+            {"big": 2 ** 70, "negative": -(2 ** 65)},
+            {"score": float("nan"), "limit": float("inf")},
+        ]
+        encoded = [codec.dumps(value) for value in values]
+        monkeypatch.setattr(codec, "orjson", None)
+        assert [json.loads(text) for text in encoded] == [json.loads(codec.dumps(value)) for value in values]
+        monkeypatch.undo()
+        
+        assert codec.loads(encoded[0]) == {"1": "целый ключ", "список": [1, 2.5, None]}
+        assert codec.loads(encoded[1]) == values[1]
+        assert codec.loads(encoded[2]) == {"score": None, "limit": None}
+        # Строки, записанные json.dumps без замены NaN
+        assert codec.loads('{"x": NaN}')["x"] != codec.loads('{"x": NaN}')["x"]
+        
+        async with KnowledgeBase(db_path=self.test_db) as kb:
+            await kb.save_session("test-session-codec", "Кодек", {1: 2 ** 70})
+            await kb.save_round("test-session-codec", 1, {"type": "final", "quality_score": float("nan"), "big": 2 ** 70})
+            history = await kb.get_session_history("test-session-codec")
+            assert len(history['rounds']) == 1
+    
+    @pytest.mark.asyncio
+    async def test_18_delete_session_removes_children(self):
+        """ТЕСТ: удаление сессии удаляет её раунды, экспертизы и снимки."""
+        from knowledge_base import KnowledgeBase
+        import aiosqlite
+        
+        async with KnowledgeBase(db_path=self.test_db) as kb:
+            for session_id in ("test-session-delete", "test-session-keep"):
+                await kb.save_session(session_id, "Удаление", {})
+                await kb.save_round(session_id, 1, {"type": "final", "quality_score": 7.0})
+                await kb.save_expertise(session_id, 1, "code", ["f"], [], 7.0)
+                await kb.save_state(session_id, "full", "json", b"{}")
+            
+            await kb.delete_session("test-session-delete")
+            
+            assert (await kb.quality_summary())["sessions"] == 1
+            assert [row["count"] for row in await kb.expert_score_stats()] == [1]
+            assert await kb.load_state("test-session-keep") == [("full", "json", b"{}")]
+        
+        async with aiosqlite.connect(self.test_db) as conn:
+            for table in ("research_rounds", "expertise_results", "session_state"):
+                cursor = await conn.execute(
+                    f"SELECT COUNT(*) FROM {table} WHERE session_id = ?", ("test-session-delete",)
+                )
+                assert (await cursor.fetchone())[0] == 0, table
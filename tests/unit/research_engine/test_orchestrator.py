@@ -164,3 +164,683 @@ async def test_5_judge_decision(self):
         # Если should_stop=True, должен быть improved_response
         if decision.should_stop:
             assert decision.improved_response, "Нет улучшенного ответа при остановке"
+    
+    @pytest.mark.asyncio
+    async def test_6_reuse_similar_session(self, tmp_path):
+        """
+        ТЕСТ: Повторное использование похожей прошлой сессии.
+        
+        Хотим:
+        1. Повторная задача завершается прошлым синтезом (reuse_mode='return')
+        2. Другая задача исследуется заново
+        """
+        from research_engine.core.models import SessionContext
+        from research_engine.core.orchestrator import ResearchOrchestrator
+        from knowledge_base import KnowledgeBase
+        
+        async with KnowledgeBase(db_path=str(tmp_path / "reuse.db"), similarity=True) as kb:
+            first = await ResearchOrchestrator(kb_client=kb).run(
+                SessionContext(task="Напиши функцию сортировки", initial_prompt="быстрая сортировка")
+            )
+            
+            orchestrator = ResearchOrchestrator(kb_client=kb, reuse_mode="return")
+            orchestrator._get_primary_response = None  # модели вызываться не должны
+            repeated = await orchestrator.run(
+                SessionContext(task="Напиши функцию сортировки", initial_prompt="быстрая сортировка")
+            )
+            assert repeated.reused_from == first.session_id
+            assert repeated.final_synthesis == first.final_synthesis
+            assert repeated.quality_score == first.quality_score
+            
+            history = await kb.get_session_history(repeated.session_id)
+            assert len(history['rounds']) == 1
+            
+            other = await ResearchOrchestrator(kb_client=kb, reuse_mode="seed").run(
+                SessionContext(task="Спроектируй схему базы данных", initial_prompt="PostgreSQL")
+            )
+            assert other.reused_from is None
+            assert other.is_finished
+    
+    @pytest.mark.asyncio
+    async def test_7_multi_round_early_stopping(self):
+        """
+        ТЕСТ: Раунды повторяются, пока растёт оценка.
+        
+        Хотим:
+        1. Цикл идёт до плато оценки и записывает причину остановки
+        2. max_rounds и бюджет токенов ограничивают число раундов
+        """
+        from research_engine.core.models import SessionContext, JudgeDecision
+        from research_engine.core.orchestrator import ResearchOrchestrator
+        
+        def make_judge(scores):
+            scores = iter(scores)
+            async def judge(context):
+                return JudgeDecision(
+                    should_stop=False,
+                    reason="Нужно ещё",
+                    improved_response=f"Версия {context.current_round + 1}",
+                    score=next(scores),
+                    needs_more_rounds=True
+                )
+            return judge
+        
+        orchestrator = ResearchOrchestrator()
+        orchestrator._run_judge = make_judge([5.0, 7.0, 7.05, 9.0])
+        result = await orchestrator.run(SessionContext(task="Тест", initial_prompt="тест", max_rounds=5))
+        assert result.stop_reason == "plateau"
+        assert result.current_round == 3
+        assert result.improvement_trend == [5.0, 7.0, 7.05]
+        assert len(result.discussion_rounds) == 3
+        assert result.final_synthesis == "Версия 3"
+        
+        orchestrator._run_judge = make_judge([1.0, 2.0, 3.0, 4.0])
+        result = await orchestrator.run(SessionContext(task="Тест", initial_prompt="тест", max_rounds=2))
+        assert result.stop_reason == "max_rounds"
+        assert result.current_round == 2
+        
+        orchestrator._run_judge = make_judge([1.0, 2.0, 3.0, 4.0])
+        result = await orchestrator.run(
+            SessionContext(task="Тест", initial_prompt="тест", max_rounds=5, token_budget=100)
+        )
+        assert result.stop_reason == "token_budget"
+        assert result.current_round == 1
+        
+        result = await ResearchOrchestrator().run(SessionContext(task="Тест", initial_prompt="тест"))
+        assert result.stop_reason == "judge"
+        assert result.current_round == 1
+    
+    @pytest.mark.asyncio
+    async def test_8_expert_registry_timeouts_and_limits(self):
+        """
+        ТЕСТ: Реестр экспертов.
+        
+        Хотим:
+        1. Зависший эксперт отменяется по таймауту, остальные результаты целы
+        2. Упавший эксперт повторяется
+        3. Лимитер ограничивает число одновременных экспертов
+        4. Эксперты, не успевшие к дедлайну раунда, помечаются cancelled
+        5. Таймаут эксперта без ограничения времени не ломает результат
+        """
+        from research_engine.core.experts import ExpertRegistry
+        from research_engine.core.models import ExpertiseResult
+        from research_engine.core.orchestrator import ResearchOrchestrator
+        
+        registry = ExpertRegistry(max_concurrency=2)
+        running = 0
+        peak = 0
+        attempts = {"flaky": 0}
+        
+        async def track(name, delay):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            try:
+                await asyncio.sleep(delay)
+            finally:
+                running -= 1
+            return ExpertiseResult(expert_type=name, score=7.0)
+        
+        @registry.register("fast", priority=10)
+        async def fast(content):
+            return await track("fast", 0.01)
+        
+        @registry.register("hung", timeout=0.05)
+        async def hung(content):
+            return await track("hung", 10)
+        
+        @registry.register("flaky", retries=2, retry_delay=0.01)
+        async def flaky(content):
+            attempts["flaky"] += 1
+            if attempts["flaky"] < 2:
+                raise ValueError("сбой")
+            return await track("flaky", 0.01)
+        
+        results = {r.expert_type: r for r in await registry.run("контент")}
+        assert registry.names()[0] == "fast"
+        assert results["fast"].status == "ok"
+        assert results["hung"].status == "timeout"
+        assert results["flaky"].status == "ok" and attempts["flaky"] == 2
+        assert peak <= 2, f"Лимитер не сработал: {peak}"
+        
+        registry.register("slow", lambda content: track("slow", 10), timeout=None)
+        orchestrator = ResearchOrchestrator(experts=registry, round_timeout=0.2)
+        import time
+        start = time.monotonic()
+        results = {r.expert_type: r for r in await orchestrator._run_expertise_round("контент")}
+        assert time.monotonic() - start < 1.0
+        assert results["slow"].status == "cancelled"
+        assert results["fast"].status == "ok"
+        
+        # Таймаут изнутри эксперта без собственного ограничения
+        async def upstream_timeout(content):
+            raise asyncio.TimeoutError()
+        
+        registry = ExpertRegistry()
+        registry.register("upstream", upstream_timeout, timeout=None)
+        [result] = await registry.run("контент")
+        assert result.status == "timeout"
+        assert result.findings == ["Ошибка: Таймаут"]
+    
+    @pytest.mark.asyncio
+    async def test_9_batch_runner_retry_and_resume(self, tmp_path):
+        """
+        ТЕСТ: Пакетный запуск.
+        
+        Хотим:
+        1. Все задачи из JSONL выполняются с ограниченной параллельностью
+        2. Упавшая задача повторяется, неисправимая помечается failed
+        3. Задача с некорректными полями или строка, не разбираемая как
+           JSON-объект, сразу помечается failed, без повторов
+        4. Повторный запуск пропускает успешные задачи
+        """
+        import json
+        from research_engine.core.batch import BatchRunner
+        from research_engine.core.orchestrator import ResearchOrchestrator
+        
+        tasks_path = tmp_path / "tasks.jsonl"
+        out_path = tmp_path / "results.jsonl"
+        with open(tasks_path, "w", encoding="utf-8") as f:
+            for i in range(6):
+                f.write(json.dumps({"id": f"t{i}", "task": f"Задача {i}", "initial_prompt": "промпт"}, ensure_ascii=False) + "\n")
+            f.write(json.dumps({"id": "broken", "task": "Сломанная", "initial_prompt": "промпт"}, ensure_ascii=False) + "\n")
+            f.write(json.dumps({"id": "invalid", "task": "Без промпта"}, ensure_ascii=False) + "\n")
+            f.write('{"id": "torn", "task": \n')
+            f.write('["не", "объект"]\n')
+        
+        orchestrator = ResearchOrchestrator()
+        original_run = orchestrator.run
+        calls = {}
+        running = 0
+        peak = 0
+        
+        async def run(context):
+            nonlocal running, peak
+            calls[context.task] = calls.get(context.task, 0) + 1
+            if context.task == "Сломанная" or (context.task == "Задача 3" and calls[context.task] == 1):
+                raise RuntimeError("сбой модели")
+            running += 1
+            peak = max(peak, running)
+            try:
+                await asyncio.sleep(0.02)
+                return await original_run(context)
+            finally:
+                running -= 1
+        
+        orchestrator.run = run
+        runner = BatchRunner(orchestrator, concurrency=3, retries=1, retry_delay=0.01)
+        report = await runner.run(str(tasks_path), str(out_path))
+        
+        assert report.total == 10
+        assert report.succeeded == 6 and report.failed == 4
+        assert report.retries == 2
+        assert peak <= 3
+        records = [json.loads(line) for line in open(out_path, encoding="utf-8")]
+        assert {r["id"] for r in records if r["status"] == "ok"} == {f"t{i}" for i in range(6)}
+        assert next(r for r in records if r["id"] == "broken")["status"] == "failed"
+        invalid = next(r for r in records if r["id"] == "invalid")
+        assert invalid["status"] == "failed" and invalid["attempts"] == 1
+        assert "initial_prompt" in invalid["error"]
+        assert "Без промпта" not in calls
+        torn, not_object = (next(r for r in records if r["id"] == line) for line in ("9", "10"))
+        assert torn["status"] == "failed" and torn["error"].startswith("Строка 9: некорректный JSON")
+        assert not_object["status"] == "failed" and "list" in not_object["error"]
+        
+        report = await runner.run(str(tasks_path), str(out_path))
+        assert report.skipped == 6
+        assert report.failed == 4
+        assert calls["Задача 0"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_10_resume_after_crash(self, tmp_path):
+        """
+        ТЕСТ: Возобновление прерванной сессии из чекпоинтов БЗ.
+        
+        Хотим:
+        1. Прерванная сессия остаётся 'active' и находится стартовым обходом
+        2. Первичный ответ и сохранённые экспертизы повторно не запрашиваются
+        3. Контекст восстанавливается из снимка (включая токены)
+        4. Сессия доходит до конца, статус 'completed'; ошибка даёт 'failed'
+        """
+        from research_engine.core.models import SessionContext, JudgeDecision
+        from research_engine.core.orchestrator import ResearchOrchestrator
+        from knowledge_base import KnowledgeBase
+        
+        calls = {"primary": 0, "experts": 0, "discussion": 0}
+        
+        def make_orchestrator(kb, crash_on_discussion=None):
+            orchestrator = ResearchOrchestrator(kb_client=kb)
+            get_primary = orchestrator._get_primary_response
+            run_experts = orchestrator._run_expertise_round
+            run_discussion = orchestrator._run_discussion_round
+            
+            async def primary(context):
+                calls["primary"] += 1
+                return await get_primary(context)
+            
+            async def experts(content):
+                calls["experts"] += 1
+                return await run_experts(content)
+            
+            async def discussion(context):
+                calls["discussion"] += 1
+                if calls["discussion"] == crash_on_discussion:
+                    raise asyncio.CancelledError()  # процесс остановлен посреди раунда
+                context.tokens_used += 100  # токены обсуждения есть только в снимке контекста
+                return await run_discussion(context)
+            
+            async def judge(context):
+                return JudgeDecision(
+                    should_stop=False,
+                    reason="Нужно ещё",
+                    improved_response=f"Версия {context.current_round + 1}",
+                    score=5.0 + context.current_round + 1,
+                    needs_more_rounds=True
+                )
+            
+            orchestrator._get_primary_response = primary
+            orchestrator._run_expertise_round = experts
+            orchestrator._run_discussion_round = discussion
+            orchestrator._run_judge = judge
+            return orchestrator
+        
+        async with KnowledgeBase(db_path=str(tmp_path / "resume.db")) as kb:
+            context = SessionContext(task="Тест", initial_prompt="тест", max_rounds=3)
+            with pytest.raises(asyncio.CancelledError):
+                await make_orchestrator(kb, crash_on_discussion=2).run(context)
+            assert calls == {"primary": 1, "experts": 2, "discussion": 2}
+            
+            rows, _ = await kb.list_sessions(status="active")
+            assert [row["id"] for row in rows] == [context.session_id]
+            
+            resumed = await make_orchestrator(kb).resume_active_sessions()
+            assert len(resumed) == 1
+            result = resumed[0]
+            assert calls["primary"] == 1, "Первичный ответ запрошен повторно"
+            assert calls["experts"] == 3, "Сохранённые экспертизы раунда 2 запрошены повторно"
+            assert result.current_round == 3 and result.stop_reason == "max_rounds"
+            assert result.improvement_trend == [6.0, 7.0, 8.0]
+            assert result.final_synthesis == "Версия 3"
+            # Токены раунда 1 восстановлены из снимка, а не только первичного ответа
+            assert result.tokens_used == result.primary_response.tokens_used + 300
+            
+            history = await kb.get_session_history(context.session_id)
+            assert history['session'][4] == "completed"
+            assert len(history['expertise']) == 9
+            assert not (await kb.list_sessions(status="active"))[0]
+            
+            failing = make_orchestrator(kb)
+            async def broken(context):
+                raise RuntimeError("сбой модели")
+            failing._get_primary_response = broken
+            context = SessionContext(task="Сбой", initial_prompt="тест")
+            with pytest.raises(RuntimeError):
+                await failing.run(context)
+            history = await kb.get_session_history(context.session_id)
+            assert history['session'][4] == "failed"
+    
+    @pytest.mark.asyncio
+    async def test_11_write_behind_checkpoints(self):
+        """
+        ТЕСТ: Фоновая запись чекпоинтов.
+        
+        Хотим:
+        1. В режимах 'stage' и 'async' сессия не ждёт каждую запись в БЗ
+        2. К завершению run() все записи сессии выполнены, порядок сохранён
+        3. Есть метрики отставания очереди
+        """
+        import time
+        from research_engine.core.models import SessionContext
+        from research_engine.core.orchestrator import ResearchOrchestrator
+        
+        class SlowKB:
+            def __init__(self):
+                self.writes = []
+            async def _write(self, name):
+                await asyncio.sleep(0.05)
+                self.writes.append(name)
+            async def save_session(self, *args, **kwargs):
+                await self._write("session")
+            async def save_round(self, session_id, round_number, data):
+                await self._write(data["type"])
+            async def save_expertise(self, *args, **kwargs):
+                await self._write("expertise")
+        
+        class SlowModels(ResearchOrchestrator):
+            async def _get_primary_response(self, context):
+                await asyncio.sleep(0.05)
+                return await super()._get_primary_response(context)
+            async def _run_judge(self, context):
+                await asyncio.sleep(0.05)
+                return await super()._run_judge(context)
+        
+        elapsed = {}
+        for durability in ("sync", "stage", "async"):
+            kb = SlowKB()
+            orchestrator = SlowModels(kb_client=kb, durability=durability)
+            start = time.monotonic()
+            await orchestrator.run(SessionContext(task="Тест", initial_prompt="тест"))
+            elapsed[durability] = time.monotonic() - start
+            assert kb.writes == ["session", "primary"] + ["expertise"] * 3 + ["discussion", "final"], kb.writes
+            stats = orchestrator.checkpoint_stats()
+            assert stats["depth"] == 0 and stats["lag_s"] == 0.0
+            if durability != "sync":
+                assert stats["written"] == 5 and stats["max_lag_s"] > 0
+            await orchestrator.close()
+        
+        assert elapsed["stage"] < elapsed["sync"], elapsed
+        assert elapsed["async"] <= elapsed["stage"] + 0.05, elapsed
+    
+    @pytest.mark.asyncio
+    async def test_12_llm_client_stages(self):
+        """
+        ТЕСТ: Этапы вызывают модели через llm_client.
+        
+        Хотим:
+        1. Эксперты и участники обсуждения опрашиваются параллельно
+        2. JSON-ответы экспертов и судьи разбираются, текстовые - не ломают этап
+        3. Токены всех вызовов начисляются в контекст сессии
+        """
+        import json
+        from types import SimpleNamespace
+        from research_engine.core.models import SessionContext
+        from research_engine.core.orchestrator import ResearchOrchestrator
+        
+        class FakeLLM:
+            def __init__(self):
+                self.calls = []
+                self.active = 0
+                self.max_active = 0
+            async def chat(self, model, messages, temperature=0.1, max_tokens=None):
+                self.calls.append((model, messages[0]["content"]))
+                self.active += 1
+                self.max_active = max(self.max_active, self.active)
+                await asyncio.sleep(0.02)
+                self.active -= 1
+                system = messages[0]["content"]
+                if "судья" in system:
+                    content = "```json\n" + json.dumps({
+                        "should_stop": True, "reason": "готово", "improved_response": "итог",
+                        "score": 9, "needs_more_rounds": False
+                    }) + "\n```"
+                elif "эксперт по коду" in system:
+                    content = "Замечаний нет"  # не JSON
+                elif system.startswith("Ты эксперт"):
+                    content = json.dumps({"findings": ["f"], "suggestions": ["s"], "score": 12})
+                else:
+                    content = f"ответ {model}"
+                return SimpleNamespace(content=content, total_tokens=10, latency_ms=20)
+        
+        llm = FakeLLM()
+        orchestrator = ResearchOrchestrator(llm_client=llm, discussion_models=["a", "b", "c"])
+        result = await orchestrator.run(SessionContext(task="Тест", initial_prompt="тест"))
+        
+        # первичный ответ + 3 эксперта + 3 участника + судья
+        assert len(llm.calls) == 8
+        assert llm.max_active == 3, "Эксперты и обсуждение должны идти параллельно"
+        assert result.tokens_used == 80
+        assert result.primary_response.content == "ответ openai/gpt-4"
+        
+        by_type = {exp.expert_type: exp for exp in result.expertise_results}
+        assert by_type["code"].findings == ["Замечаний нет"] and by_type["code"].score == 5.0
+        assert by_type["prompt"].findings == ["f"] and by_type["prompt"].score == 10.0
+        assert result.discussion_rounds[0].responses == {m: f"ответ {m}" for m in "abc"}
+        assert result.final_synthesis == "итог"
+        assert result.quality_score == 9
+        assert result.stop_reason == "judge"
+    
+    @pytest.mark.asyncio
+    async def test_13_delta_state_checkpoints(self, tmp_path):
+        """
+        ТЕСТ: Снимки контекста пишутся дельтами.
+        
+        Хотим:
+        1. Первый снимок сессии полный, следующие - только изменения
+        2. Размер дельты не растёт с числом раундов
+        3. Полный снимок + дельты восстанавливают итоговый контекст во всех кодировках
+        """
+        from knowledge_base import KnowledgeBase
+        from research_engine.core.models import SessionContext, JudgeDecision
+        from research_engine.core.orchestrator import ResearchOrchestrator
+        from research_engine.core.serialization import available_encodings
+        
+        async def judge(context):
+            return JudgeDecision(
+                should_stop=False,
+                reason="Нужно ещё",
+                improved_response=f"Версия {context.current_round + 1}",
+                score=1.0 + context.current_round,
+                needs_more_rounds=True
+            )
+        
+        async with KnowledgeBase(db_path=str(tmp_path / "state.db")) as kb:
+            for encoding in available_encodings():
+                orchestrator = ResearchOrchestrator(kb_client=kb, state_encoding=encoding, state_full_every=4)
+                orchestrator._run_judge = judge
+                result = await orchestrator.run(
+                    SessionContext(task="Тест", initial_prompt="тест", max_rounds=8, plateau_delta=0.0)
+                )
+                assert result.current_round == 8
+                
+                rows = await kb._fetch_all(
+                    "SELECT kind, length(payload) AS size FROM session_state WHERE session_id = ? ORDER BY id",
+                    (result.session_id,)
+                )
+                kinds = [row["kind"] for row in rows]
+                # старт, первичный ответ, 8 раундов, итог; полный - раз в 4 дельты
+                assert len(kinds) == 11
+                assert kinds[0] == "full" and kinds[5] == "full" and kinds[10] == "full"
+                rounds = [row["size"] for row in rows[2:10] if row["kind"] == "delta"]
+                assert max(rounds) - min(rounds) < 16, rounds
+                
+                restored = await orchestrator.load_state(result.session_id)
+                assert restored.model_dump() == result.model_dump()
+                await orchestrator.close()
+            
+            await kb.delete_session(result.session_id)
+            assert await kb.load_state(result.session_id) == []
+    
+    @pytest.mark.asyncio
+    async def test_14_consensus_stops_rounds(self):
+        """
+        ТЕСТ: Консенсус моделей в обсуждении определяется локально.
+        
+        Хотим:
+        1. Разные ответы - нет консенсуса, близкие - есть, лучший ответ - медоид
+        2. При консенсусе раунды останавливаются, а судья с известной оценкой не вызывается
+        """
+        from research_engine.core.consensus import ConsensusDetector
+        from research_engine.core.models import SessionContext, DiscussionRound, JudgeDecision
+        from research_engine.core.orchestrator import ResearchOrchestrator
+        
+        base = "используем быструю сортировку на месте с выбором медианы из трёх и вставками для коротких отрезков"
+        detector = ConsensusDetector(threshold=0.6)
+        assert not detector.check({"a": base, "b": "сортировка слиянием стабильна и предсказуема по времени"}).reached
+        consensus = detector.check({"a": base, "b": base + " массива", "c": base + " массива данных"})
+        assert consensus.reached and consensus.best_model == "b"
+        assert not detector.check({"a": base}).reached
+        
+        judge_calls = []
+        
+        class Converging(ResearchOrchestrator):
+            async def _run_discussion_round(self, context):
+                round_number = context.current_round + 1
+                if round_number == 1:
+                    responses = {"a": base, "b": "сортировка слиянием стабильна и предсказуема"}
+                else:
+                    responses = {"a": base, "b": base + " массива"}
+                return DiscussionRound(round_number=round_number, responses=responses)
+            async def _run_judge(self, context):
+                judge_calls.append(context.current_round + 1)
+                return JudgeDecision(
+                    should_stop=False, reason="Нужно ещё", improved_response="Версия",
+                    score=6.0, needs_more_rounds=True
+                )
+        
+        result = await Converging(consensus_threshold=0.7).run(
+            SessionContext(task="Тест", initial_prompt="тест", max_rounds=5)
+        )
+        assert result.stop_reason == "consensus"
+        assert result.current_round == 2
+        assert judge_calls == [1], "Судья во втором раунде не нужен"
+        assert result.discussion_rounds[1].consensus_reached
+        assert result.final_synthesis == result.discussion_rounds[1].best_response
+        assert result.quality_score == 6.0
+        
+        # Без детектора идут все раунды до плато
+        judge_calls.clear()
+        result = await Converging(consensus_threshold=None).run(
+            SessionContext(task="Тест", initial_prompt="тест", max_rounds=5)
+        )
+        assert result.stop_reason == "plateau" and judge_calls == [1, 2]
+    
+    @pytest.mark.asyncio
+    async def test_15_tracing_spans(self):
+        """
+        ТЕСТ: Этапы сессии пишут вложенные спаны в переданный tracer.
+        
+        Хотим:
+        1. Спан сессии - корень, этапы и эксперты вложены в него
+        2. Записи в БЗ в режиме 'sync' вложены в этап, атрибуты заполнены
+        """
+        import contextvars
+        from contextlib import contextmanager
+        from research_engine.core.models import SessionContext
+        from research_engine.core.orchestrator import ResearchOrchestrator
+        
+        current = contextvars.ContextVar("span", default=None)
+        
+        class Span:
+            def __init__(self, name, parent, attributes):
+                self.name, self.parent, self.attributes, self.status = name, parent, attributes, "ok"
+            def set(self, **attributes):
+                self.attributes.update(attributes)
+                return self
+            def fail(self, error, status="error"):
+                self.status = status
+        
+        class RecordingTracer:
+            def __init__(self):
+                self.spans = []
+            @contextmanager
+            def span(self, name, **attributes):
+                span = Span(name, current.get(), attributes)
+                token = current.set(span)
+                try:
+                    yield span
+                finally:
+                    current.reset(token)
+                    self.spans.append(span)
+        
+        class MockKB:
+            async def save_session(self, *args, **kwargs):
+                pass
+            async def save_round(self, *args, **kwargs):
+                pass
+            async def save_expertise(self, *args, **kwargs):
+                pass
+        
+        tracer = RecordingTracer()
+        orchestrator = ResearchOrchestrator(kb_client=MockKB(), tracer=tracer, durability="sync")
+        result = await orchestrator.run(SessionContext(task="Тест", initial_prompt="тест"))
+        
+        by_name = {}
+        for span in tracer.spans:
+            by_name.setdefault(span.name, []).append(span)
+        root = by_name["research.session"][0]
+        assert root.parent is None
+        assert root.attributes["tokens"] == result.tokens_used
+        assert root.attributes["stop_reason"] == "judge"
+        for name in ("research.primary", "research.expertise", "research.discussion", "research.judge"):
+            assert by_name[name][0].parent is root, name
+        experts = by_name["expert"]
+        assert {span.attributes["expert"] for span in experts} == {"code", "prompt", "analytics"}
+        assert all(span.parent.name == "research.expertise" for span in experts)
+        writes = by_name["kb.write"]
+        assert [span.attributes["stage"] for span in writes] == [
+            "session_started", "primary_response", "expertise", "discussion", "completed"
+        ]
+        assert writes[1].parent.name == "research.session"
+    
+    def test_16_lazy_heavy_imports(self):
+        """
+        ТЕСТ: Лёгкий импорт точек входа.
+        
+        Хотим:
+        1. Импорт оркестратора и пакетного запуска не тянет NumPy и aiosqlite
+        2. Импорт базы знаний не тянет NumPy (нужен только индексу похожести)
+        3. NumPy загружается при первой проверке консенсуса
+        """
+        import subprocess
+        
+        root = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../.."))
+        code = (
+            "import sys\n"
+            "import research_engine.core.batch\n"
+            "print(sorted(m for m in ('numpy', 'aiosqlite') if m in sys.modules))\n"
+            "import knowledge_base\n"
+            "print('numpy' in sys.modules)\n"
+            "from research_engine.core.consensus import ConsensusDetector\n"
+            "ConsensusDetector().check({'a': 'раз два три', 'b': 'раз два три'})\n"
+            "print('numpy' in sys.modules)\n"
+        )
+        proc = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True)
+        assert proc.returncode == 0, proc.stderr
+        loaded, numpy_after_kb, numpy_after_check = proc.stdout.split()[-3:]
+        assert loaded == "[]"
+        assert numpy_after_kb == "False"
+        assert numpy_after_check == "True"
+    
+    @pytest.mark.asyncio
+    async def test_17_failed_state_write_restarts_chain(self, tmp_path):
+        """
+        ТЕСТ: Несохранённый снимок не теряет данные.
+        
+        Хотим:
+        1. После сбоя записи снимка следующий записанный снимок - полный
+        2. Полный снимок + дельты восстанавливают итоговый контекст
+        3. Сбой записи не прерывает сессию ни при каком durability
+        """
+        from knowledge_base import KnowledgeBase
+        from research_engine.core.models import SessionContext, JudgeDecision
+        from research_engine.core.orchestrator import ResearchOrchestrator
+        
+        async def judge(context):
+            return JudgeDecision(
+                should_stop=False,
+                reason="Нужно ещё",
+                improved_response=f"Версия {context.current_round + 1}",
+                score=1.0 + context.current_round,
+                needs_more_rounds=True
+            )
+        
+        async with KnowledgeBase(db_path=str(tmp_path / "state.db")) as kb:
+            save_state = kb.save_state
+            for durability in ("sync", "stage", "async"):
+                calls = {"n": 0}
+                
+                async def flaky_save_state(session_id, kind, encoding, payload):
+                    calls["n"] += 1
+                    if calls["n"] == 3:
+                        raise RuntimeError("диск недоступен")
+                    await save_state(session_id, kind, encoding, payload)
+                
+                kb.save_state = flaky_save_state
+                orchestrator = ResearchOrchestrator(kb_client=kb, durability=durability)
+                orchestrator._run_judge = judge
+                result = await orchestrator.run(
+                    SessionContext(task="Тест", initial_prompt="тест", max_rounds=4, plateau_delta=0.0)
+                )
+                await orchestrator.close()
+                
+                rows = await kb._fetch_all(
+                    "SELECT kind FROM session_state WHERE session_id = ? ORDER BY id",
+                    (result.session_id,)
+                )
+                kinds = [row["kind"] for row in rows]
+                # старт, первичный ответ, (раунд 1 не записан), раунды 2-4, итог
+                assert len(kinds) == 6, (durability, kinds)
+                assert kinds[:2] == ["full", "delta"] and kinds[2] == "full", (durability, kinds)
+                
+                restored = await orchestrator.load_state(result.session_id)
+                assert restored.model_dump() == result.model_dump(), durability
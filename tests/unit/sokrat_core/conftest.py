@@ -0,0 +1,39 @@
+﻿"""
+Общие фикстуры тестов Sokrat Core: модули импортируются как src.*
+из каталога sokrat_core, knowledge_base - из корня репозитория, БД -
+временный файл SQLite на тест.
+"""
+import os
+import sys
+
+import pytest
+import pytest_asyncio
+
+# knowledge_base (общий писатель) - из корня репозитория, как после pip install -e .
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../..")))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../sokrat_core")))
+
+
+@pytest.fixture
+def sokrat_settings(tmp_path, monkeypatch):
+    """Настройки на временный каталог, без ключей API (поиск и модели - заглушки)"""
+    from src.config import settings
+    monkeypatch.setattr(settings, "database_url", f"sqlite+aiosqlite:///{tmp_path}/sokrat.db")
+    monkeypatch.setattr(settings, "openrouter_api_key", "")
+    monkeypatch.setattr(settings, "tavily_api_key", "")
+    monkeypatch.setattr(settings, "archive_dir", str(tmp_path / "archive"))
+    monkeypatch.setattr(settings, "log_file", "")
+    return settings
+
+
+@pytest_asyncio.fixture
+async def sokrat_db(sokrat_settings):
+    """Инициализированная БД; писатели и engine закрываются после теста"""
+    from src.db import database, writer
+    await database.dispose_engine()
+    await database.init_db()
+    yield sokrat_settings
+    for db_writer in list(writer._writers.values()):
+        await db_writer.stop()
+    writer._writers.clear()
+    await database.dispose_engine()
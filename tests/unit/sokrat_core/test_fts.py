@@ -0,0 +1,113 @@
+﻿"""
+Тесты полнотекстового индекса и local-first анализа.
+"""
+import pytest
+from sqlalchemy import text
+
+
+def test_split_chunks():
+    """Короткие абзацы склеиваются, длинные режутся, пустые пропускаются"""
+    from src.db.fts import MAX_CHUNK_CHARS, MIN_CHUNK_CHARS, split_chunks
+    
+    assert split_chunks("") == []
+    assert split_chunks(None) == []
+    assert split_chunks("раз\n\nдва\n\n\n\nтри") == ["раз\n\nдва\n\nтри"]
+    
+    long_paragraph = "я" * (MAX_CHUNK_CHARS * 2 + 10)
+    chunks = split_chunks(f"{long_paragraph}\n\n" + "б" * MIN_CHUNK_CHARS)
+    assert chunks[0] == "я" * MAX_CHUNK_CHARS
+    assert chunks[1] == "я" * MAX_CHUNK_CHARS
+    assert chunks[2].startswith("я" * 10 + "\n\nб")
+    assert all(len(chunk) <= MAX_CHUNK_CHARS + MIN_CHUNK_CHARS + 2 for chunk in chunks)
+
+
+async def _save_analysis(query_id, query, docs):
+    from src.db import crud
+    await crud.create_query(query_id, query)
+    await crud.save_sources(query_id, [
+        {"url": doc["url"], "title": doc["title"], "snippet": "", "rank": i + 1}
+        for i, doc in enumerate(docs)
+    ])
+    await crud.save_documents(query_id, [
+        {**doc, "word_count": len(doc["cleaned_text"].split())} for doc in docs
+    ])
+
+
+WAVE_DOCS = [
+    {
+        "url": f"https://example.org/wave-{i}",
+        "title": f"Волновая энергетика {i}",
+        "cleaned_text": f"Волновая электростанция {i} работает с эффективностью {40 + i}%.\n\nПрочее."
+    }
+    for i in range(3)
+]
+
+
+@pytest.mark.asyncio
+async def test_search_documents(sokrat_db):
+    """Поиск группирует чанки по URL, учитывает покрытие слов и свежесть"""
+    from src.db import fts
+    from src.db.database import get_engine
+    
+    await _save_analysis("q-1", "волны", WAVE_DOCS)
+    
+    found = await fts.search_documents("волновая электростанция эффективность")
+    assert {doc["url"] for doc in found} == {doc["url"] for doc in WAVE_DOCS}
+    assert all("Волновая электростанция" in doc["cleaned_text"] for doc in found)
+    assert all(doc["word_count"] > 0 for doc in found)
+    
+    assert await fts.search_documents("солнечная панель инвертор") == []
+    assert await fts.search_documents("!!!") == []
+    
+    # Устаревшие документы не попадают в выдачу
+    async with get_engine().begin() as conn:
+        await conn.execute(text("UPDATE documents SET created_at = '2000-01-01 00:00:00'"))
+    assert await fts.search_documents("волновая электростанция") == []
+
+
+@pytest.mark.asyncio
+async def test_ensure_index_on_old_database(sokrat_db):
+    """Индекс создаётся при старте, если БД создана без него"""
+    from src.db import fts
+    from src.db.database import get_engine
+    
+    async with get_engine().begin() as conn:
+        await conn.execute(text(f"DROP TABLE {fts.FTS_TABLE}"))
+    await fts.ensure_index()
+    await _save_analysis("q-1", "волны", WAVE_DOCS[:1])
+    assert len(await fts.search_documents("волновая электростанция")) == 1
+
+
+@pytest.mark.asyncio
+async def test_local_first_skips_web_search(sokrat_db, monkeypatch):
+    """При достаточном числе локальных документов веб-поиск и парсинг не вызываются"""
+    from src.core import orchestrator as orchestrator_module
+    
+    async def no_network(*args, **kwargs):
+        raise AssertionError("веб-поиск не должен вызываться")
+    
+    monkeypatch.setattr(orchestrator_module, "search_web", no_network)
+    monkeypatch.setattr(orchestrator_module, "parse_urls", no_network)
+    await _save_analysis("q-1", "волны", WAVE_DOCS)
+    
+    result = await orchestrator_module.AnalysisOrchestrator().run_analysis(
+        "волновая электростанция эффективность", local_first=True
+    )
+    assert {s["url"] for s in result["sources"]} == {doc["url"] for doc in WAVE_DOCS}
+    assert len(result["model_analyses"]) == len(sokrat_db.models)
+    assert not any("Ошибка" in flag for flag in result["confidence_flags"])
+
+
+@pytest.mark.asyncio
+async def test_rebuild_index(sokrat_db):
+    """Перестроение индекса пачками через писателя находит все документы"""
+    from src.db import fts
+    from src.db.database import get_engine
+    
+    await _save_analysis("q-1", "волны", WAVE_DOCS)
+    async with get_engine().begin() as conn:
+        await conn.execute(text(f"DELETE FROM {fts.FTS_TABLE}"))
+    assert await fts.search_documents("волновая электростанция") == []
+    
+    assert await fts.rebuild_index(batch_size=2) == len(WAVE_DOCS)
+    assert len(await fts.search_documents("волновая электростанция")) == len(WAVE_DOCS)
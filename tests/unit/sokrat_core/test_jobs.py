@@ -0,0 +1,187 @@
+﻿"""
+Тесты фоновых задач анализа: захват задачи, возврат в очередь (при старте,
+остановке и периодическим обходом), переполнение.
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+
+class FakeOrchestrator:
+    """Анализ без конвейера: сообщает о старте и сразу возвращает результат"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def run_analysis(self, query, local_first=None, on_progress=None):
+        self.calls.append(query)
+        await on_progress("started", {"query_id": "q-1"})
+        return {"query_id": "q-1", "query": query}
+
+
+async def _wait_status(job_id, status, timeout=5.0):
+    from src.db import crud
+    deadline = asyncio.get_running_loop().time() + timeout
+    while True:
+        job = await crud.get_job(job_id)
+        if job.status == status or asyncio.get_running_loop().time() > deadline:
+            return job
+        await asyncio.sleep(0.02)
+
+
+@pytest.mark.asyncio
+async def test_job_runs_once(sokrat_db):
+    """Задача выполняется, захват записывает владельца и попытку"""
+    from src.core.jobs import JobManager
+    
+    orchestrator = FakeOrchestrator()
+    manager = JobManager(orchestrator, workers=2)
+    await manager.start()
+    try:
+        job_id = await manager.submit("волны")
+        job = await _wait_status(job_id, "completed")
+    finally:
+        await manager.stop()
+    
+    assert job.status == "completed"
+    assert job.attempts == 1
+    assert job.owner == manager.owner
+    assert orchestrator.calls == ["волны"]
+    assert (await manager.get(job_id))["result"]["query"] == "волны"
+
+
+@pytest.mark.asyncio
+async def test_claim_is_exclusive(sokrat_db):
+    """Задачу захватывает один процесс; чужой действующий захват не перехватывается"""
+    from src.db import crud
+    
+    await crud.create_job("job-1", "волны")
+    claims = await asyncio.gather(*(
+        crud.claim_job("job-1", f"owner-{i}", 60, max_attempts=3) for i in range(5)
+    ))
+    assert claims.count(True) == 1
+    
+    # Истёкший захват (владелец умер) можно перехватить, попытки считаются
+    await crud.update_job("job-1", lease_until=datetime.utcnow() - timedelta(seconds=1))
+    assert await crud.claim_job("job-1", "owner-new", 60, max_attempts=3)
+    job = await crud.get_job("job-1")
+    assert (job.owner, job.attempts) == ("owner-new", 2)
+    assert not await crud.renew_job_lease("job-1", "owner-0", 60)
+    assert await crud.renew_job_lease("job-1", "owner-new", 60)
+
+
+@pytest.mark.asyncio
+async def test_requeue_skips_live_jobs(sokrat_db):
+    """При старте в очередь возвращаются только брошенные задачи"""
+    from src.core.jobs import JobManager
+    from src.db import crud
+    
+    now = datetime.utcnow()
+    for job_id in ("queued", "live", "expired", "exhausted"):
+        await crud.create_job(job_id, job_id)
+    await crud.update_job("live", status="running", attempts=1, lease_until=now + timedelta(minutes=5))
+    await crud.update_job("expired", status="running", attempts=1, lease_until=now - timedelta(minutes=5))
+    await crud.update_job("exhausted", status="running", attempts=3, lease_until=now - timedelta(minutes=5))
+    
+    manager = JobManager(FakeOrchestrator(), max_attempts=3)
+    manager._queue = asyncio.Queue()
+    await manager._requeue_unfinished()
+    
+    queued = sorted(manager._queue.get_nowait()[0] for _ in range(manager._queue.qsize()))
+    assert queued == ["expired", "queued"]
+    assert (await crud.get_job("exhausted")).status == "failed"
+    assert (await crud.get_job("live")).status == "running"
+
+
+@pytest.mark.asyncio
+async def test_submit_queue_filled_meanwhile(sokrat_db, monkeypatch):
+    """Очередь заполнилась, пока создавалась строка: задача failed, JobQueueFull"""
+    from src.core import jobs
+    from src.db import crud
+    
+    manager = jobs.JobManager(FakeOrchestrator(), queue_size=1)
+    manager._queue = asyncio.Queue(maxsize=1)
+    create_job = crud.create_job
+    created = []
+    
+    async def create_and_fill(job_id, query, local_first=None):
+        await create_job(job_id, query, local_first)
+        created.append(job_id)
+        manager._queue.put_nowait(("other", "other", None))
+    
+    monkeypatch.setattr(crud, "create_job", create_and_fill)
+    with pytest.raises(jobs.JobQueueFull):
+        await manager.submit("волны")
+    
+    job = await crud.get_job(created[0])
+    assert job.status == "failed"
+    assert manager._queue.qsize() == 1
+
+
+class SlowOrchestrator(FakeOrchestrator):
+    """Анализ, который не завершается до отмены"""
+
+    def __init__(self):
+        super().__init__()
+        self.started = asyncio.Event()
+
+    async def run_analysis(self, query, local_first=None, on_progress=None):
+        self.calls.append(query)
+        self.started.set()
+        await asyncio.sleep(3600)
+
+
+@pytest.mark.asyncio
+async def test_stop_releases_running_jobs(sokrat_db):
+    """Остановка возвращает выполнявшуюся задачу в queued, следующий старт её выполняет"""
+    from src.core.jobs import JobManager
+    from src.db import crud
+    
+    slow = SlowOrchestrator()
+    manager = JobManager(slow)
+    await manager.start()
+    job_id = await manager.submit("волны")
+    await asyncio.wait_for(slow.started.wait(), 5)
+    await manager.stop()
+    
+    job = await crud.get_job(job_id)
+    assert job.status == "queued"
+    assert job.owner is None and job.lease_until is None
+    assert job.attempts == 0
+    
+    orchestrator = FakeOrchestrator()
+    manager = JobManager(orchestrator)
+    await manager.start()
+    try:
+        job = await _wait_status(job_id, "completed")
+    finally:
+        await manager.stop()
+    assert job.status == "completed" and job.attempts == 1
+    assert orchestrator.calls == ["волны"]
+
+
+@pytest.mark.asyncio
+async def test_sweep_reclaims_expired_leases(sokrat_db, monkeypatch):
+    """Задачу упавшего процесса подбирает периодический обход, а не только старт"""
+    from src.core.jobs import JobManager
+    from src.db import crud
+    
+    monkeypatch.setattr(sokrat_db, "job_lease_seconds", 0.1)
+    orchestrator = FakeOrchestrator()
+    manager = JobManager(orchestrator)
+    await manager.start()
+    try:
+        # Процесс-владелец умер, не продлив захват
+        await crud.create_job("orphan", "волны")
+        await crud.update_job(
+            "orphan", status="running", owner="dead", attempts=1,
+            lease_until=datetime.utcnow() + timedelta(seconds=0.2)
+        )
+        await asyncio.sleep(0.05)
+        assert (await crud.get_job("orphan")).status == "running"
+        job = await _wait_status("orphan", "completed")
+    finally:
+        await manager.stop()
+    assert job.status == "completed" and job.attempts == 2
+    assert orchestrator.calls == ["волны"]
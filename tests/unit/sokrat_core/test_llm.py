@@ -0,0 +1,99 @@
+﻿"""
+Тесты клиента LLM: дедупликация запросов в полёте.
+"""
+import asyncio
+
+import httpx
+import pytest
+
+
+def _client(calls, started=None, release=None):
+    from src.core.llm import LLMClient
+    
+    async def handler(request):
+        calls.append(request)
+        if started is not None:
+            started.set()
+        if release is not None:
+            await release.wait()
+        return httpx.Response(200, json={
+            "choices": [{"message": {"content": "ответ"}}],
+            "usage": {"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5}
+        })
+    
+    return LLMClient(api_key="test-key", transport=httpx.MockTransport(handler))
+
+
+MESSAGES = [{"role": "user", "content": "вопрос"}]
+
+
+@pytest.mark.asyncio
+async def test_dedup_shares_one_call():
+    """Одинаковые запросы в полёте - один вызов API"""
+    calls = []
+    release = asyncio.Event()
+    client = _client(calls, release=release)
+    try:
+        tasks = [asyncio.create_task(client.chat("m", MESSAGES)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        release.set()
+        responses = await asyncio.gather(*tasks)
+    finally:
+        await client.close()
+    
+    assert len(calls) == 1
+    assert [r.shared for r in responses] == [False, True, True]
+    assert all(r.content == "ответ" and r.total_tokens == 5 for r in responses)
+    assert client.usage["m"].deduplicated == 2
+    assert client._inflight == {}
+
+
+@pytest.mark.asyncio
+async def test_owner_cancel_keeps_call_for_waiters():
+    """Отмена начавшего запрос не отменяет ответ остальным ждущим"""
+    calls = []
+    started, release = asyncio.Event(), asyncio.Event()
+    client = _client(calls, started, release)
+    try:
+        owner = asyncio.create_task(client.chat("m", MESSAGES))
+        await started.wait()
+        waiter = asyncio.create_task(client.chat("m", MESSAGES))
+        await asyncio.sleep(0)
+        owner.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        
+        response = await asyncio.wait_for(waiter, timeout=5)
+        with pytest.raises(asyncio.CancelledError):
+            await owner
+    finally:
+        await client.close()
+    
+    assert response.content == "ответ" and response.shared
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_call_cancelled_when_nobody_waits():
+    """Когда все ждущие отменены, вызов API отменяется, новый запрос идёт заново"""
+    calls = []
+    started, release = asyncio.Event(), asyncio.Event()
+    client = _client(calls, started, release)
+    try:
+        tasks = [asyncio.create_task(client.chat("m", MESSAGES)) for _ in range(2)]
+        await started.wait()
+        call = next(iter(client._inflight.values()))
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.sleep(0)
+        assert call.task.cancelled()
+        assert client._inflight == {}
+        
+        release.set()
+        response = await asyncio.wait_for(client.chat("m", MESSAGES), timeout=5)
+    finally:
+        await client.close()
+    
+    assert not response.shared
+    assert len(calls) == 2
@@ -0,0 +1,65 @@
+﻿"""
+Тесты нагрузочного теста (scripts/load_test.py): разбор Server-Timing,
+перцентили и отчёт без запросов прогрева.
+"""
+import argparse
+import importlib.util
+import os
+
+import pytest
+
+_SCRIPT = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../sokrat_core/scripts/load_test.py"))
+
+
+@pytest.fixture(scope="module")
+def load_test():
+    spec = importlib.util.spec_from_file_location("load_test", _SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_parse_server_timing(load_test):
+    """Этапы с dur, лишние параметры и пробелы не мешают, некорректные значения пропускаются"""
+    header = "search;dur=12.5, fetch; desc=\"Загрузка\"; dur=40, db.write;dur=abc, cache, total;dur=60.1"
+    assert load_test.parse_server_timing(header) == {"search": 12.5, "fetch": 40.0, "total": 60.1}
+    assert load_test.parse_server_timing(None) == {}
+    assert load_test.parse_server_timing("") == {}
+
+
+def test_percentile(load_test):
+    """Линейная интерполяция между соседними значениями"""
+    values = [10.0, 20.0, 30.0, 40.0]
+    assert load_test.percentile(values, 0.0) == 10.0
+    assert load_test.percentile(values, 0.5) == 25.0
+    assert load_test.percentile(values, 0.9) == pytest.approx(37.0)
+    assert load_test.percentile(values, 1.0) == 40.0
+    assert load_test.percentile([5.0], 0.99) == 5.0
+    assert load_test.percentile([], 0.5) is None
+    
+    summary = load_test.summarize([3.0, 1.0, 2.0])
+    assert summary["count"] == 3 and summary["p50"] == 2.0 and summary["max"] == 3.0 and summary["mean"] == 2.0
+    assert load_test.summarize([])["p99"] is None
+
+
+def test_report_skips_warmup(load_test):
+    """Запросы прогрева не входят в задержки, ошибки считаются по типам"""
+    args = argparse.Namespace(
+        seed=1, requests=4, warmup=1, duration=30.0, rate=None, concurrency=2,
+        in_process=True, url=None, corpus=None
+    )
+    test = load_test.LoadTest(client=None, corpus=[{"query": "волны"}], args=args)
+    test.results = [
+        {"scheduled": 0.0, "end": 5.0, "warmup": True, "error": None, "latency_ms": 5000.0, "stages": {"search": 900.0}},
+        {"scheduled": 1.0, "end": 1.1, "warmup": False, "error": None, "latency_ms": 100.0, "stages": {"search": 10.0}},
+        {"scheduled": 1.5, "end": 1.8, "warmup": False, "error": None, "latency_ms": 300.0, "stages": {"search": 30.0}},
+        {"scheduled": 2.0, "end": 2.0, "warmup": False, "error": "HTTP 503", "latency_ms": 1.0, "stages": {}},
+    ]
+    
+    report = test.report(measure_from=1.0)
+    assert report["requests"] == 3 and report["warmup_requests"] == 1
+    assert report["errors"] == 1 and report["error_types"] == {"HTTP 503": 1}
+    assert report["latency_ms"]["p50"] == 200.0 and report["latency_ms"]["max"] == 300.0
+    assert report["stages_ms"]["search"]["count"] == 2
+    assert report["throughput_rps"] == pytest.approx(2 / 1.0)
+    assert report["config"]["mode"] == "closed"
@@ -0,0 +1,115 @@
+﻿"""
+Тесты логирования: запись через очередь и фоновый поток, JSON Lines,
+прореживание шумных логгеров.
+"""
+import json
+import logging
+import os
+import threading
+
+import pytest
+
+
+@pytest.fixture
+def root_logger():
+    """Корневой логгер возвращается к прежнему уровню, очередь останавливается"""
+    from src.utils.logging_config import shutdown_logging
+    root = logging.getLogger()
+    level = root.level
+    yield root
+    shutdown_logging()
+    root.setLevel(level)
+
+
+def _read_json_lines(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_records_formatted_in_listener_thread(root_logger, tmp_path, sokrat_settings, monkeypatch):
+    """
+    Аргументы подставляются при вызове, форматтер работает в потоке
+    QueueListener, запись пишется в файл {pid} в JSON
+    """
+    from src.utils import logging_config
+    
+    format_threads = []
+    json_format = logging_config.JsonFormatter.format
+    
+    def recording_format(self, record):
+        format_threads.append(threading.current_thread().name)
+        return json_format(self, record)
+    
+    monkeypatch.setattr(logging_config.JsonFormatter, "format", recording_format)
+    log_file = str(tmp_path / "logs" / "sokrat-{pid}.log")
+    logging_config.configure_logging(level="INFO", log_file=log_file, json_format=True)
+    # Повторная настройка заменяет прежнюю, а не добавляет второй обработчик
+    logging_config.configure_logging(level="INFO", log_file=log_file, json_format=True)
+    assert sum(isinstance(h, logging.handlers.QueueHandler) for h in root_logger.handlers) == 1
+    
+    # Обработчики pytest форматируют запись сразу - на время записи убираем их
+    captured = [h for h in root_logger.handlers if h is not logging_config._queue_handler]
+    for handler in captured:
+        root_logger.removeHandler(handler)
+    sources = ["a"]
+    logger = logging.getLogger("sokrat.test")
+    try:
+        logger.info("Найдено %s", sources)
+        # Изменение после вызова не попадает в запись
+        sources.append("b")
+        try:
+            raise ValueError("сбой")
+        except ValueError:
+            logger.exception("Ошибка")
+        logging_config.shutdown_logging()
+    finally:
+        for handler in captured:
+            root_logger.addHandler(handler)
+    
+    assert format_threads and threading.current_thread().name not in format_threads
+    entries = _read_json_lines(tmp_path / "logs" / f"sokrat-{os.getpid()}.log")
+    assert [(e["level"], e["logger"], e["message"]) for e in entries] == [
+        ("INFO", "sokrat.test", "Найдено ['a']"),
+        ("ERROR", "sokrat.test", "Ошибка"),
+    ]
+    assert entries[0]["pid"] == os.getpid()
+    assert "ValueError: сбой" in entries[1]["exc_info"]
+
+
+def test_sampling_thins_noisy_loggers(root_logger, tmp_path, sokrat_settings, monkeypatch):
+    """Записи ниже WARNING шумных логгеров прореживаются, предупреждения проходят все"""
+    from src.utils import logging_config
+    
+    monkeypatch.setattr(sokrat_settings, "log_sampling", {"noisy": 0.25, "muted": 0})
+    log_file = tmp_path / "sokrat.log"
+    logging_config.configure_logging(level="DEBUG", log_file=str(log_file), json_format=True)
+    
+    for i in range(8):
+        logging.getLogger("noisy.child").info("шум %d", i)
+        logging.getLogger("muted").debug("тишина %d", i)
+        logging.getLogger("quiet").info("важное %d", i)
+    logging.getLogger("muted").warning("предупреждение")
+    logging_config.shutdown_logging()
+    
+    messages = [e["message"] for e in _read_json_lines(log_file)]
+    assert [m for m in messages if m.startswith("шум")] == ["шум 0", "шум 4"]
+    assert not [m for m in messages if m.startswith("тишина")]
+    assert len([m for m in messages if m.startswith("важное")]) == 8
+    assert "предупреждение" in messages
+
+
+def test_sampling_filter_rates():
+    """Доля задаётся для логгера и его потомков; ближайший предок важнее"""
+    from src.utils.logging_config import SamplingFilter
+    
+    sampling = SamplingFilter({"httpx": 0.5, "httpx.pool": 1.0})
+    
+    def kept(name, level=logging.INFO, n=4):
+        record = logging.LogRecord(name, level, __file__, 0, "сообщение", None, None)
+        return sum(sampling.filter(record) for _ in range(n))
+    
+    assert kept("httpx") == 2
+    assert kept("httpx.client") == 2
+    assert kept("httpx.pool.conn") == 4
+    assert kept("httpx", level=logging.WARNING) == 4
+    assert kept("httpxx") == 4
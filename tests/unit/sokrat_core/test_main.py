@@ -0,0 +1,72 @@
+﻿"""
+Тесты приложения: create_app и lifespan (запуск и остановка состояния воркера).
+"""
+import asyncio
+
+import httpx
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_lifespan_starts_and_closes_worker_state(sokrat_db, monkeypatch):
+    """Lifespan поднимает писателя, задачи и архивацию и закрывает всё при остановке"""
+    from src.core import llm, parser
+    from src.db import database, retention, writer
+    from src.main import create_app
+    
+    archived = asyncio.Event()
+    
+    async def archive_old_data():
+        archived.set()
+    
+    monkeypatch.setattr(retention, "archive_old_data", archive_old_data)
+    monkeypatch.setattr(sokrat_db, "retention_interval_hours", 1.0)
+    
+    app = create_app()
+    # Создание приложения ничего не запускает
+    assert not hasattr(app.state, "jobs")
+    
+    async with app.router.lifespan_context(app):
+        db_writer = writer.get_writer()
+        assert db_writer.running
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://sokrat") as client:
+            assert (await client.get("/health")).json() == {"status": "healthy"}
+            response = await client.get("/metrics")
+            assert response.status_code == 200
+            assert "sokrat_db_write_queue_depth 0" in response.text
+            assert "total;dur=" in response.headers["server-timing"]
+            
+            job_id = (await client.post("/jobs", json={"query": "волновая энергетика"})).json()["job_id"]
+            for _ in range(200):
+                job = (await client.get(f"/jobs/{job_id}")).json()
+                if job["status"] in ("completed", "failed"):
+                    break
+                await asyncio.sleep(0.05)
+            assert job["status"] == "completed", job
+        
+        await asyncio.wait_for(archived.wait(), 5)
+        llm.get_llm_client()
+        assert llm._clients
+        http_client = parser.get_http_client()
+        assert parser.get_http_client() is http_client
+    
+    assert not db_writer.running
+    assert database._engine is None
+    assert not llm._clients
+    assert not parser._clients
+    assert http_client.is_closed
+
+
+def test_module_app_is_built_lazily(monkeypatch):
+    """src.main:app для старой команды запуска собирается при первом обращении"""
+    from fastapi import FastAPI
+    from src import main
+    
+    monkeypatch.setattr(main, "_app", None)
+    assert "app" not in vars(main)
+    app = main.app
+    assert isinstance(app, FastAPI)
+    assert main.app is app
+    with pytest.raises(AttributeError):
+        main.missing
@@ -0,0 +1,86 @@
+﻿"""
+Тесты метрик: корзины гистограммы, текстовый формат Prometheus,
+время этапов запроса для Server-Timing.
+"""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+
+def test_histogram_buckets_are_cumulative():
+    """Значение попадает в первую корзину с le >= значения, вывод накопительный"""
+    from src.utils.metrics import Histogram, Registry
+    
+    registry = Registry()
+    histogram = Histogram("t_seconds", "Тест", ["stage"], registry=registry, buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.labels(stage="search").observe(value)
+    
+    assert histogram.samples() == [
+        't_seconds_bucket{stage="search",le="0.1"} 2',
+        't_seconds_bucket{stage="search",le="1"} 3',
+        't_seconds_bucket{stage="search",le="+Inf"} 4',
+        't_seconds_sum{stage="search"} 3.65',
+        't_seconds_count{stage="search"} 4',
+    ]
+
+
+def test_exposition_format():
+    """HELP и TYPE на метрику, экранирование меток, Gauge-функция с ошибкой - NaN"""
+    from src.utils.metrics import Counter, Gauge, Registry
+    
+    registry = Registry()
+    counter = Counter("t_total", "Строка 1\nстрока 2", ["route"], registry=registry)
+    counter.labels(route='/a"b\\').inc(2)
+    gauge = Gauge("t_depth", "Глубина", registry=registry)
+    gauge.set_function(lambda: 1 / 0)
+    
+    assert registry.render() == (
+        "# HELP t_total Строка 1\\nстрока 2\n"
+        "# TYPE t_total counter\n"
+        't_total{route="/a\\"b\\\\"} 2\n'
+        "# HELP t_depth Глубина\n"
+        "# TYPE t_depth gauge\n"
+        "t_depth NaN\n"
+    )
+    with pytest.raises(ValueError):
+        counter.inc(-1)
+    with pytest.raises(ValueError):
+        Counter("t_total", "Повтор", registry=registry)
+
+
+@pytest.mark.asyncio
+async def test_stage_exporter_collects_request_timings():
+    """Спаны этапов попадают в гистограмму, ошибки - в счётчик, время - в Server-Timing запроса"""
+    from src.utils import metrics
+    
+    def span(name, ms, status="ok"):
+        return SimpleNamespace(name=name, start_ns=0, end_ns=int(ms * 1e6), status=status)
+    
+    exporter = metrics.StageMetricsExporter()
+    errors_before = metrics.STAGE_ERRORS.labels(stage="t.fetch", status="error").value
+    
+    async def export(s):
+        exporter.export(s)
+    
+    async def request():
+        timings = metrics.collect_request_timings()
+        # Задачи и потоки запроса копируют контекст и пишут в тот же словарь
+        await asyncio.gather(
+            asyncio.to_thread(exporter.export, span("t.fetch", 10)),
+            asyncio.create_task(export(span("t.fetch", 5, status="error"))),
+        )
+        exporter.export(span("t.search", 2.5))
+        return timings
+    
+    # Отдельная задача - свой контекст, как у запроса
+    timings = await asyncio.create_task(request())
+    assert timings == {"t.fetch": pytest.approx(15.0), "t.search": pytest.approx(2.5)}
+    assert metrics.server_timing_header(timings, 20) == "t.fetch;dur=15.0, t.search;dur=2.5, total;dur=20.0"
+    assert metrics.STAGE_DURATION.labels(stage="t.fetch").count == 2
+    assert metrics.STAGE_ERRORS.labels(stage="t.fetch", status="error").value == errors_before + 1
+    
+    # Вне запроса время не копится
+    exporter.export(span("t.search", 1))
+    assert timings["t.search"] == pytest.approx(2.5)
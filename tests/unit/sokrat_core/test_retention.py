@@ -0,0 +1,150 @@
+﻿"""
+Тесты ретеншна: архивация, удаление, восстановление, incremental vacuum
+и захват фоновой архивации одним процессом.
+"""
+import asyncio
+import gzip
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+
+async def _seed(query_id: str, age_days: int, html_size: int = 100):
+    """Запрос с источником, документом (в FTS-индексе) и вызовом модели"""
+    from src.db import fts
+    from src.db.models import Query, Source, Document, ModelCall
+    from src.db.writer import get_writer
+    
+    created = datetime.utcnow() - timedelta(days=age_days)
+    
+    async def op(session):
+        session.add(Query(id=query_id, query_text=f"запрос {query_id}", timestamp=created, status="completed"))
+        session.add(Source(id=f"{query_id}-s", query_id=query_id, url=f"https://example.com/{query_id}", title="Волны", created_at=created))
+        session.add(Document(
+            id=f"{query_id}-d", source_id=f"{query_id}-s", cleaned_text=f"Волновая энергетика {query_id}",
+            raw_html="x" * html_size, word_count=3, created_at=created
+        ))
+        session.add(ModelCall(id=f"{query_id}-m", query_id=query_id, model_name="stub", status="success", created_at=created))
+        await session.flush()
+        await fts.index_document(session, f"{query_id}-d", "Волны", f"Волновая энергетика {query_id}")
+    
+    await get_writer().submit(op)
+
+
+async def _count(sql: str) -> int:
+    from sqlalchemy import text
+    from src.db.database import get_engine
+    
+    async with get_engine().connect() as conn:
+        return (await conn.execute(text(sql))).scalar()
+
+
+@pytest.mark.asyncio
+async def test_archive_and_restore(sokrat_db, tmp_path):
+    """Старые запросы уходят в архив по датам и удаляются, восстановление их возвращает"""
+    from src.db import retention
+    
+    for i in range(3):
+        await _seed(f"old{i}", age_days=100 + i)
+    await _seed("new", age_days=1)
+    
+    stats = await retention.archive_old_data(days=90, batch_size=2)
+    assert stats == {"queries": 3, "sources": 3, "documents": 3, "model_calls": 3}
+    assert await _count("SELECT COUNT(*) FROM queries") == 1
+    assert await _count("SELECT COUNT(*) FROM documents") == 1
+    assert await _count("SELECT COUNT(*) FROM model_calls") == 1
+    assert await _count("SELECT COUNT(*) FROM document_chunks") == 1
+    
+    archive = tmp_path / "archive"
+    partitions = sorted(path.name for path in archive.glob("date=*"))
+    assert len(partitions) == 3
+    day = (datetime.utcnow() - timedelta(days=100)).date().isoformat()
+    with gzip.open(archive / f"date={day}" / "documents.jsonl.gz", "rt", encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f]
+    assert [row["id"] for row in rows] == ["old0-d"]
+    
+    stats = await retention.restore_archive()
+    assert stats == {"queries": 3, "sources": 3, "documents": 3, "model_calls": 3}
+    assert await _count("SELECT COUNT(*) FROM queries") == 4
+    # Восстановленные документы снова в индексе
+    assert await _count("SELECT COUNT(*) FROM document_chunks") == 4
+    
+    # Повторное восстановление ничего не дублирует
+    stats = await retention.restore_archive()
+    assert stats["queries"] == 0
+    assert await _count("SELECT COUNT(*) FROM queries") == 4
+    assert await _count("SELECT COUNT(*) FROM document_chunks") == 4
+
+
+@pytest.mark.asyncio
+async def test_archive_vacuums_freed_pages(sokrat_db):
+    """После удаления incremental vacuum возвращает свободные страницы"""
+    from src.db import retention
+    
+    assert await _count("PRAGMA auto_vacuum") == 2
+    for i in range(5):
+        await _seed(f"old{i}", age_days=100, html_size=200_000)
+    pages_before = await _count("PRAGMA page_count")
+    
+    await retention.archive_old_data(days=90)
+    
+    assert await _count("PRAGMA freelist_count") == 0
+    assert await _count("PRAGMA page_count") < pages_before / 2
+
+
+@pytest.mark.asyncio
+async def test_lease_is_exclusive(sokrat_db):
+    """Захват берёт один владелец; чужой истёкший захват перехватывается"""
+    from src.db import crud
+    from src.db.models import Lease
+    from src.db.writer import get_writer
+    from sqlalchemy import update
+    
+    claims = await asyncio.gather(*(crud.acquire_lease("retention", f"owner-{i}", 60) for i in range(5)))
+    assert claims.count(True) == 1
+    holder = f"owner-{claims.index(True)}"
+    other = "owner-4" if holder != "owner-4" else "owner-0"
+    # Владелец продлевает свой захват
+    assert await crud.acquire_lease("retention", holder, 60)
+    assert not await crud.acquire_lease("retention", other, 60)
+    
+    async def expire(session):
+        await session.execute(update(Lease).values(lease_until=datetime.utcnow() - timedelta(seconds=1)))
+    
+    await get_writer().submit(expire)
+    assert await crud.acquire_lease("retention", other, 60)
+    await crud.release_lease("retention", holder)  # уже не его - ничего не меняет
+    assert not await crud.acquire_lease("retention", holder, 60)
+    await crud.release_lease("retention", other)
+    assert await crud.acquire_lease("retention", holder, 60)
+
+
+@pytest.mark.asyncio
+async def test_retention_loop_runs_in_one_process(sokrat_db, monkeypatch):
+    """Из нескольких циклов архивации работает один; после его остановки - другой"""
+    from src.db import retention
+    
+    runs = []
+    
+    async def archive_old_data():
+        runs.append(asyncio.current_task().get_name())
+    
+    monkeypatch.setattr(retention, "archive_old_data", archive_old_data)
+    interval_hours = 0.05 / 3600
+    loops = [asyncio.create_task(retention.retention_loop(interval_hours), name=f"loop-{i}") for i in range(3)]
+    await asyncio.sleep(0.3)
+    assert len(set(runs)) == 1 and len(runs) > 1
+    leader = runs[0]
+    
+    for loop in loops:
+        if loop.get_name() == leader:
+            loop.cancel()
+            await asyncio.gather(loop, return_exceptions=True)
+    runs.clear()
+    await asyncio.sleep(0.3)
+    for loop in loops:
+        loop.cancel()
+    await asyncio.gather(*loops, return_exceptions=True)
+    
+    assert runs and leader not in runs and len(set(runs)) == 1
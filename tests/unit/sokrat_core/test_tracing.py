@@ -0,0 +1,37 @@
+﻿"""
+Тесты трассировки: запись спанов в файл OTLP/JSON фоновым потоком.
+"""
+import json
+import threading
+
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_otlp_file_exporter_writes_off_event_loop(tmp_path, monkeypatch):
+    """Пачка пишется не в потоке event loop, flush() дожидается записи"""
+    from src.utils.tracing import OTLPFileExporter, Tracer
+    
+    exporter = OTLPFileExporter(str(tmp_path / "traces" / "spans.jsonl"), batch_size=2)
+    write = exporter._write
+    threads = []
+    
+    def recording_write(spans):
+        threads.append(threading.current_thread())
+        write(spans)
+    
+    monkeypatch.setattr(exporter, "_write", recording_write)
+    tracer = Tracer([exporter])
+    for name in ("search", "analyze", "report"):
+        with tracer.span(name, query="q"):
+            pass
+    tracer.flush()
+    
+    assert threads and threading.main_thread() not in threads
+    lines = (tmp_path / "traces" / "spans.jsonl").read_text(encoding="utf-8").splitlines()
+    spans = [
+        span["name"]
+        for line in lines
+        for span in json.loads(line)["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    ]
+    assert spans == ["search", "analyze", "report"]
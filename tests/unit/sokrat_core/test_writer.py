@@ -0,0 +1,28 @@
+﻿"""
+Тесты единственного писателя БД.
+"""
+import asyncio
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+
+@pytest.mark.asyncio
+async def test_writer_failure_settles_callers():
+    """Если писатель не смог открыть БД, вызывающие получают ошибку, а не зависают"""
+    from src.db.writer import DatabaseWriter
+    
+    engine = create_async_engine("sqlite+aiosqlite:////proc/nonexistent/sokrat.db")
+    writer = DatabaseWriter(engine)
+    
+    async def op(session):
+        await session.execute(text("CREATE TABLE t (x)"))
+    
+    try:
+        for _ in range(2):
+            with pytest.raises(Exception):
+                await asyncio.wait_for(writer.submit(op), timeout=5)
+            assert not writer.running
+    finally:
+        await engine.dispose()